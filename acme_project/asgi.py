@@ -14,3 +14,23 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'acme_project.settings')
 
 application = get_asgi_application()
+
+# Imported after Django is set up
+from products.streaming import STREAM_PATH as PROGRESS_STREAM_PATH, progress_stream_app  # noqa: E402
+from webhooks.streaming import STREAM_PATH as WEBHOOK_STREAM_PATH, webhook_stream_app  # noqa: E402
+
+
+async def stream_application(scope, receive, send):
+    # Run by the ``stream`` process in fly.toml. It serves nothing but the
+    # long-lived webhook tester and bulk operation progress streams, from
+    # native async apps sharing one Redis subscriber per process. Ordinary
+    # pages stay on the gevent WSGI workers, where sync views and file
+    # downloads don't share one thread.
+    if scope['type'] != 'http':
+        raise ValueError(f"The stream server can only handle HTTP connections, not {scope['type']}.")
+    if WEBHOOK_STREAM_PATH.match(scope['path']):
+        return await webhook_stream_app(scope, receive, send)
+    if PROGRESS_STREAM_PATH.match(scope['path']):
+        return await progress_stream_app(scope, receive, send)
+    await send({'type': 'http.response.start', 'status': 404, 'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': b''})
@@ -0,0 +1,112 @@
+"""Fan-out of Redis pub/sub messages to many asyncio consumers.
+
+Each ASGI worker process holds one Redis connection subscribed to every
+channel that at least one client is listening on. Messages are copied into
+a bounded queue per client, so thousands of streams cost one connection
+instead of one each.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+
+import redis.asyncio as aioredis
+from django.conf import settings
+
+from .redis_pool import connection_kwargs
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, channel, max_queued):
+        self.channel = channel
+        self.queue = asyncio.Queue(maxsize=max_queued)
+        # Set when the client fell too far behind and messages were dropped;
+        # its stream should be closed so the browser reconnects
+        self.overflowed = False
+
+    def deliver(self, data):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            # Wake the consumer so it notices right away
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class Broadcaster:
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        self.redis = None
+        self.pubsub = None
+        self.reader = None
+        self.lock = asyncio.Lock()
+
+    async def subscribe(self, channel):
+        subscription = Subscription(channel, settings.STREAM_CLIENT_QUEUE_SIZE)
+        async with self.lock:
+            if self.pubsub is None:
+                self.redis = aioredis.from_url(settings.REDIS_URL, **connection_kwargs())
+                self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            if not self.subscriptions[channel]:
+                await self.pubsub.subscribe(channel)
+            self.subscriptions[channel].add(subscription)
+            if self.reader is None or self.reader.done():
+                self.reader = asyncio.create_task(self._read())
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        async with self.lock:
+            listeners = self.subscriptions.get(subscription.channel)
+            if listeners is None:
+                return
+            listeners.discard(subscription)
+            if not listeners:
+                del self.subscriptions[subscription.channel]
+                try:
+                    await self.pubsub.unsubscribe(subscription.channel)
+                except aioredis.RedisError as e:
+                    logger.warning(f"Failed to unsubscribe from {subscription.channel}: {e}")
+
+    async def _read(self):
+        while self.subscriptions:
+            try:
+                message = await self.pubsub.get_message(timeout=1.0)
+            except aioredis.RedisError as e:
+                logger.error(f"Redis subscriber failed, reconnecting: {e}")
+                await asyncio.sleep(1)
+                await self._resubscribe()
+                continue
+            if message is None or message['type'] != 'message':
+                continue
+            channel = message['channel'].decode('utf-8')
+            data = message['data'].decode('utf-8')
+            for subscription in list(self.subscriptions.get(channel, ())):
+                subscription.deliver(data)
+
+    async def _resubscribe(self):
+        async with self.lock:
+            try:
+                await self.pubsub.aclose()
+            except aioredis.RedisError:
+                pass
+            self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                if self.subscriptions:
+                    await self.pubsub.subscribe(*self.subscriptions)
+            except aioredis.RedisError as e:
+                logger.error(f"Failed to resubscribe: {e}")
+
+
+_broadcasters = {}
+
+
+def get_broadcaster():
+    """Return the broadcaster for the running event loop (one per ASGI worker process)."""
+    loop = asyncio.get_running_loop()
+    if loop not in _broadcasters:
+        _broadcasters[loop] = Broadcaster()
+    return _broadcasters[loop]
@@ -0,0 +1,6 @@
+from django.conf import settings
+
+
+def stream_origin(request):
+    """Where pages open Server-Sent Events streams (see STREAM_ORIGIN)."""
+    return {'stream_origin': settings.STREAM_ORIGIN}
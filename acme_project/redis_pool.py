@@ -0,0 +1,26 @@
+import ssl
+import threading
+
+import redis
+from django.conf import settings
+
+_lock = threading.Lock()
+_client = None
+
+
+def connection_kwargs():
+    if settings.REDIS_URL.startswith('rediss://'):
+        # Matches the broker's SSL settings
+        return {'ssl_cert_reqs': ssl.CERT_NONE}
+    return {}
+
+
+def get_redis():
+    """Return a process-wide Redis client for REDIS_URL, backed by a shared connection pool."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = redis.Redis(
+                connection_pool=redis.ConnectionPool.from_url(settings.REDIS_URL, **connection_kwargs())
+            )
+        return _client
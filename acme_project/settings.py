@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 import os
 import dj_database_url
+from kombu import Queue
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'products',
     'webhooks',
 ]
@@ -74,6 +76,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'acme_project.context_processors.stream_origin',
             ],
         },
     },
@@ -101,6 +104,141 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Task routing: long-running bulk operations, outbound webhooks and everything
+# else get their own queues (and fly.toml process groups), so a large import
+# never sits in front of webhook deliveries. Within a queue, lower priority
+# numbers are consumed first.
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_QUEUES = (
+    Queue('default', routing_key='default'),
+    Queue('bulk', routing_key='bulk'),
+    Queue('webhooks', routing_key='webhooks'),
+)
+CELERY_TASK_ROUTES = {
+    # Finishing an import is quick and the user is waiting on it
+    'products.tasks.finish_csv_import': {'queue': 'bulk', 'priority': 0},
+    'products.tasks.process_csv_import': {'queue': 'bulk', 'priority': 3},
+    'products.tasks.delete_all_products': {'queue': 'bulk', 'priority': 3},
+    'products.tasks.export_products': {'queue': 'bulk', 'priority': 3},
+    'products.tasks.import_csv_shard': {'queue': 'bulk', 'priority': 5},
+    'webhooks.tasks.send_webhook_notification': {'queue': 'webhooks', 'priority': 0},
+    'webhooks.tasks.flush_webhook_batch': {'queue': 'webhooks', 'priority': 0},
+    'webhooks.tasks.flush_webhook_requests': {'queue': 'webhooks', 'priority': 0},
+    'webhooks.tasks.retry_webhook_deliveries': {'queue': 'webhooks', 'priority': 6},
+    'webhooks.tasks.prune_webhook_requests': {'queue': 'webhooks', 'priority': 9},
+}
+CELERY_TASK_DEFAULT_PRIORITY = 3
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    # Redis emulates priorities with one list per priority level
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+    # acks_late tasks that stay unacknowledged longer than this are
+    # redelivered, so it must exceed the longest bulk operation
+    'visibility_timeout': 12 * 60 * 60,
+}
+
+# CSV imports with a body larger than PRODUCT_IMPORT_SHARD_BYTES are split into
+# byte-range shards that run in parallel on the worker pool.
+PRODUCT_IMPORT_SHARD_BYTES = int(os.environ.get('PRODUCT_IMPORT_SHARD_BYTES', 64 * 1024 * 1024))
+PRODUCT_IMPORT_MAX_SHARDS = int(os.environ.get('PRODUCT_IMPORT_MAX_SHARDS', 8))
+# Running imports bump BulkOperation.updated_at at least this often, also
+# while they index SKUs; running imports that miss heartbeats for
+# PRODUCT_IMPORT_STALE_SECONDS are resumed from their last checkpoint by the
+# resume_stale_imports periodic task.
+PRODUCT_IMPORT_HEARTBEAT_SECONDS = int(os.environ.get('PRODUCT_IMPORT_HEARTBEAT_SECONDS', 60))
+PRODUCT_IMPORT_STALE_SECONDS = int(os.environ.get('PRODUCT_IMPORT_STALE_SECONDS', 600))
+# Memory bounds for the import-wide SKU dedup index (products.dedup.SkuIndex)
+PRODUCT_IMPORT_DEDUP_BLOOM_BYTES = int(os.environ.get('PRODUCT_IMPORT_DEDUP_BLOOM_BYTES', 64 * 1024 * 1024))
+PRODUCT_IMPORT_DEDUP_MAX_CANDIDATES = int(os.environ.get('PRODUCT_IMPORT_DEDUP_MAX_CANDIDATES', 500000))
+# Imports are failed once more than this many rows have been rejected by
+# validation (products.validation); 0 fails on the first invalid row
+PRODUCT_IMPORT_ERROR_BUDGET = int(os.environ.get('PRODUCT_IMPORT_ERROR_BUDGET', 1000))
+# Chunked uploads (products.uploads): largest file accepted, target part size
+# (raised for very large files to stay within S3's 10,000 parts), lifetime of
+# presigned part URLs, and how long an unfinished upload is kept before it is
+# aborted
+PRODUCT_UPLOAD_MAX_SIZE = int(os.environ.get('PRODUCT_UPLOAD_MAX_SIZE', 10 * 1024 * 1024 * 1024))
+PRODUCT_UPLOAD_PART_SIZE = int(os.environ.get('PRODUCT_UPLOAD_PART_SIZE', 16 * 1024 * 1024))
+PRODUCT_UPLOAD_URL_EXPIRY = int(os.environ.get('PRODUCT_UPLOAD_URL_EXPIRY', 3600))
+PRODUCT_UPLOAD_EXPIRY_SECONDS = int(os.environ.get('PRODUCT_UPLOAD_EXPIRY_SECONDS', 24 * 60 * 60))
+# Products deleted by each DELETE statement of a bulk delete
+PRODUCT_DELETE_WINDOW_SIZE = int(os.environ.get('PRODUCT_DELETE_WINDOW_SIZE', 10000))
+# Largest number of items accepted by one products API batch request
+PRODUCT_API_MAX_BATCH_SIZE = int(os.environ.get('PRODUCT_API_MAX_BATCH_SIZE', 1000))
+# Minimum seconds between a worker's progress updates for one bulk operation
+BULK_PROGRESS_INTERVAL = float(os.environ.get('BULK_PROGRESS_INTERVAL', 0.5))
+# Progress streams a user may have open at once; each holds a Redis
+# connection. Further ones are refused and the page polls instead.
+BULK_PROGRESS_MAX_STREAMS = int(os.environ.get('BULK_PROGRESS_MAX_STREAMS', 5))
+
+# Webhook delivery (webhooks.delivery): threads per worker process, concurrent
+# requests (and pooled connections) per receiving host, and request timeout.
+WEBHOOK_DELIVERY_THREADS = int(os.environ.get('WEBHOOK_DELIVERY_THREADS', 16))
+WEBHOOK_MAX_CONNECTIONS_PER_HOST = int(os.environ.get('WEBHOOK_MAX_CONNECTIONS_PER_HOST', 4))
+WEBHOOK_TIMEOUT = float(os.environ.get('WEBHOOK_TIMEOUT', 5))
+# Failed deliveries are retried with exponential backoff and full jitter,
+# starting at WEBHOOK_RETRY_BASE_SECONDS, and dead-lettered after
+# WEBHOOK_MAX_ATTEMPTS attempts.
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 8))
+WEBHOOK_RETRY_BASE_SECONDS = int(os.environ.get('WEBHOOK_RETRY_BASE_SECONDS', 30))
+WEBHOOK_RETRY_MAX_SECONDS = int(os.environ.get('WEBHOOK_RETRY_MAX_SECONDS', 3600))
+WEBHOOK_RETRY_BATCH_SIZE = int(os.environ.get('WEBHOOK_RETRY_BATCH_SIZE', 500))
+# Per-host circuit breaker (webhooks.circuit): this many failures within the
+# window open the circuit for the cooldown, after which one probe is let through.
+WEBHOOK_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('WEBHOOK_CIRCUIT_FAILURE_THRESHOLD', 5))
+WEBHOOK_CIRCUIT_FAILURE_WINDOW = int(os.environ.get('WEBHOOK_CIRCUIT_FAILURE_WINDOW', 60))
+WEBHOOK_CIRCUIT_COOLDOWN_SECONDS = int(os.environ.get('WEBHOOK_CIRCUIT_COOLDOWN_SECONDS', 30))
+# Rate-limited deliveries wait in the worker for at most this many seconds;
+# longer waits are deferred to the retry task.
+WEBHOOK_RATE_LIMIT_MAX_WAIT = float(os.environ.get('WEBHOOK_RATE_LIMIT_MAX_WAIT', 1))
+
+# Webhook tester receiver: buffer inbound requests in Redis and insert them in
+# batches of WEBHOOK_REQUEST_FLUSH_SIZE, at most WEBHOOK_REQUEST_FLUSH_SECONDS
+# after they arrive. Set WEBHOOK_RECEIVER_WRITE_BEHIND=False to save each
+# request synchronously instead.
+WEBHOOK_RECEIVER_WRITE_BEHIND = os.environ.get('WEBHOOK_RECEIVER_WRITE_BEHIND', 'True') == 'True'
+WEBHOOK_REQUEST_FLUSH_SIZE = int(os.environ.get('WEBHOOK_REQUEST_FLUSH_SIZE', 500))
+WEBHOOK_REQUEST_FLUSH_SECONDS = int(os.environ.get('WEBHOOK_REQUEST_FLUSH_SECONDS', 1))
+# Default retention for tester requests (endpoints may override both), and
+# how many rows prune_webhook_requests deletes per statement
+WEBHOOK_REQUEST_MAX_ROWS = int(os.environ.get('WEBHOOK_REQUEST_MAX_ROWS', 1000))
+WEBHOOK_REQUEST_MAX_AGE_DAYS = int(os.environ.get('WEBHOOK_REQUEST_MAX_AGE_DAYS', 7))
+WEBHOOK_REQUEST_PRUNE_BATCH_SIZE = int(os.environ.get('WEBHOOK_REQUEST_PRUNE_BATCH_SIZE', 1000))
+# Requests shown on the tester page; newer ones are streamed in
+WEBHOOK_REQUEST_DISPLAY_LIMIT = 50
+
+# Async SSE streams (acme_project.sse): messages
+# buffered per client before a slow client is disconnected, and the interval
+# between keepalive comments.
+STREAM_CLIENT_QUEUE_SIZE = int(os.environ.get('STREAM_CLIENT_QUEUE_SIZE', 100))
+STREAM_HEARTBEAT_SECONDS = int(os.environ.get('STREAM_HEARTBEAT_SECONDS', 15))
+# Origin of the process serving webhook tester and progress streams
+# (``stream`` in fly.toml), e.g. https://acme-project.fly.dev:8443. Empty
+# serves them from this process with WebhookStreamView and
+# ProgressStreamView, as under runserver. Pages from CSRF_TRUSTED_ORIGINS may
+# open them cross-origin.
+STREAM_ORIGIN = os.environ.get('STREAM_ORIGIN', '')
+
+CELERY_BEAT_SCHEDULE = {
+    'resume-stale-imports': {
+        'task': 'products.tasks.resume_stale_imports',
+        'schedule': 300.0,
+    },
+    'expire-upload-sessions': {
+        'task': 'products.tasks.expire_upload_sessions',
+        'schedule': 3600.0,
+    },
+    'retry-webhook-deliveries': {
+        'task': 'webhooks.tasks.retry_webhook_deliveries',
+        'schedule': 30.0,
+    },
+    'prune-webhook-requests': {
+        'task': 'webhooks.tasks.prune_webhook_requests',
+        'schedule': 3600.0,
+    },
+}
+
 import ssl
 
 # ...
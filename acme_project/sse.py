@@ -0,0 +1,107 @@
+"""Building blocks for the async Server-Sent Events apps run by ``stream_application`` (``acme_project/asgi.py``).
+
+Django 4.2 streaming responses cannot notice when the client goes away, so
+these apps watch ``receive`` for the disconnect themselves. Messages come
+from the process-wide ``Broadcaster``, so a stream costs a queue, not a Redis
+connection.
+"""
+import asyncio
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.auth import get_user
+
+from .broadcast import get_broadcaster
+
+
+def session_user(scope):
+    """Return the user logged in with the request's session cookie, or ``AnonymousUser``. Synchronous."""
+    cookies = SimpleCookie()
+    for name, value in scope['headers']:
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    engine = import_module(settings.SESSION_ENGINE)
+    # get_user() only needs request.session, and also checks the session's
+    # auth hash, so logged-out or password-changed sessions are rejected
+    session = engine.SessionStore(session_key.value if session_key else None)
+    return get_user(SimpleNamespace(session=session))
+
+
+def cors_headers(scope):
+    """Let our own pages, on another port, open the stream with the session cookie."""
+    origin = dict(scope['headers']).get(b'origin', b'').decode('latin-1')
+    if origin not in settings.CSRF_TRUSTED_ORIGINS:
+        return []
+    return [
+        (b'access-control-allow-origin', origin.encode('latin-1')),
+        (b'access-control-allow-credentials', b'true'),
+        (b'vary', b'origin'),
+    ]
+
+
+async def send_status(send, status):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def stream(scope, receive, send, channel, first=None, last=None, idle=None):
+    """Send the messages published on ``channel`` as an event stream, until the client goes away.
+
+    ``first`` is awaited once subscribed, so nothing published in between is
+    lost, and returns a message to send before the published ones. The
+    stream ends after a message for which ``last`` returns true. ``idle`` is
+    awaited whenever a keepalive is sent.
+    """
+    broadcaster = get_broadcaster()
+    subscription = await broadcaster.subscribe(channel)
+
+    async def wait_for_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def send_message(data):
+        await send({'type': 'http.response.body', 'body': f'data: {data}\n\n'.encode('utf-8'), 'more_body': True})
+        return last is not None and last(data)
+
+    disconnected = asyncio.create_task(wait_for_disconnect())
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),  # Disable buffering in Nginx/Fly
+                *cors_headers(scope),
+            ],
+        })
+        finished = first is not None and await send_message(await first())
+        while not finished and not disconnected.done():
+            next_message = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait(
+                {next_message, disconnected},
+                timeout=settings.STREAM_HEARTBEAT_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if next_message not in done:
+                next_message.cancel()
+                if not done:
+                    if idle is not None:
+                        await idle()
+                    # SSE comment; keeps proxies from closing an idle stream
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                continue
+            data = next_message.result()
+            if subscription.overflowed:
+                # Too slow to keep up: end the stream, the browser reconnects
+                break
+            finished = await send_message(data)
+
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        await broadcaster.unsubscribe(subscription)
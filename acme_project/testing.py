@@ -0,0 +1,36 @@
+"""Helpers shared by the apps' test suites."""
+import shutil
+import tempfile
+
+import fakeredis
+from django.core.cache import cache
+from django.test import override_settings
+
+from . import redis_pool
+from .celery import app
+
+
+class ServicesTestMixin:
+    """Runs each test against an in-memory Redis, a local-memory cache, a
+    temporary MEDIA_ROOT and eager Celery tasks.
+    """
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(cache.clear)
+
+        self.redis = fakeredis.FakeRedis()
+        previous_client, redis_pool._client = redis_pool._client, self.redis
+        self.addCleanup(setattr, redis_pool, '_client', previous_client)
+
+        eager = app.conf.task_always_eager, app.conf.task_eager_propagates
+        app.conf.task_always_eager = app.conf.task_eager_propagates = True
+        self.addCleanup(lambda: app.conf.update(task_always_eager=eager[0], task_eager_propagates=eager[1]))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product
+from .models import ApiKey, Product
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -7,3 +7,14 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ('sku', 'name')
     list_filter = ('is_active', 'created_at')
     ordering = ('-created_at',)
+
+@admin.register(ApiKey)
+class ApiKeyAdmin(admin.ModelAdmin):
+    # Keys are created with the create_api_key command; here they can only be revoked
+    list_display = ('name', 'prefix', 'user', 'is_active', 'created_at', 'last_used_at')
+    list_filter = ('is_active',)
+    fields = ('user', 'name', 'is_active', 'prefix', 'created_at', 'last_used_at')
+    readonly_fields = ('user', 'prefix', 'created_at', 'last_used_at')
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,316 @@
+"""Versioned JSON API for products, mounted under ``/products/api/v1/``.
+
+Batch endpoints take ``{"items": [...]}`` (or ``{"skus": [...]}`` for delete)
+with at most PRODUCT_API_MAX_BATCH_SIZE entries. Each batch runs in a single
+transaction and answers with one result per item, in request order.
+Clients authenticate with an API key (``Authorization: Bearer <key>``, see
+``ApiKey``), which skips CSRF checks, or with the browser session, which
+doesn't.
+
+Webhooks are sent once per event type per batch, as ``product.batch_created``,
+``product.batch_updated`` and ``product.batch_deleted`` events whose payload
+lists the affected products under ``products``. The single-product
+``product.*`` events keep their ``{"sku", "name"}`` payload.
+"""
+import json
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import View
+
+from webhooks.subscriptions import enqueue_webhook_notification, is_subscribed
+from .models import ApiKey, Product
+from .pagination import decode_cursor, encode_cursor
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+# Don't write ApiKey.last_used_at on every request of a busy client
+API_KEY_TOUCH_INTERVAL = timedelta(minutes=1)
+
+
+def _authenticate_key(authorization):
+    scheme, _, key = authorization.partition(' ')
+    if scheme.lower() != 'bearer' or not key.strip():
+        raise ApiError('Authorization header must be "Bearer <api key>"', status=401)
+    try:
+        api_key = ApiKey.objects.select_related('user').get(
+            key_hash=ApiKey.hash_key(key.strip()), is_active=True, user__is_active=True
+        )
+    except ApiKey.DoesNotExist:
+        raise ApiError('Invalid API key', status=401)
+
+    now = timezone.now()
+    if api_key.last_used_at is None or now - api_key.last_used_at > API_KEY_TOUCH_INTERVAL:
+        ApiKey.objects.filter(pk=api_key.pk).update(last_used_at=now)
+    return api_key.user
+
+
+# CSRF is checked in dispatch instead, for session-authenticated requests only
+@method_decorator(csrf_exempt, name='dispatch')
+class ApiView(LoginRequiredMixin, View):
+    def handle_no_permission(self):
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            authorization = request.headers.get('Authorization')
+            if authorization:
+                request.user = _authenticate_key(authorization)
+            elif request.user.is_authenticated and CsrfViewMiddleware(lambda request: None).process_view(
+                request, None, (), {}
+            ):
+                raise ApiError('CSRF check failed; send the X-CSRFToken header or use an API key', status=403)
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+
+    def parse_batch(self, key):
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            raise ApiError('Request body must be JSON')
+
+        items = data.get(key) if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            raise ApiError(f'"{key}" must be a list')
+        if len(items) > settings.PRODUCT_API_MAX_BATCH_SIZE:
+            raise ApiError(f'At most {settings.PRODUCT_API_MAX_BATCH_SIZE} {key} per request')
+        return items
+
+
+def _serialize(product):
+    return {
+        'id': product.id,
+        'sku': product.sku,
+        'name': product.name,
+        'description': product.description,
+        'is_active': product.is_active,
+        'created_at': product.created_at.isoformat(),
+        'updated_at': product.updated_at.isoformat(),
+    }
+
+
+def _validate(item, partial):
+    """Return ``(fields, errors)`` for one batch item."""
+    if not isinstance(item, dict):
+        return {}, {'item': 'Must be an object'}
+
+    fields = {}
+    errors = {}
+    sku = item.get('sku')
+    if not isinstance(sku, str) or not sku.strip():
+        errors['sku'] = 'Required'
+    elif len(sku.strip()) > Product._meta.get_field('sku').max_length:
+        errors['sku'] = 'Too long'
+    else:
+        fields['sku'] = sku.strip()
+
+    if 'name' in item or not partial:
+        name = item.get('name')
+        if not isinstance(name, str) or not name.strip():
+            errors['name'] = 'Required'
+        elif len(name.strip()) > Product._meta.get_field('name').max_length:
+            errors['name'] = 'Too long'
+        else:
+            fields['name'] = name.strip()
+
+    if 'description' in item:
+        if not isinstance(item['description'], str):
+            errors['description'] = 'Must be a string'
+        else:
+            fields['description'] = item['description']
+
+    if 'is_active' in item:
+        if not isinstance(item['is_active'], bool):
+            errors['is_active'] = 'Must be a boolean'
+        else:
+            fields['is_active'] = item['is_active']
+
+    return fields, errors
+
+
+def _prepare(items, partial):
+    """Validate a batch. Returns per-item results plus the valid items by SKU."""
+    results = []
+    valid = {}
+    validated = [_validate(item, partial) for item in items]
+    sku_counts = Counter(fields.get('sku') for fields, errors in validated if not errors)
+
+    for fields, errors in validated:
+        if not errors and sku_counts[fields['sku']] > 1:
+            errors = {'sku': 'Duplicate SKU in batch'}
+        if errors:
+            results.append({'sku': fields.get('sku'), 'status': 'error', 'errors': errors})
+        else:
+            result = {'sku': fields['sku']}
+            results.append(result)
+            valid[fields['sku']] = (fields, result)
+    return results, valid
+
+
+def _notify(user_id, event_type, products):
+    # One notification per event type per batch, sent only once the batch commits
+    if products and is_subscribed(user_id, event_type):
+        payload = {'count': len(products), 'products': [{'sku': p.sku, 'name': p.name} for p in products]}
+        transaction.on_commit(lambda: enqueue_webhook_notification(user_id, event_type, payload))
+
+
+def _summary(results):
+    return dict(Counter(result['status'] for result in results))
+
+
+class ProductCollectionApiView(ApiView):
+    """``GET``: the user's products, newest first, keyset-paged with ``?after=<cursor>``.
+
+    Repeat ``?sku=`` to fetch specific products instead.
+    """
+
+    def get(self, request):
+        queryset = Product.objects.filter(user=request.user).defer('search_vector')
+
+        skus = request.GET.getlist('sku')
+        if skus:
+            if len(skus) > settings.PRODUCT_API_MAX_BATCH_SIZE:
+                raise ApiError(f'At most {settings.PRODUCT_API_MAX_BATCH_SIZE} skus per request')
+            products = {p.sku: p for p in queryset.filter(sku__in=skus)}
+            return JsonResponse({
+                'results': [_serialize(products[sku]) for sku in skus if sku in products],
+                'missing': [sku for sku in skus if sku not in products],
+            })
+
+        try:
+            limit = int(request.GET.get('limit', 100))
+        except ValueError:
+            raise ApiError('"limit" must be an integer')
+        limit = max(1, min(limit, settings.PRODUCT_API_MAX_BATCH_SIZE))
+
+        after = decode_cursor(request.GET.get('after'))
+        if after:
+            created_at, pk = after
+            queryset = (
+                queryset.filter(created_at__lte=created_at)
+                .filter(Q(created_at__lt=created_at) | Q(pk__lt=pk))
+            )
+        products = list(queryset.order_by('-created_at', '-pk')[:limit + 1])
+        next_cursor = encode_cursor(products[limit - 1]) if len(products) > limit else None
+        return JsonResponse({
+            'results': [_serialize(p) for p in products[:limit]],
+            'next_cursor': next_cursor,
+        })
+
+
+class ProductBatchUpsertApiView(ApiView):
+    """Create products, or update them when the SKU already exists. ``name`` is required."""
+
+    def post(self, request):
+        results, valid = _prepare(self.parse_batch('items'), partial=False)
+        created, updated = [], []
+
+        with transaction.atomic():
+            existing = {
+                p.sku: p
+                for p in Product.objects.select_for_update().filter(user=request.user, sku__in=valid)
+            }
+            now = timezone.now()
+            for sku, (fields, result) in valid.items():
+                product = existing.get(sku)
+                if product is None:
+                    product = Product(user=request.user, description='', is_active=True)
+                    created.append(product)
+                    result['status'] = 'created'
+                else:
+                    result['status'] = 'unchanged'
+                for field, value in fields.items():
+                    setattr(product, field, value)
+                content_hash = Product.compute_content_hash(product.name, product.description, product.is_active)
+                if result['status'] == 'unchanged' and content_hash != product.content_hash:
+                    product.updated_at = now
+                    updated.append(product)
+                    result['status'] = 'updated'
+                product.content_hash = content_hash
+
+            # Upsert, in case another request inserted one of these SKUs since the lookup
+            Product.objects.bulk_create(
+                created,
+                update_conflicts=True,
+                unique_fields=['user', 'sku'],
+                update_fields=['name', 'description', 'is_active', 'content_hash', 'updated_at']
+            )
+            Product.objects.bulk_update(
+                updated, ['name', 'description', 'is_active', 'content_hash', 'updated_at'], batch_size=500
+            )
+            _notify(request.user.id, 'product.batch_created', created)
+            _notify(request.user.id, 'product.batch_updated', updated)
+
+        return JsonResponse({'results': results, 'summary': _summary(results)})
+
+
+class ProductBatchPatchApiView(ApiView):
+    """Update some fields of existing products, matched by SKU."""
+
+    def post(self, request):
+        results, valid = _prepare(self.parse_batch('items'), partial=True)
+        updated = []
+
+        with transaction.atomic():
+            existing = {
+                p.sku: p
+                for p in Product.objects.select_for_update().filter(user=request.user, sku__in=valid)
+            }
+            now = timezone.now()
+            for sku, (fields, result) in valid.items():
+                product = existing.get(sku)
+                if product is None:
+                    result['status'] = 'not_found'
+                    continue
+                for field, value in fields.items():
+                    setattr(product, field, value)
+                content_hash = Product.compute_content_hash(product.name, product.description, product.is_active)
+                if content_hash == product.content_hash:
+                    result['status'] = 'unchanged'
+                    continue
+                product.content_hash = content_hash
+                product.updated_at = now
+                updated.append(product)
+                result['status'] = 'updated'
+
+            Product.objects.bulk_update(
+                updated, ['name', 'description', 'is_active', 'content_hash', 'updated_at'], batch_size=500
+            )
+            _notify(request.user.id, 'product.batch_updated', updated)
+
+        return JsonResponse({'results': results, 'summary': _summary(results)})
+
+
+class ProductBatchDeleteApiView(ApiView):
+    """Delete products by SKU."""
+
+    def post(self, request):
+        skus = self.parse_batch('skus')
+        if not all(isinstance(sku, str) for sku in skus):
+            raise ApiError('"skus" must be a list of strings')
+
+        with transaction.atomic():
+            queryset = Product.objects.filter(user=request.user, sku__in=skus)
+            deleted = list(queryset.select_for_update().only('sku', 'name'))
+            # Product has no dependants, so this is a single DELETE statement
+            queryset.delete()
+            _notify(request.user.id, 'product.batch_deleted', deleted)
+
+        found = {p.sku for p in deleted}
+        results = [{'sku': sku, 'status': 'deleted' if sku in found else 'not_found'} for sku in skus]
+        return JsonResponse({'results': results, 'summary': _summary(results)})
@@ -0,0 +1,123 @@
+import hashlib
+import sqlite3
+
+from django.conf import settings
+
+# Bloom filter probes per SKU
+BLOOM_HASHES = 4
+_MASK_64 = (1 << 64) - 1
+# A saved candidate: 16-byte fingerprint, then the offset as 8 bytes little-endian
+_RECORD_SIZE = 24
+_LOAD_RECORDS = 4096
+
+
+def _fingerprint(sku):
+    # 128 bits keeps collisions negligible at tens of millions of SKUs
+    return hashlib.blake2b(sku.encode('utf-8'), digest_size=16).digest()
+
+
+class SkuIndex:
+    """Finds the last occurrence of every SKU in an import, in bounded memory.
+
+    ``add()`` is called for every record in a first pass over the file. SKUs
+    are only kept as 16-byte fingerprints in a Bloom filter. A fingerprint the
+    filter has (probably) seen before becomes a duplicate candidate, and only
+    candidates remember the offset of their latest record. Candidates spill to
+    a temporary on-disk SQLite database once there are more than
+    PRODUCT_IMPORT_DEDUP_MAX_CANDIDATES of them.
+
+    In the second pass ``is_last()`` tells whether a record is the one to
+    keep. Bloom false positives only make a unique SKU a candidate, and a
+    candidate seen once is still its own last occurrence, so the answer is
+    exact apart from fingerprint collisions.
+
+    A sharded import indexes the whole file once, writes the candidates out
+    with ``save()``, and every shard reads them back with ``load()``.
+    """
+
+    def __init__(self, size_hint):
+        # About 8 bits per byte of input (16+ bits per CSV row), capped
+        bloom_bytes = min(max(size_hint // 8, 1024), settings.PRODUCT_IMPORT_DEDUP_BLOOM_BYTES)
+        self.bloom = bytearray(bloom_bytes)
+        self.bloom_bits = bloom_bytes * 8
+        self.candidates = {}
+        self.spill = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def add(self, sku, offset):
+        fingerprint = _fingerprint(sku)
+        value = int.from_bytes(fingerprint, 'little')
+        h1 = value & _MASK_64
+        h2 = (value >> 64) | 1
+
+        bloom = self.bloom
+        bits = self.bloom_bits
+        seen = True
+        for _ in range(BLOOM_HASHES):
+            bit = h1 % bits
+            mask = 1 << (bit & 7)
+            bit >>= 3
+            if not bloom[bit] & mask:
+                seen = False
+                bloom[bit] |= mask
+            h1 += h2
+
+        if seen:
+            self.candidates[fingerprint] = offset
+            if len(self.candidates) >= settings.PRODUCT_IMPORT_DEDUP_MAX_CANDIDATES:
+                self._spill()
+
+    def is_last(self, sku, offset):
+        fingerprint = _fingerprint(sku)
+        last = self.candidates.get(fingerprint)
+        if last is None and self.spill is not None:
+            found = self.spill.execute('SELECT last FROM candidates WHERE fingerprint = ?', (fingerprint,)).fetchone()
+            last = found[0] if found else None
+        # Not a candidate means the SKU occurs exactly once
+        return last is None or last == offset
+
+    def save(self, f):
+        """Write the duplicate candidates to the binary file ``f``."""
+        if self.spill is not None:
+            self._spill()
+            candidates = self.spill.execute('SELECT fingerprint, last FROM candidates')
+        else:
+            candidates = self.candidates.items()
+        for fingerprint, last in candidates:
+            f.write(fingerprint + last.to_bytes(8, 'little'))
+
+    @classmethod
+    def load(cls, f):
+        """An index of the candidates ``save()`` wrote to ``f``, for ``is_last()`` only."""
+        index = cls(0)
+        while data := f.read(_RECORD_SIZE * _LOAD_RECORDS):
+            for i in range(0, len(data), _RECORD_SIZE):
+                index.candidates[data[i:i + 16]] = int.from_bytes(data[i + 16:i + _RECORD_SIZE], 'little')
+            if len(index.candidates) >= settings.PRODUCT_IMPORT_DEDUP_MAX_CANDIDATES:
+                index._spill()
+        return index
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+    def _spill(self):
+        if self.spill is None:
+            # An empty filename gives a private on-disk database that SQLite
+            # deletes when it is closed.
+            self.spill = sqlite3.connect('')
+            self.spill.execute('PRAGMA journal_mode = OFF')
+            self.spill.execute('PRAGMA synchronous = OFF')
+            self.spill.execute(
+                'CREATE TABLE candidates (fingerprint BLOB PRIMARY KEY, last INTEGER NOT NULL) WITHOUT ROWID'
+            )
+        # Offsets only grow during the first pass, so newer values replace older ones
+        self.spill.executemany('INSERT OR REPLACE INTO candidates VALUES (?, ?)', self.candidates.items())
+        self.candidates = {}
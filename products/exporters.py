@@ -0,0 +1,50 @@
+import csv
+import json
+
+# Export columns. The first three match the CSV import format, so an export
+# can be imported again as-is.
+EXPORT_FIELDS = ['sku', 'name', 'description', 'is_active', 'created_at', 'updated_at']
+
+
+class CsvExporter:
+    extension = 'csv'
+    content_type = 'text/csv'
+
+    def __init__(self, f):
+        self.writer = csv.writer(f)
+        self.writer.writerow(EXPORT_FIELDS)
+
+    def write(self, rows):
+        self.writer.writerows(
+            (sku, name, description, 'true' if is_active else 'false', created_at.isoformat(), updated_at.isoformat())
+            for sku, name, description, is_active, created_at, updated_at in rows
+        )
+
+
+class NdjsonExporter:
+    extension = 'ndjson'
+    content_type = 'application/x-ndjson'
+
+    def __init__(self, f):
+        self.f = f
+        self.encoder = json.JSONEncoder(ensure_ascii=False)
+
+    def write(self, rows):
+        encode = self.encoder.encode
+        self.f.writelines(
+            encode({
+                'sku': sku,
+                'name': name,
+                'description': description,
+                'is_active': is_active,
+                'created_at': created_at.isoformat(),
+                'updated_at': updated_at.isoformat(),
+            }) + '\n'
+            for sku, name, description, is_active, created_at, updated_at in rows
+        )
+
+
+EXPORTERS = {
+    'csv': CsvExporter,
+    'ndjson': NdjsonExporter,
+}
@@ -0,0 +1,189 @@
+import csv
+import io
+import logging
+
+from django.db import connection, transaction
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+STAGING_TABLE = 'products_import_staging'
+
+
+def _empty_stats():
+    return {'rows_inserted': 0, 'rows_updated': 0, 'rows_unchanged': 0}
+
+
+class OrmImporter:
+    """Upserts every chunk with ``bulk_create(update_conflicts=True)``.
+
+    Rows whose ``content_hash`` already matches the stored product are left
+    out of the upsert. Works on any database backend Django supports
+    upserts for.
+    """
+
+    # Chunks written between checkpoints
+    checkpoint_every = 1
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.stats = _empty_stats()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def write(self, rows):
+        hashes = {
+            sku: Product.compute_content_hash(name, description, True)
+            for sku, name, description in rows
+        }
+        existing = dict(
+            Product.objects.filter(user_id=self.user_id, sku__in=hashes).values_list('sku', 'content_hash')
+        )
+
+        products = []
+        for sku, name, description in rows:
+            if sku not in existing:
+                self.stats['rows_inserted'] += 1
+            elif existing[sku] != hashes[sku]:
+                self.stats['rows_updated'] += 1
+            else:
+                self.stats['rows_unchanged'] += 1
+                continue
+            products.append(Product(
+                user_id=self.user_id,
+                sku=sku,
+                name=name,
+                description=description,
+                is_active=True,
+                content_hash=hashes[sku]
+            ))
+
+        # Still an upsert, in case another writer inserted the SKU since the lookup
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['user', 'sku'],
+            update_fields=['name', 'description', 'is_active', 'content_hash', 'updated_at']
+        )
+
+    def flush(self):
+        pass
+
+    def pop_stats(self):
+        """Return the insert/update/unchanged counts since the last call."""
+        stats, self.stats = self.stats, _empty_stats()
+        return stats
+
+
+class CopyImporter:
+    """Streams rows into a temporary staging table with ``COPY FROM STDIN``.
+
+    Nothing touches ``products_product`` until ``flush()``, which merges
+    everything staged since the last flush with a single
+    ``INSERT ... ON CONFLICT`` statement.
+    When a SKU was staged more than once the last staged row wins.
+    PostgreSQL only.
+    """
+
+    # Merge (and checkpoint) once per 50 staged chunks, so a crash costs at
+    # most one segment while the merge stays set-based.
+    checkpoint_every = 50
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.stats = _empty_stats()
+
+    def __enter__(self):
+        with connection.cursor() as cursor:
+            # Temp tables are session-local and skip the WAL, so concurrent
+            # imports on other connections never see each other's rows.
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} ('
+                'seq bigserial, '
+                'sku varchar(100) NOT NULL, '
+                'name varchar(255) NOT NULL, '
+                'description text NOT NULL)'
+            )
+            # Workers keep connections open (conn_max_age), so a table left
+            # behind by a previous task may still exist on this session.
+            cursor.execute(f'TRUNCATE {STAGING_TABLE}')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {STAGING_TABLE}')
+        except Exception as e:
+            logger.warning(f"Failed to drop import staging table: {str(e)}")
+        return False
+
+    def write(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {STAGING_TABLE} (sku, name, description) FROM STDIN '
+                'WITH (FORMAT csv, FORCE_NOT_NULL (sku, name, description))',
+                buffer
+            )
+
+    def flush(self):
+        table = Product._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Rows whose content hash is unchanged are filtered out by the
+            # ON CONFLICT ... WHERE clause and never rewritten. xmax is 0
+            # only for freshly inserted tuples.
+            cursor.execute(
+                f'WITH staged AS ('
+                f'SELECT DISTINCT ON (sku) sku, name, description, '
+                "md5(name || chr(31) || description || chr(31) || '1') AS content_hash "
+                f'FROM {STAGING_TABLE} ORDER BY sku, seq DESC'
+                '), upserted AS ('
+                f'INSERT INTO {table} AS product '
+                '(user_id, sku, name, description, is_active, content_hash, created_at, updated_at) '
+                'SELECT %s, sku, name, description, TRUE, content_hash, now(), now() FROM staged '
+                'ON CONFLICT (user_id, sku) DO UPDATE SET '
+                'name = EXCLUDED.name, '
+                'description = EXCLUDED.description, '
+                'is_active = EXCLUDED.is_active, '
+                'content_hash = EXCLUDED.content_hash, '
+                'updated_at = EXCLUDED.updated_at '
+                'WHERE product.content_hash IS DISTINCT FROM EXCLUDED.content_hash '
+                'RETURNING (xmax = 0) AS inserted'
+                ') '
+                'SELECT (SELECT count(*) FROM staged), '
+                'count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) '
+                'FROM upserted',
+                [self.user_id]
+            )
+            staged, inserted, updated = cursor.fetchone()
+            cursor.execute(f'TRUNCATE {STAGING_TABLE}')
+
+        self.stats['rows_inserted'] += inserted
+        self.stats['rows_updated'] += updated
+        self.stats['rows_unchanged'] += staged - inserted - updated
+
+    def pop_stats(self):
+        """Return the insert/update/unchanged counts since the last call."""
+        stats, self.stats = self.stats, _empty_stats()
+        return stats
+
+
+def get_importer(operation):
+    """Return the import engine configured on ``operation``.
+
+    The COPY engine falls back to the ORM engine on non-PostgreSQL databases.
+    """
+    if operation.engine == 'copy':
+        if connection.vendor == 'postgresql':
+            return CopyImporter(operation.user_id)
+        logger.warning(
+            f"COPY import engine requires PostgreSQL, falling back to ORM engine for operation {operation.pk}"
+        )
+    return OrmImporter(operation.user_id)
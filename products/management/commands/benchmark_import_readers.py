@@ -0,0 +1,154 @@
+import csv
+import gzip
+import importlib.util
+import io
+import itertools
+import json
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from products.readers import FORMATS, IMPORT_FIELDS, UnsupportedFormat, get_format
+
+WRITE_BATCH_SIZE = 100000
+# Line endings the text formats are written with: Unix, Windows, and the bare
+# CR of CSVs saved by Excel for Mac
+NEWLINES = {'lf': '\n', 'crlf': '\r\n', 'cr': '\r'}
+
+
+def legacy_csv_rows(name):
+    """The import's original reader stage: a DictReader over a text wrapper, re-encoding each line to count bytes."""
+    rows = 0
+    with default_storage.open(name, 'rb') as f:
+        text_file = io.TextIOWrapper(f, encoding='utf-8')
+
+        processed_bytes = 0
+        def progress_wrapper(file_obj):
+            nonlocal processed_bytes
+            for line in file_obj:
+                processed_bytes += len(line.encode('utf-8'))
+                yield line
+
+        for row in csv.DictReader(progress_wrapper(text_file)):
+            sku = row.get('sku', '').strip()
+            name = row.get('name', '').strip()
+            description = row.get('description', '').strip()
+            if not sku:
+                continue
+            sku = sku.lower()
+            rows += 1
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Write sample_products.csv scaled to --rows rows in each import format and time how fast '
+        'products.readers parses it. For .csv the original DictReader stage is timed as well, as the '
+        'baseline. Text formats are written once per --newlines line ending. NDJSON is decoded a block '
+        'at a time with pyarrow when it is installed, and a line at a time otherwise. The files are '
+        'written to default_storage and deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000000, help='Rows per file')
+        parser.add_argument('--formats', nargs='*', default=list(FORMATS), help='Suffixes to benchmark')
+        parser.add_argument(
+            '--newlines', nargs='*', choices=list(NEWLINES), default=list(NEWLINES),
+            help='Line endings to write the text formats with'
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        for suffix in options['formats']:
+            name = f'benchmarks/import_readers{suffix}'
+            try:
+                get_format(name)
+            except UnsupportedFormat as e:
+                self.stdout.write(f'{suffix}: skipped ({e})')
+                continue
+
+            newlines = [None] if suffix in ('.parquet', '.arrow') else options['newlines']
+            for newline in newlines:
+                label = f'{suffix} ({newline})' if newline else suffix
+                if suffix.startswith('.ndjson') and importlib.util.find_spec('pyarrow') is None:
+                    # A json.loads per line, which is slower than the legacy CSV reader
+                    label += ', without pyarrow'
+                with tempfile.TemporaryFile() as tmp:
+                    self._write(suffix, options['rows'], tmp, NEWLINES.get(newline))
+                    tmp.seek(0)
+                    saved = default_storage.save(name, File(tmp))
+                try:
+                    size = default_storage.size(saved)
+                    if suffix == '.csv':
+                        baseline = self._time(
+                            f'{label}, legacy DictReader', lambda: legacy_csv_rows(saved), options['rows'], size, baseline
+                        )
+                    baseline = self._time(label, lambda: self._parse(saved), options['rows'], size, baseline)
+                finally:
+                    default_storage.delete(saved)
+
+    def _time(self, label, parse, rows, size, baseline):
+        started = time.perf_counter()
+        parsed = parse()
+        elapsed = time.perf_counter() - started
+        if parsed != rows:
+            raise CommandError(f'{label}: read {parsed} rows, expected {rows}')
+        speedup = f', {baseline / elapsed:.1f}x' if baseline else ''
+        self.stdout.write(
+            f'{label}: {parsed} rows in {elapsed:.2f}s ({parsed / elapsed:,.0f} rows/s{speedup}), '
+            f'{size / 1024 / 1024:.1f} MB'
+        )
+        # The first format timed is what the others are compared with
+        return baseline or elapsed
+
+    def _parse(self, name):
+        reader = get_format(name)
+        data_start, fieldnames = reader.read_header()
+        return sum(len(records) for _, records in reader.batches(fieldnames, data_start, reader.data_end()))
+
+    def _rows(self, count):
+        """``count`` rows cycling through sample_products.csv, with SKUs made unique."""
+        with open(settings.BASE_DIR / 'sample_products.csv', newline='') as f:
+            sample = [(row['sku'], row['name'], row['description']) for row in csv.DictReader(f)]
+        for i, (sku, name, description) in zip(range(count), itertools.cycle(sample)):
+            yield f'{sku}-{i // len(sample)}', name, description
+
+    def _write(self, suffix, count, f, newline):
+        rows = self._rows(count)
+        if suffix in ('.parquet', '.arrow'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            schema = pa.schema([(field, pa.string()) for field in IMPORT_FIELDS])
+            if suffix == '.parquet':
+                writer = pq.ParquetWriter(f, schema)
+            else:
+                writer = pa.ipc.new_file(f, schema)
+            with writer:
+                while chunk := list(itertools.islice(rows, WRITE_BATCH_SIZE)):
+                    writer.write_batch(pa.record_batch([pa.array(column) for column in zip(*chunk)], schema=schema))
+            return
+
+        if suffix.endswith('.gz'):
+            raw = gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6)
+        elif suffix.endswith('.zst'):
+            import zstandard
+            raw = zstandard.ZstdCompressor().stream_writer(f, closefd=False)
+        else:
+            raw = f
+        text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        if suffix.startswith('.csv'):
+            writer = csv.writer(text, lineterminator=newline)
+            writer.writerow(IMPORT_FIELDS)
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                text.write(json.dumps(dict(zip(IMPORT_FIELDS, row))) + newline)
+        text.flush()
+        text.detach()
+        if raw is not f:
+            raw.close()
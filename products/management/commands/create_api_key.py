@@ -0,0 +1,23 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from products.models import ApiKey
+
+
+class Command(BaseCommand):
+    help = (
+        'Create a key for the products API and print it. Clients send it as '
+        '"Authorization: Bearer <key>". Only its digest is stored, so it is shown this once.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--name', default='API key', help='Label shown in the admin')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist")
+        api_key, key = ApiKey.generate(user, options['name'])
+        self.stdout.write(key)
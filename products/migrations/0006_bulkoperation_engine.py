@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_remove_bulkoperation_result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='engine',
+            field=models.CharField(choices=[('orm', 'ORM Bulk Upsert'), ('copy', 'PostgreSQL COPY')], default='orm', max_length=10),
+        ),
+    ]
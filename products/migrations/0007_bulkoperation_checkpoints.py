@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_bulkoperation_engine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='checkpoints',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='chunks_committed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='rows_committed',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_bulkoperation_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='duplicates_collapsed',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_bulkoperation_duplicates_collapsed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='rows_inserted',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='rows_unchanged',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='rows_updated',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:56
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+import django.db.models.functions.text
+
+
+SEARCH_VECTOR_SQL = """
+CREATE FUNCTION products_product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.sku, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.name, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER products_product_search_vector_trigger
+BEFORE INSERT OR UPDATE OF sku, name, description ON products_product
+FOR EACH ROW EXECUTE FUNCTION products_product_search_vector_update();
+
+UPDATE products_product SET search_vector =
+    setweight(to_tsvector('simple', coalesce(sku, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(name, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'C');
+"""
+
+DROP_SEARCH_VECTOR_SQL = """
+DROP TRIGGER IF EXISTS products_product_search_vector_trigger ON products_product;
+DROP FUNCTION IF EXISTS products_product_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_content_hash'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # Backfill before the indexes exist, it's much cheaper than updating them row by row
+        migrations.RunSQL(SEARCH_VECTOR_SQL, DROP_SEARCH_VECTOR_SQL),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('sku'), name='gin_trgm_ops'), name='product_sku_trgm_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='product_name_trgm_gin'),
+        ),
+    ]
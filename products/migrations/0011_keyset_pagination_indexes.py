@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-17 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_product_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bulkoperation',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='bulkop_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='product_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='options',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='output_file',
+            field=models.FileField(blank=True, null=True, upload_to='bulk_exports/'),
+        ),
+        migrations.AlterField(
+            model_name='bulkoperation',
+            name='operation_type',
+            field=models.CharField(choices=[('import', 'CSV Import'), ('delete', 'Bulk Delete'), ('export', 'Catalog Export')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_bulkoperation_export'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='summary',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_bulkoperation_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='error_file',
+            field=models.FileField(blank=True, null=True, upload_to='import_errors/'),
+        ),
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='rows_rejected',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('products', '0014_bulkoperation_rows_rejected'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(max_length=255)),
+                ('name', models.CharField(max_length=500)),
+                ('size', models.BigIntegerField()),
+                ('part_size', models.BigIntegerField()),
+                ('status', models.CharField(choices=[('uploading', 'Uploading'), ('completed', 'Completed'), ('aborted', 'Aborted')], default='uploading', max_length=20)),
+                ('upload_id', models.CharField(blank=True, max_length=1024)),
+                ('parts', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('operation', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='products.bulkoperation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
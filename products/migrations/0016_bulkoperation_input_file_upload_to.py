@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:29
+
+from django.db import migrations, models
+import products.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bulkoperation',
+            name='input_file',
+            field=models.FileField(blank=True, null=True, upload_to=products.models.import_upload_to),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_apikey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkoperation',
+            name='sku_index_file',
+            field=models.FileField(blank=True, null=True, upload_to='import_sku_indexes/'),
+        ),
+    ]
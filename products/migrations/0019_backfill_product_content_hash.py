@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+# Same digest as Product.compute_content_hash and importers.CopyImporter.flush.
+# Products saved before 0009 have no hash, so the first import touching them
+# would otherwise rewrite every one of them as "updated".
+BACKFILL_CONTENT_HASH_SQL = """
+UPDATE products_product SET content_hash = md5(
+    name || chr(31) || description || chr(31) || CASE WHEN is_active THEN '1' ELSE '0' END
+)
+WHERE content_hash IS NULL;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0018_bulkoperation_sku_index_file'),
+    ]
+
+    operations = [
+        migrations.RunSQL(BACKFILL_CONTENT_HASH_SQL, migrations.RunSQL.noop),
+    ]
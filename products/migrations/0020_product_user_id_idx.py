@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_backfill_product_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['user', 'id'], name='product_user_id_idx'),
+        ),
+    ]
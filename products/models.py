@@ -1,5 +1,12 @@
+import hashlib
+import secrets
+import uuid
+
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 
 class Product(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, name='user')
@@ -9,17 +16,79 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Digest of the imported content, lets imports skip rows that didn't change
+    content_hash = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    # Maintained by a database trigger (see migration 0010), so bulk imports
+    # and raw SQL writes stay searchable too
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         unique_together = ('user', 'sku')
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+            # icontains compiles to UPPER(col) LIKE UPPER('%q%'), which these serve
+            GinIndex(OpClass(Upper('sku'), name='gin_trgm_ops'), name='product_sku_trgm_gin'),
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='product_name_trgm_gin'),
+            # Keyset pagination (products.pagination)
+            models.Index(fields=['user', 'created_at', 'id'], name='product_user_created_idx'),
+            # Bulk deletes page through a user's products by id
+            models.Index(fields=['user', 'id'], name='product_user_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sku} - {self.name}"
 
+    @staticmethod
+    def compute_content_hash(name, description, is_active):
+        # Must match the md5() expressions in importers.CopyImporter.flush and migration 0019
+        content = f"{name}\x1f{description}\x1f{1 if is_active else 0}"
+        return hashlib.md5(content.encode('utf-8'), usedforsecurity=False).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.content_hash = self.compute_content_hash(self.name, self.description, self.is_active)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'content_hash'}
+        super().save(*args, **kwargs)
+
+class ApiKey(models.Model):
+    """A key for machine clients of the products API, sent as ``Authorization: Bearer <key>``.
+
+    Only a SHA-256 digest of the key is stored; the key itself is shown once,
+    when it is created (see the ``create_api_key`` management command).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='api_keys')
+    name = models.CharField(max_length=100)
+    prefix = models.CharField(max_length=8, editable=False)
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    def __str__(self):
+        return f"{self.name} ({self.prefix}...)"
+
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def generate(cls, user, name):
+        """Create a key for ``user``. Returns ``(api_key, key)``; ``key`` can't be recovered later."""
+        key = secrets.token_urlsafe(32)
+        api_key = cls.objects.create(user=user, name=name, prefix=key[:8], key_hash=cls.hash_key(key))
+        return api_key, key
+
+def import_upload_to(instance, filename):
+    # A directory per upload: on a name clash the storage would otherwise
+    # rename the file and mangle double suffixes like .csv.gz
+    return f'bulk_imports/{uuid.uuid4().hex}/{filename}'
+
 class BulkOperation(models.Model):
     OPERATION_TYPES = [
         ('import', 'CSV Import'),
         ('delete', 'Bulk Delete'),
+        ('export', 'Catalog Export'),
     ]
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -27,14 +96,96 @@ class BulkOperation(models.Model):
         ('completed', 'Completed'),
         ('failed', 'Failed'),
     ]
+    ENGINE_CHOICES = [
+        ('orm', 'ORM Bulk Upsert'),
+        ('copy', 'PostgreSQL COPY'),
+    ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     operation_type = models.CharField(max_length=20, choices=OPERATION_TYPES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    input_file = models.FileField(upload_to='bulk_imports/', null=True, blank=True)
+    input_file = models.FileField(upload_to=import_upload_to, null=True, blank=True)
     task_id = models.CharField(max_length=255, blank=True, null=True)
+    engine = models.CharField(max_length=10, choices=ENGINE_CHOICES, default='orm')
+    # Operation parameters: {'format': 'ndjson', 'gzip': True} for exports,
+    # {'is_active': False, 'sku_prefix': ..., 'created_after': ..., 'created_before': ...}
+    # for deletes, where the dates are ISO datetimes: created_after inclusive,
+    # created_before exclusive
+    options = models.JSONField(default=dict, blank=True)
+    output_file = models.FileField(upload_to='bulk_exports/', null=True, blank=True)
+    # Import checkpoints, saved in the same transaction as each committed chunk.
+    # ``checkpoints`` maps each planned range's start position to
+    # {'end': ..., 'offset': ..., 'lines': ...}, where offset is the next
+    # unread record and lines the number of lines of the range read so far.
+    # Positions are byte offsets, or row numbers for columnar files (see
+    # products.readers); 'end' is null until a compressed file is read.
+    # Shards of a sharded import also record the task that queued them
+    # ('dispatched') and the task they started under ('started').
+    checkpoints = models.JSONField(default=dict, blank=True)
+    # Rows written so far; exports and deletes record their row count here
+    rows_committed = models.BigIntegerField(default=0)
+    # Rows that failed validation, listed with their reasons in error_file
+    rows_rejected = models.BigIntegerField(default=0)
+    error_file = models.FileField(upload_to='import_errors/', null=True, blank=True)
+    # Import-wide SKU index of a sharded import, built before the shards run
+    # so duplicates are collapsed across shards (see products.dedup); deleted
+    # when the import ends
+    sku_index_file = models.FileField(upload_to='import_sku_indexes/', null=True, blank=True)
+    # Rows skipped because a later row in the file had the same SKU
+    duplicates_collapsed = models.BigIntegerField(default=0)
+    rows_inserted = models.BigIntegerField(default=0)
+    rows_updated = models.BigIntegerField(default=0)
+    # Rows that matched the stored content_hash and were not rewritten
+    rows_unchanged = models.BigIntegerField(default=0)
+    chunks_committed = models.IntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Written once when the operation ends (see products.progress):
+    # {'message', 'rows', 'duration_seconds', 'rows_per_second', 'errors': [...]}
+    summary = models.JSONField(default=dict, blank=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination (products.pagination)
+            models.Index(fields=['user', 'created_at', 'id'], name='bulkop_user_created_idx'),
+        ]
+
+class UploadSession(models.Model):
+    """A resumable, chunked upload of an import file (see products.uploads).
+
+    The browser sends the parts straight to storage: to S3 via presigned
+    multipart URLs, or in dev to a local endpoint that writes each part in
+    place. Completing the session starts the import.
+    """
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('completed', 'Completed'),
+        ('aborted', 'Aborted'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    # Name of the assembled file in default_storage
+    name = models.CharField(max_length=500)
+    size = models.BigIntegerField()
+    part_size = models.BigIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    # S3 multipart upload id; empty for local uploads
+    upload_id = models.CharField(max_length=1024, blank=True)
+    # Part numbers received by the local backend (S3 tracks its own)
+    parts = models.JSONField(default=list, blank=True)
+    operation = models.OneToOneField(BulkOperation, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def part_count(self):
+        return max(1, -(-self.size // self.part_size))
+
+    def part_range(self, number):
+        """Return the ``(start, end)`` byte range of part ``number`` (1-based)."""
+        start = (number - 1) * self.part_size
+        return start, min(start + self.part_size, self.size)
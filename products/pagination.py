@@ -0,0 +1,102 @@
+import base64
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(obj):
+    value = f'{obj.created_at.isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, pk)`` for a cursor, or ``None`` if it's missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        created_at = parse_datetime(created_at)
+        return (created_at, int(pk)) if created_at else None
+    except (ValueError, UnicodeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginationMixin:
+    """ListView mixin that pages newest-first on ``(created_at, id)`` instead of OFFSET.
+
+    Pages are selected with ``?after=<cursor>`` / ``?before=<cursor>``, and
+    every page is a range scan on a ``(user, created_at, id)`` index, so deep
+    pages cost the same as the first. The exact ``COUNT(*)`` is replaced by a
+    per-user total cached for ``count_cache_timeout`` seconds.
+    """
+    count_cache_timeout = 300
+
+    def use_keyset_pagination(self):
+        return True
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_keyset_pagination():
+            return super().paginate_queryset(queryset, page_size)
+
+        after = decode_cursor(self.request.GET.get('after'))
+        before = decode_cursor(self.request.GET.get('before'))
+
+        if before:
+            created_at, pk = before
+            # The plain created_at bound is redundant with the OR below, but it
+            # is what lets the database start the index scan at the cursor.
+            rows = list(
+                queryset.filter(created_at__gte=created_at)
+                .filter(Q(created_at__gt=created_at) | Q(pk__gt=pk))
+                .order_by('created_at', 'pk')[:page_size + 1]
+            )
+            has_previous = len(rows) > page_size
+            rows = rows[:page_size][::-1]
+            has_next = True
+        else:
+            if after:
+                created_at, pk = after
+                queryset = (
+                    queryset.filter(created_at__lte=created_at)
+                    .filter(Q(created_at__lt=created_at) | Q(pk__lt=pk))
+                )
+            rows = list(queryset.order_by('-created_at', '-pk')[:page_size + 1])
+            has_next = len(rows) > page_size
+            rows = rows[:page_size]
+            has_previous = after is not None
+
+        page = KeysetPage(
+            rows,
+            next_cursor=encode_cursor(rows[-1]) if has_next and rows else None,
+            previous_cursor=encode_cursor(rows[0]) if has_previous and rows else None,
+        )
+        return (None, page, rows, page.has_next() or page.has_previous())
+
+    def get_total_count(self):
+        model_name = self.model._meta.model_name
+        return cache.get_or_set(
+            f'{model_name}_count_{self.request.user.id}',
+            lambda: self.model.objects.filter(user=self.request.user).count(),
+            timeout=self.count_cache_timeout
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if self.use_keyset_pagination():
+            context['keyset_pagination'] = True
+            context['total_count'] = self.get_total_count()
+        return context
@@ -0,0 +1,181 @@
+"""Live progress and final summaries for bulk operations.
+
+While an operation runs, its progress lives in a Redis hash keyed by the
+operation id (``bulk_progress_<id>``). The ``state`` field holds the latest
+progress dict, and numeric fields hold counters shared by parallel import
+shards. Updates are throttled per process and published on a channel with
+the same name, which ``products.streaming`` (or ``ProgressStreamView``)
+follows. When the operation ends, ``finish_operation`` saves a compact
+summary on the ``BulkOperation`` row, so it outlives the hash.
+"""
+import json
+import logging
+import time
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from acme_project.redis_pool import get_redis
+from .models import BulkOperation
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_TTL = 3600
+ERROR_SAMPLE_SIZE = 5
+# Seconds an open progress stream counts against its user's limit without
+# being refreshed, in case its process died before unregistering it
+STREAM_LEASE_SECONDS = 60
+# Size of _last_update above which expired entries are dropped
+LAST_UPDATE_MAX_ENTRIES = 1000
+
+# Operation id -> time.monotonic() of this process's last published update
+_last_update = {}
+
+
+def progress_key(operation_id):
+    return f'bulk_progress_{operation_id}'
+
+
+def set_progress(operation_id, data, force=False):
+    """Store ``data`` as the operation's current progress and publish it.
+
+    'processing' updates are skipped if this process published one for the
+    same operation less than BULK_PROGRESS_INTERVAL seconds ago, unless
+    ``force`` is set. Other statuses are always written.
+    """
+    now = time.monotonic()
+    if len(_last_update) > LAST_UPDATE_MAX_ENTRIES:
+        # Entries older than the interval no longer throttle anything. Shards
+        # that never publish the final status would otherwise leave theirs.
+        for key in [key for key, last in _last_update.items() if now - last >= settings.BULK_PROGRESS_INTERVAL]:
+            del _last_update[key]
+    if data['status'] == 'processing':
+        last = _last_update.get(operation_id)
+        if not force and last is not None and now - last < settings.BULK_PROGRESS_INTERVAL:
+            return
+        _last_update[operation_id] = now
+    else:
+        _last_update.pop(operation_id, None)
+
+    key = progress_key(operation_id)
+    payload = json.dumps(data)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hset(key, 'state', payload)
+        pipe.expire(key, PROGRESS_TTL)
+        pipe.publish(key, payload)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to store progress for operation {operation_id}: {str(e)}")
+
+
+def _streams_key(user_id):
+    return f'progress_streams_{user_id}'
+
+
+def open_stream(user_id, stream_id):
+    """Register an open progress stream of the user.
+
+    Returns False, without registering it, if the user already has
+    BULK_PROGRESS_MAX_STREAMS streams open. Streams are kept in a sorted set
+    scored by when they were last refreshed (see ``refresh_stream``).
+    """
+    key = _streams_key(user_id)
+    now = time.time()
+    pipe = get_redis().pipeline()
+    pipe.zremrangebyscore(key, 0, now - STREAM_LEASE_SECONDS)
+    pipe.zadd(key, {stream_id: now})
+    pipe.zcard(key)
+    pipe.expire(key, STREAM_LEASE_SECONDS)
+    if pipe.execute()[2] > settings.BULK_PROGRESS_MAX_STREAMS:
+        close_stream(user_id, stream_id)
+        return False
+    return True
+
+
+def refresh_stream(user_id, stream_id):
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.zadd(_streams_key(user_id), {stream_id: time.time()})
+    pipe.expire(_streams_key(user_id), STREAM_LEASE_SECONDS)
+    pipe.execute()
+
+
+def close_stream(user_id, stream_id):
+    get_redis().zrem(_streams_key(user_id), stream_id)
+
+
+def reset_counters(operation_id, **counters):
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hset(progress_key(operation_id), mapping=counters)
+    pipe.expire(progress_key(operation_id), PROGRESS_TTL)
+    pipe.execute()
+
+
+def incr_counters(operation_id, **deltas):
+    """Add ``deltas`` to the operation's shared counters and return the new totals."""
+    pipe = get_redis().pipeline(transaction=False)
+    for name, delta in deltas.items():
+        pipe.hincrby(progress_key(operation_id), name, delta)
+    pipe.expire(progress_key(operation_id), PROGRESS_TTL)
+    return dict(zip(deltas, pipe.execute()))
+
+
+def get_progress(operation):
+    """Return the operation's progress dict.
+
+    Finished operations are described by their saved summary. Running ones
+    by the Redis state.
+    """
+    if operation.status in ('completed', 'failed'):
+        return summary_progress(operation)
+    try:
+        state = get_redis().hget(progress_key(operation.pk), 'state')
+    except redis.RedisError as e:
+        logger.warning(f"Failed to read progress for operation {operation.pk}: {str(e)}")
+        state = None
+    if state:
+        return json.loads(state)
+    return {'status': 'pending', 'progress': 0, 'message': 'Initializing...', 'operation_id': operation.pk}
+
+
+def summary_progress(operation):
+    completed = operation.status == 'completed'
+    return {
+        'status': 'complete' if completed else 'failed',
+        'progress': 100 if completed else 0,
+        'message': operation.summary.get('message', ''),
+        'operation_id': operation.pk,
+    }
+
+
+def start_operation(operation):
+    # Update DB Status -> Processing
+    operation.status = 'processing'
+    update_fields = ['status', 'updated_at']
+    if operation.started_at is None:
+        # A resumed import keeps its original start time
+        operation.started_at = timezone.now()
+        update_fields.append('started_at')
+    operation.save(update_fields=update_fields)
+
+
+def finish_operation(operation, status, message, rows, errors=(), **extra):
+    """Mark the operation ``status`` ('completed' or 'failed') and save its summary, then publish the final progress."""
+    now = timezone.now()
+    duration = (now - (operation.started_at or operation.created_at)).total_seconds()
+    operation.status = status
+    operation.finished_at = now
+    operation.summary = {
+        'message': message,
+        'rows': rows,
+        'duration_seconds': round(duration, 3),
+        'rows_per_second': round(rows / duration) if duration > 0 else None,
+        'errors': [str(error)[:500] for error in errors][:ERROR_SAMPLE_SIZE],
+        **extra,
+    }
+    # One UPDATE, without touching fields other tasks or shards may be writing
+    BulkOperation.objects.filter(pk=operation.pk).update(
+        status=status, finished_at=now, summary=operation.summary, updated_at=now
+    )
+    set_progress(operation.pk, summary_progress(operation))
@@ -0,0 +1,479 @@
+"""Readers for the file formats products can be imported from.
+
+``get_format`` picks a reader by the file's suffix. Every reader turns a
+range of the file into batches of ``(record_start, next_position, line, sku,
+name, description)`` records, with the SKU stripped and lowercased and the
+other fields stripped, which is what ``products.tasks`` imports.
+
+Positions are what the import checkpoints store:
+
+* CSV and NDJSON: byte offsets into the decompressed text. Uncompressed files
+  are seeked and can be split into shards. Compressed ones (``.gz``, ``.zst``)
+  are decompressed as a stream, so they are read by a single task; resuming
+  one decompresses it again and discards everything before the checkpoint.
+  Lines may end in LF, CRLF or, as in CSVs saved by Excel for Mac, a bare CR.
+* Parquet and Arrow IPC: row numbers. Columnar files are read a record batch
+  at a time and normalized with Arrow compute kernels on whole columns.
+
+zstandard and pyarrow are optional. Formats that need a package which is not
+installed are refused when the file is uploaded. NDJSON is read without
+pyarrow too, only more slowly.
+"""
+import bisect
+import csv
+import gzip
+import importlib.util
+import io
+import itertools
+import json
+from contextlib import contextmanager
+from functools import cached_property, partial
+
+from django.core.files.storage import default_storage
+
+from .storage import open_from
+
+READ_BATCH_SIZE = 10000
+# Bytes of whole lines read from text files at a time
+READ_BLOCK_SIZE = 1024 * 1024
+IMPORT_FIELDS = ('sku', 'name', 'description')
+# Bytes decompressed and discarded at a time when resuming a compressed file
+SKIP_BLOCK_SIZE = 1024 * 1024
+# Bytes at the start of a text file searched for its first line ending
+NEWLINE_SNIFF_SIZE = 64 * 1024
+
+
+class UnsupportedFormat(Exception):
+    """The file's suffix is unknown, or its reader needs a package that is not installed."""
+
+
+class _CountingReader:
+    """Counts the compressed bytes read through it, which is how far a compressed import got."""
+
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.count += len(data)
+        return data
+
+
+def _cr_lines(f):
+    """Like ``readlines(READ_BLOCK_SIZE)`` calls, for a file whose lines end in a bare CR."""
+    rest = b''
+    while data := f.read(READ_BLOCK_SIZE):
+        lines = (rest + data).split(b'\r')
+        rest = lines.pop()
+        if lines:
+            yield [line + b'\r' for line in lines]
+    if rest:
+        yield [rest]
+
+
+def _blocks(f, position, newline=b'\n'):
+    """Yield the rest of ``f`` as ``(lines, ends)`` blocks of whole lines.
+
+    ``ends[i + 1]`` is the position after ``lines[i]`` and ``ends[0]`` the
+    block's start. Positions are summed from the binary lines' lengths, a
+    block at a time, so nothing is re-encoded to count bytes. ``newline``
+    is b'\\r' for a file whose lines end in a bare CR (LF covers CRLF too).
+    """
+    if newline == b'\n':
+        blocks = iter(partial(f.readlines, READ_BLOCK_SIZE), [])
+    else:
+        blocks = _cr_lines(f)
+    for lines in blocks:
+        ends = list(itertools.accumulate(map(len, lines), initial=position))
+        position = ends[-1]
+        yield lines, ends
+
+
+class _CsvLines:
+    """Feeds a file's lines to ``csv.reader`` from ``offset``, keeping the current block's line ends.
+
+    ``chain()`` only asks for the next block once the reader has used up the
+    current one, so ``ends`` always covers the row just read: it ends at
+    ``ends[reader.line_num - block_line]``.
+    """
+
+    def __init__(self, f, offset, newline):
+        self.f = f
+        self.newline = newline
+        # Line number before the current block, and the block's line ends
+        self.block_line = 0
+        self.ends = [offset]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._blocks())
+
+    def _blocks(self):
+        for block, ends in _blocks(self.f, self.ends[0], self.newline):
+            self.block_line += len(self.ends) - 1
+            self.ends = ends
+            yield map(bytes.decode, block)
+
+
+class TextFormat:
+    """Line-oriented text, optionally gzip or zstd compressed."""
+    header_lines = 0
+    # Positions are byte offsets, so rejected rows can report them
+    byte_positions = True
+
+    def __init__(self, name, compression=None):
+        self.name = name
+        self.compression = compression
+        self.seekable = compression is None
+
+    @cached_property
+    def size(self):
+        return default_storage.size(self.name)
+
+    @cached_property
+    def newline(self):
+        """b'\\r' if the first line ends in a bare CR, else b'\\n'."""
+        with self._open(0) as (f, _):
+            head = f.read(NEWLINE_SNIFF_SIZE)
+        i = head.find(b'\r')
+        if i != -1 and head[i + 1:i + 2] != b'\n' and b'\n' not in head[:i]:
+            return b'\r'
+        return b'\n'
+
+    def read_header(self):
+        """Return ``(data_start, fieldnames)``."""
+        return 0, []
+
+    def skip_line(self, f):
+        """Read ``f``, which is seekable, up to the start of the next line."""
+        if self.newline == b'\n':
+            f.readline()
+            return
+        while data := f.read(SKIP_BLOCK_SIZE):
+            i = data.find(b'\r')
+            if i != -1:
+                f.seek(i + 1 - len(data), io.SEEK_CUR)
+                return
+
+    def data_end(self):
+        # Where a compressed stream ends is only known once it has been read
+        return self.size if self.seekable else None
+
+    def size_hint(self, offset, end):
+        """Rough size in bytes of ``[offset, end)``, to size the duplicate SKU index."""
+        return end - offset if end is not None else self.size * 4
+
+    def progress_total(self):
+        return self.size
+
+    def progress_at(self, offset):
+        """Progress made once reading has got to ``offset``, in the units of ``progress_total``."""
+        # Compressed input is read from the start again, so progress restarts at 0
+        return offset if self.seekable else 0
+
+    @contextmanager
+    def _open(self, offset):
+        """Yield the decompressed bytes from ``offset`` on, and a function returning the progress made so far."""
+        with open_from(self.name, offset if self.seekable else 0) as f:
+            if self.seekable:
+                yield f, None
+                return
+            raw = _CountingReader(f)
+            if self.compression == 'gzip':
+                stream = gzip.GzipFile(fileobj=raw, mode='rb')
+            else:
+                import zstandard
+                stream = io.BufferedReader(
+                    zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True),
+                    buffer_size=SKIP_BLOCK_SIZE
+                )
+            with stream:
+                remaining = offset
+                while remaining > 0:
+                    skipped = len(stream.read(min(remaining, SKIP_BLOCK_SIZE)))
+                    if not skipped:
+                        break
+                    remaining -= skipped
+                yield stream, lambda: raw.count
+
+    def batches(self, fieldnames, offset, end, line=0):
+        """Yield ``(progress, records)`` for the records that start inside ``[offset, end)``.
+
+        ``line`` is the number of lines of the range before ``offset``;
+        ``line`` in the records is the line each one ends on. ``end`` may be
+        None to read to the end of the file.
+        """
+        with self._open(offset) as (f, read_so_far):
+            for records in self._batches(f, fieldnames, offset, end, line):
+                yield (read_so_far() if read_so_far else records[-1][1]), records
+
+    def _batches(self, f, fieldnames, offset, end, line):
+        raise NotImplementedError
+
+
+class CsvFormat(TextFormat):
+    header_lines = 1
+
+    def read_header(self):
+        with self._open(0) as (f, _):
+            header_line = next(_blocks(f, 0, self.newline), ([b''],))[0][0]
+        return len(header_line), next(csv.reader([header_line.decode('utf-8')]), [])
+
+    def _batches(self, f, fieldnames, offset, end, line):
+        """A record that begins before ``end`` is always read in full, even
+        when it runs past it. Records without a SKU are yielded too, with an
+        empty ``sku``.
+        """
+        # Resolve the columns once. A missing one reads from a column past
+        # the header's, which is blanked in every row.
+        columns = {field: i for i, field in enumerate(fieldnames)}
+        sku_i, name_i, description_i = (columns.get(field, len(fieldnames)) for field in IMPORT_FIELDS)
+        blank_i = len(fieldnames) if len(fieldnames) in (sku_i, name_i, description_i) else None
+        width = max(sku_i, name_i, description_i) + 1
+
+        lines = _CsvLines(f, offset, self.newline)
+        reader = csv.reader(lines)
+        position = offset
+        while end is None or position < end:
+            batch = []
+            for row in reader:
+                record_start = position
+                position = lines.ends[reader.line_num - lines.block_line]
+                if row:
+                    if len(row) < width:
+                        row += [''] * (width - len(row))
+                    if blank_i is not None:
+                        row[blank_i] = ''
+                    batch.append((
+                        record_start, position, line + reader.line_num,
+                        row[sku_i].strip().lower(), row[name_i].strip(), row[description_i].strip()
+                    ))
+                if len(batch) >= READ_BATCH_SIZE or (end is not None and position >= end):
+                    break
+            else:
+                # End of file
+                if batch:
+                    yield batch
+                return
+            if batch:
+                yield batch
+
+
+class NdjsonFormat(TextFormat):
+    """One JSON object per line, with ``sku``, ``name`` and ``description`` keys.
+
+    With pyarrow installed, a block of lines is decoded in one ``read_json``
+    call, instead of a ``json.loads`` per line. Blocks it cannot take as is
+    (e.g. a number for a SKU, or an invalid line) are decoded line by line.
+    """
+
+    def _batches(self, f, fieldnames, offset, end, line):
+        decode = self._decode_block if importlib.util.find_spec('pyarrow') else self._decode_lines
+        batch = []
+        for block, ends in _blocks(f, offset, self.newline):
+            # Lines that start inside the range
+            count = len(block) if end is None else bisect.bisect_left(ends, end, 0, len(block))
+            numbers = [i for i in range(count) if block[i].strip()]
+            fields = decode([block[i] for i in numbers], [ends[i] for i in numbers])
+            batch.extend(
+                (ends[i], ends[i + 1], line + i + 1, *record) for i, record in zip(numbers, fields)
+            )
+            line += count
+            while len(batch) >= READ_BATCH_SIZE:
+                yield batch[:READ_BATCH_SIZE]
+                batch = batch[READ_BATCH_SIZE:]
+            if count < len(block) or (end is not None and ends[-1] >= end):
+                break
+        if batch:
+            yield batch
+
+    def _decode_block(self, lines, starts):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.json as pj
+
+        # read_json splits on LF only (a CR before it is whitespace)
+        if self.newline == b'\n':
+            data = b''.join(lines)
+        else:
+            data = b'\n'.join(lines)
+        try:
+            table = pj.read_json(
+                io.BytesIO(data),
+                read_options=pj.ReadOptions(use_threads=False, block_size=len(data) + 1),
+                parse_options=pj.ParseOptions(
+                    explicit_schema=pa.schema([(field, pa.string()) for field in IMPORT_FIELDS]),
+                    unexpected_field_behavior='ignore'
+                )
+            )
+        except pa.ArrowInvalid:
+            table = None
+        if table is None or table.num_rows != len(lines):
+            return self._decode_lines(lines, starts)
+        sku, name, description = (ColumnarFormat._column(table, field) for field in IMPORT_FIELDS)
+        return zip(pc.utf8_lower(sku).to_pylist(), name.to_pylist(), description.to_pylist())
+
+    @staticmethod
+    def _decode_lines(lines, starts):
+        """The ``(sku, name, description)`` of each line. Raises ValueError for a line that is not a JSON object."""
+        fields = []
+        for raw, start in zip(lines, starts):
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                raise ValueError(f'Invalid JSON at byte {start}')
+            if not isinstance(record, dict):
+                raise ValueError(f'Expected a JSON object at byte {start}')
+            sku, name, description = (
+                '' if record.get(field) is None else str(record[field]).strip() for field in IMPORT_FIELDS
+            )
+            fields.append((sku.lower(), name, description))
+        return fields
+
+
+class ColumnarFormat:
+    """Parquet or Arrow IPC. Positions and line numbers are row numbers."""
+    header_lines = 0
+    byte_positions = False
+    seekable = False
+
+    def __init__(self, name, compression=None):
+        self.name = name
+
+    def read_header(self):
+        return 0, []
+
+    @cached_property
+    def num_rows(self):
+        with default_storage.open(self.name, 'rb') as f:
+            return self._num_rows(f)
+
+    def data_end(self):
+        return self.num_rows
+
+    def size_hint(self, offset, end):
+        return (end - offset) * 64
+
+    def progress_total(self):
+        return self.num_rows
+
+    def progress_at(self, offset):
+        return offset
+
+    def batches(self, fieldnames, offset, end, line=0):
+        import pyarrow.compute as pc
+
+        position = offset
+        with default_storage.open(self.name, 'rb') as f:
+            for batch in self._record_batches(f, offset):
+                if position >= end:
+                    return
+                batch = batch.slice(0, end - position)
+                # Whole columns at a time, instead of a strip() per field per row
+                sku = pc.utf8_lower(self._column(batch, 'sku'))
+                name = self._column(batch, 'name')
+                description = self._column(batch, 'description')
+
+                numbers = range(position + 1, position + batch.num_rows + 1)
+                records = list(zip(
+                    range(position, position + batch.num_rows), numbers, numbers,
+                    sku.to_pylist(), name.to_pylist(), description.to_pylist()
+                ))
+                position += batch.num_rows
+                yield position, records
+
+    @staticmethod
+    def _column(batch, field):
+        """``field`` of a record batch or table as stripped strings, with '' for nulls or a missing column."""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        index = batch.schema.get_field_index(field)
+        if index == -1:
+            column = pa.nulls(batch.num_rows, pa.string())
+        else:
+            column = batch.column(index)
+            if not (pa.types.is_string(column.type) or pa.types.is_large_string(column.type)):
+                column = pc.cast(column, pa.string())
+        return pc.utf8_trim_whitespace(pc.fill_null(column, ''))
+
+    def _record_batches(self, f, offset):
+        """Yield record batches of at most READ_BATCH_SIZE rows, starting at row ``offset``."""
+        skipped, batches = self._file_batches(f, offset)
+        offset -= skipped
+        for batch in batches:
+            if offset >= batch.num_rows:
+                offset -= batch.num_rows
+                continue
+            for start in range(offset, batch.num_rows, READ_BATCH_SIZE):
+                yield batch.slice(start, READ_BATCH_SIZE)
+            offset = 0
+
+    def _num_rows(self, f):
+        raise NotImplementedError
+
+    def _file_batches(self, f, offset):
+        """Return ``(rows_skipped, batches)``: the file's record batches, less any skipped before row ``offset``."""
+        raise NotImplementedError
+
+
+class ParquetFormat(ColumnarFormat):
+    def _num_rows(self, f):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(f).metadata.num_rows
+
+    def _file_batches(self, f, offset):
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(f)
+        # Row groups wholly before the checkpoint are not read at all
+        skipped = 0
+        row_groups = []
+        for i in range(parquet.num_row_groups):
+            rows = parquet.metadata.row_group(i).num_rows
+            if not row_groups and offset - skipped >= rows:
+                skipped += rows
+                continue
+            row_groups.append(i)
+        if not row_groups:
+            return skipped, []
+        return skipped, parquet.iter_batches(
+            batch_size=READ_BATCH_SIZE, row_groups=row_groups,
+            columns=[field for field in IMPORT_FIELDS if field in parquet.schema_arrow.names]
+        )
+
+
+class ArrowFormat(ColumnarFormat):
+    def _num_rows(self, f):
+        import pyarrow.ipc as ipc
+        return ipc.open_file(f).count_rows()
+
+    def _file_batches(self, f, offset):
+        import pyarrow.ipc as ipc
+
+        reader = ipc.open_file(f)
+        return 0, (reader.get_batch(i) for i in range(reader.num_record_batches))
+
+
+# Suffix -> (reader, compression, package the reader needs)
+FORMATS = {
+    '.csv': (CsvFormat, None, None),
+    '.csv.gz': (CsvFormat, 'gzip', None),
+    '.csv.zst': (CsvFormat, 'zstd', 'zstandard'),
+    '.ndjson': (NdjsonFormat, None, None),
+    '.ndjson.gz': (NdjsonFormat, 'gzip', None),
+    '.ndjson.zst': (NdjsonFormat, 'zstd', 'zstandard'),
+    '.parquet': (ParquetFormat, None, 'pyarrow'),
+    '.arrow': (ArrowFormat, None, 'pyarrow'),
+}
+
+
+def get_format(name):
+    """Return the reader for the file ``name``. Raises ``UnsupportedFormat``."""
+    lowered = name.lower()
+    for suffix, (reader, compression, package) in FORMATS.items():
+        if lowered.endswith(suffix):
+            if package and importlib.util.find_spec(package) is None:
+                raise UnsupportedFormat(f'{suffix} files cannot be imported: the {package} package is not installed.')
+            return reader(name, compression)
+    raise UnsupportedFormat(f'Invalid file format. Please upload one of: {", ".join(FORMATS)}.')
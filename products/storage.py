@@ -0,0 +1,46 @@
+import io
+
+from django.core.files.storage import default_storage
+
+
+class _StreamingBodyIO(io.RawIOBase):
+    """Adapts a botocore ``StreamingBody`` so it can sit under ``io.BufferedReader``."""
+
+    def __init__(self, body):
+        self.body = body
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.body.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.body.close()
+        super().close()
+
+
+def s3_key(name):
+    """Return the S3 object key under which ``default_storage`` keeps ``name``."""
+    from storages.utils import clean_name, safe_join
+
+    return safe_join(default_storage.location, clean_name(name))
+
+
+def open_from(name, offset=0):
+    """Open ``name`` in ``default_storage`` for binary reading, starting at ``offset``.
+
+    On S3 the object is fetched with a ranged GET so a caller that only needs
+    the tail of a large upload does not download the whole object first.
+    Other backends are opened normally and seeked.
+    """
+    bucket = getattr(default_storage, 'bucket', None)
+    if bucket is not None:
+        body = bucket.Object(s3_key(name)).get(Range=f'bytes={offset}-')['Body']
+        return io.BufferedReader(_StreamingBodyIO(body), buffer_size=1024 * 1024)
+
+    f = default_storage.open(name, 'rb')
+    f.seek(offset)
+    return f
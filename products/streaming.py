@@ -0,0 +1,60 @@
+"""Async Server-Sent Events stream of a bulk operation's progress.
+
+Served for the ``progress_stream`` URL by ``stream_application`` in
+``acme_project/asgi.py`` (see STREAM_ORIGIN and ``acme_project.sse``), like
+the webhook tester streams, so an open progress bar costs the stream process
+a queue instead of holding a gevent worker's greenlet and a Redis connection
+for the whole import. Without a stream origin (e.g. runserver) the
+synchronous ``ProgressStreamView`` serves the same URL.
+"""
+import json
+import re
+import uuid
+from functools import partial
+
+from asgiref.sync import sync_to_async
+
+from acme_project.sse import send_status, session_user, stream
+from .models import BulkOperation
+from .progress import close_stream, get_progress, open_stream, progress_key, refresh_stream
+
+STREAM_PATH = re.compile(r'^/products/operations/(?P<pk>[0-9]+)/progress/stream/$')
+
+
+@sync_to_async
+def _authorize(scope, pk):
+    """Mirror ProgressStreamView: the logged-in user's own operation. Returns ``(status, user, operation)``."""
+    user = session_user(scope)
+    if not user.is_authenticated:
+        return 403, None, None
+    operation = BulkOperation.objects.filter(pk=pk, user=user).first()
+    if operation is None:
+        return 404, None, None
+    return 200, user, operation
+
+
+def _finished(data):
+    return json.loads(data)['status'] in ('complete', 'failed')
+
+
+async def progress_stream_app(scope, receive, send):
+    pk = int(STREAM_PATH.match(scope['path'])['pk'])
+    status, user, operation = await _authorize(scope, pk)
+    if status != 200:
+        await send_status(send, status)
+        return
+
+    stream_id = uuid.uuid4().hex
+    if not await sync_to_async(open_stream)(user.pk, stream_id):
+        # The page falls back to polling
+        await send_status(send, 429)
+        return
+    try:
+        await stream(
+            scope, receive, send, progress_key(operation.pk),
+            first=sync_to_async(lambda: json.dumps(get_progress(operation))),
+            last=_finished,
+            idle=sync_to_async(partial(refresh_stream, user.pk, stream_id)),
+        )
+    finally:
+        await sync_to_async(close_stream)(user.pk, stream_id)
@@ -1,167 +1,648 @@
-import csv
+import gzip
+import itertools
+import tempfile
 import time
-import os
+import uuid
 import logging
-from celery import shared_task
+from datetime import timedelta
+from functools import partial
+from celery import shared_task, chord
+from celery.exceptions import Ignore
 
 logger = logging.getLogger(__name__)
-from django.core.cache import cache
-from .models import Product
+from django.conf import settings
+from django.utils import timezone
+from django.db import transaction
+from django.db.models import Q
 
-from webhooks.tasks import send_webhook_notification
+from webhooks.subscriptions import enqueue_webhook_notification
 import io
+from django.core.files import File
 from django.core.files.storage import default_storage
 
-from .models import Product, BulkOperation
+from .models import Product, BulkOperation, UploadSession
+from . import uploads
+from .importers import get_importer
+from .readers import get_format
+from .dedup import SkuIndex
+from .exporters import EXPORT_FIELDS, EXPORTERS
+from .progress import (
+    ERROR_SAMPLE_SIZE, finish_operation, incr_counters, reset_counters, set_progress, start_operation
+)
+from .validation import merge_parts, save_part, validate_rows
 
 # ...
 
-@shared_task(bind=True)
+IMPORT_CHUNK_SIZE = 5000
+EXPORT_CHUNK_SIZE = 5000
+IMPORT_COUNT_FIELDS = [
+    'rows_committed', 'rows_rejected', 'duplicates_collapsed', 'rows_inserted', 'rows_updated', 'rows_unchanged'
+]
+
+class ImportSuperseded(Exception):
+    """A newer task took over this import (see ``resume_stale_imports``)."""
+
+class ImportErrorBudgetExceeded(Exception):
+    """More rows were rejected than PRODUCT_IMPORT_ERROR_BUDGET allows."""
+
+# acks_late + reject_on_worker_lost: if the worker dies mid-import the broker
+# redelivers the task, which then resumes from the last checkpoint.
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
 def process_csv_import(self, operation_id):
     task_id = self.request.id
-    cache_key = f'import_progress_{task_id}'
-    
-    # Initialize progress in Cache
-    cache.set(cache_key, {'status': 'processing', 'progress': 0, 'message': 'Starting import...'}, timeout=3600)
 
     try:
-        # Update DB Status -> Processing
         operation = BulkOperation.objects.get(pk=operation_id)
-        operation.status = 'processing'
-        operation.save()
+        if operation.status in ('completed', 'failed'):
+            # Redelivered after the import already finished
+            return
+        if operation.task_id not in (None, task_id):
+            # A late redelivery of a task that resume_stale_imports replaced
+            raise ImportSuperseded(f"Import {operation_id} was taken over by task {operation.task_id}")
+
+        set_progress(operation_id, {'status': 'processing', 'progress': 0, 'message': 'Starting import...'}, force=True)
+        start_operation(operation)
         
-        user_id = operation.user_id
         filename = operation.input_file.name
+        reader = get_format(filename)
+        data_start, fieldnames = reader.read_header()
 
-        file_size = default_storage.size(filename)
-        
-        with default_storage.open(filename, 'rb') as f:
-            text_file = io.TextIOWrapper(f, encoding='utf-8')
-            
-            # Wrapper to track bytes read
-            processed_bytes = 0
-            def progress_wrapper(file_obj):
-                nonlocal processed_bytes
-                for line in file_obj:
-                    processed_bytes += len(line.encode('utf-8'))
-                    yield line
-
-            reader = csv.DictReader(progress_wrapper(text_file))
-            
-            chunk_size = 5000
-            chunk_map = {}
-            rows_read = 0
-            
-            for row in reader:
-                sku = row.get('sku', '').strip()
-                name = row.get('name', '').strip()
-                description = row.get('description', '').strip()
-                
-                if not sku:
-                    continue
-                
-                sku = sku.lower()
-                
-                product = Product(
-                    user_id=user_id,
-                    sku=sku,
-                    name=name,
-                    description=description,
-                    is_active=True
-                )
-                # Deduplicate within chunk: overwrite existing SKU with latest version
-                chunk_map[sku] = product
-                rows_read += 1
+        if not operation.checkpoints:
+            # First run: plan the ranges once and persist them, so a resumed
+            # import keeps the same ranges even if settings change.
+            heartbeat = _heartbeat_every(operation_id, task_id)
+            if reader.seekable:
+                ranges = _plan_shards(reader, data_start, reader.data_end(), heartbeat)
+            else:
+                ranges = [(data_start, reader.data_end())]
+            if len(ranges) > 1:
+                # Index the whole file up front, so a SKU repeated in two shards
+                # is collapsed to its last row like any other duplicate
+                ranges = _save_sku_index(operation, heartbeat, reader, fieldnames, ranges)
+            operation.checkpoints = _save_plan(operation, task_id, ranges)
+        elif operation.rows_committed:
+            logger.info(f"Resuming import {operation_id} after {operation.rows_committed} committed rows")
 
-                # Flush if chunk is full
-                if len(chunk_map) >= chunk_size:
-                    _process_chunk(list(chunk_map.values()))
-                    chunk_map = {}
-                
-                # Update progress in Cache only
-                if rows_read % 1000 == 0:
-                    progress = int((processed_bytes / file_size) * 100) if file_size > 0 else 0
-                    cache.set(cache_key, {'status': 'processing', 'progress': progress, 'message': f'Processed {rows_read} records...'}, timeout=3600)
-
-            # Process remaining
-            if chunk_map:
-                _process_chunk(list(chunk_map.values()))
-
-            # Update Cache -> Complete
-            cache.set(cache_key, {'status': 'complete', 'progress': 100, 'message': 'Import complete!'}, timeout=3600)
-            
-            # Update DB Status -> Completed
-            operation.status = 'completed'
-            operation.save()
-            
-            # Trigger Webhook
-            send_webhook_notification.delay(user_id, 'import.completed', {'rows_processed': rows_read})
-            
+        committed = reader.progress_at(data_start) + sum(
+            reader.progress_at(cp['offset']) - reader.progress_at(int(start))
+            for start, cp in operation.checkpoints.items()
+        )
+        pending = [
+            (int(start), cp['end'])
+            for start, cp in operation.checkpoints.items()
+            if cp['end'] is None or cp['offset'] < cp['end']
+        ]
+        progress_total = reader.progress_total()
+
+        # Progress and row counters shared by every shard of this import
+        reset_counters(operation_id, progress=committed, rows=operation.rows_committed)
+
+        if len(pending) <= 1:
+            for start, end in pending:
+                _import_range(operation, task_id, fieldnames, start, end, progress_total)
+            _complete_import(operation)
+            return
+
+        # Coordinator mode: fan the byte ranges out to the worker pool and let
+        # the chord callback finish the operation once every shard is done.
+        logger.info(f"Splitting import {operation_id} into {len(pending)} shards")
+        chord(
+            import_csv_shard.s(operation_id, task_id, fieldnames, start, end, progress_total)
+            for start, end in pending
+        )(finish_csv_import.s(operation_id, task_id))
+        _mark_dispatched(operation_id, task_id, pending)
+
+    except ImportSuperseded as e:
+        logger.warning(str(e))
     except Exception as e:
         logger.error(f"Error processing CSV import: {str(e)}")
-        cache.set(cache_key, {'status': 'failed', 'progress': 0, 'message': str(e)}, timeout=3600)
-        
-        if 'operation' in locals():
-            operation.status = 'failed'
-            operation.save()
-
-def _process_chunk(chunk):
-    # Upsert logic using bulk_create with conflict handling
-    Product.objects.bulk_create(
-        chunk,
-        update_conflicts=True,
-        unique_fields=['user', 'sku'],
-        update_fields=['name', 'description', 'is_active', 'updated_at']
+        _fail_import(operation_id, e)
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def import_csv_shard(self, operation_id, task_id, fieldnames, start, end, progress_total):
+    try:
+        operation = BulkOperation.objects.get(pk=operation_id)
+        if operation.status == 'failed':
+            # Another shard already failed the import, don't waste the work
+            return 0
+        operation = _start_shard(operation_id, task_id, start)
+        return _import_range(operation, task_id, fieldnames, start, end, progress_total)
+    except ImportSuperseded as e:
+        logger.warning(str(e))
+        # Stop the stale chord; the resumed import runs its own
+        raise Ignore()
+    except Exception as e:
+        logger.error(f"Error processing CSV import shard {start}-{end}: {str(e)}")
+        _fail_import(operation_id, e)
+        # Re-raise so the chord never runs finish_csv_import
+        raise
+
+@shared_task
+def finish_csv_import(shard_rows, operation_id, task_id):
+    operation = BulkOperation.objects.get(pk=operation_id)
+    if operation.status == 'failed' or operation.task_id not in (None, task_id):
+        return
+    _complete_import(operation)
+
+@shared_task
+def resume_stale_imports():
+    """Re-queue imports whose worker died without finishing them.
+
+    A running import bumps ``BulkOperation.updated_at`` at least every
+    PRODUCT_IMPORT_HEARTBEAT_SECONDS (see ``_heartbeat``), so one that hasn't
+    for PRODUCT_IMPORT_STALE_SECONDS has lost its task. It gets a new task
+    id, which also fences off any stale task that turns up later, and
+    resumes from its checkpoints. Pending imports are still queued and are
+    left alone, however long the queue is, and so are sharded imports whose
+    unfinished shards are all still queued (see ``_shards_queued``).
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.PRODUCT_IMPORT_STALE_SECONDS)
+    with transaction.atomic():
+        stale = BulkOperation.objects.select_for_update(skip_locked=True).filter(
+            operation_type='import',
+            status='processing',
+            updated_at__lt=cutoff
+        )
+        for operation in stale:
+            if _shards_queued(operation):
+                continue
+            old_task_id = operation.task_id
+            operation.task_id = str(uuid.uuid4())
+            operation.save(update_fields=['task_id', 'updated_at'])
+            transaction.on_commit(partial(
+                process_csv_import.apply_async, args=[operation.pk], task_id=operation.task_id
+            ))
+            logger.warning(f"Resuming stale import {operation.pk} (task {old_task_id}) as task {operation.task_id}")
+
+@shared_task
+def expire_upload_sessions():
+    """Abort chunked uploads that have not progressed for PRODUCT_UPLOAD_EXPIRY_SECONDS."""
+    cutoff = timezone.now() - timedelta(seconds=settings.PRODUCT_UPLOAD_EXPIRY_SECONDS)
+    for session in UploadSession.objects.filter(status='uploading', updated_at__lt=cutoff):
+        try:
+            uploads.abort(session)
+        except Exception as e:
+            logger.error(f"Failed to abort upload session {session.pk}: {str(e)}")
+            continue
+        session.status = 'aborted'
+        session.save(update_fields=['status', 'updated_at'])
+
+def _plan_shards(reader, data_start, file_size, heartbeat):
+    """Split the body of an uncompressed CSV or NDJSON file into ``(start, end)`` byte ranges for parallel import.
+
+    Boundaries are moved forward to the start of the next line. A CSV line
+    can be inside a quoted multi-line field, which ``_save_sku_index``
+    checks for when it reads the file.
+    """
+    body_size = file_size - data_start
+    shard_count = min(settings.PRODUCT_IMPORT_MAX_SHARDS, body_size // settings.PRODUCT_IMPORT_SHARD_BYTES)
+    if shard_count <= 1:
+        return [(data_start, file_size)]
+
+    step = body_size // shard_count
+    boundaries = [data_start]
+    with default_storage.open(reader.name, 'rb') as f:
+        for i in range(1, shard_count):
+            f.seek(data_start + i * step - 1)
+            reader.skip_line(f)
+            heartbeat()
+            position = f.tell()
+            if boundaries[-1] < position < file_size:
+                boundaries.append(position)
+    boundaries.append(file_size)
+    return list(zip(boundaries, boundaries[1:]))
+
+def _heartbeat_every(operation_id, task_id):
+    """Return a function that calls ``_heartbeat`` at most every PRODUCT_IMPORT_HEARTBEAT_SECONDS."""
+    heartbeat_at = time.monotonic()
+
+    def heartbeat():
+        nonlocal heartbeat_at
+        if time.monotonic() - heartbeat_at >= settings.PRODUCT_IMPORT_HEARTBEAT_SECONDS:
+            _heartbeat(operation_id, task_id)
+            heartbeat_at = time.monotonic()
+    return heartbeat
+
+def _index_skus(reader, fieldnames, start, end, heartbeat):
+    """First pass: find the last occurrence of every SKU in ``[start, end)``. Returns a ``SkuIndex``."""
+    sku_index = SkuIndex(reader.size_hint(start, end))
+    for _, records in reader.batches(fieldnames, start, end):
+        for record_start, _, _, sku, _, _ in records:
+            if sku:
+                sku_index.add(sku, record_start)
+        heartbeat()
+    return sku_index
+
+def _save_sku_index(operation, heartbeat, reader, fieldnames, ranges):
+    """Index the SKUs of the whole file into ``operation.sku_index_file``, for a sharded import.
+
+    The same pass checks that no record spans a boundary between
+    ``ranges``. Returns ``ranges``, or the whole body as one range if a
+    multi-line record does; the index still spares that range its own
+    first pass. The caller saves ``operation``.
+    """
+    data_start, data_end = ranges[0][0], ranges[-1][1]
+    boundaries = iter(start for start, _ in ranges[1:])
+    boundary = next(boundaries)
+    split = False
+    with SkuIndex(reader.size_hint(data_start, data_end)) as sku_index:
+        for _, records in reader.batches(fieldnames, data_start, data_end):
+            for record_start, next_position, _, sku, _, _ in records:
+                if sku:
+                    sku_index.add(sku, record_start)
+                while boundary is not None and boundary <= record_start:
+                    boundary = next(boundaries, None)
+                if boundary is not None and boundary < next_position:
+                    split = True
+            heartbeat()
+        with tempfile.TemporaryFile() as tmp:
+            sku_index.save(tmp)
+            tmp.seek(0)
+            operation.sku_index_file.save(f'{operation.pk}.skus', File(tmp), save=False)
+
+    if split:
+        logger.info(f"Not sharding {reader.name}: a multi-line record spans a shard boundary")
+        return [(data_start, data_end)]
+    return ranges
+
+def _save_plan(operation, task_id, ranges):
+    """Save the checkpoints of newly planned ``ranges``, with the SKU index if there is one. Returns the checkpoints."""
+    checkpoints = {
+        str(start): {'end': end, 'offset': start, 'lines': 0}
+        for start, end in ranges
+    }
+    try:
+        with transaction.atomic():
+            locked = _lock_operation(operation.pk, task_id)
+            locked.checkpoints = checkpoints
+            locked.sku_index_file = operation.sku_index_file.name
+            locked.save(update_fields=['checkpoints', 'sku_index_file', 'updated_at'])
+    except ImportSuperseded:
+        # The task that took over plans its own ranges and index
+        if operation.sku_index_file:
+            operation.sku_index_file.delete(save=False)
+        raise
+    return checkpoints
+
+def _mark_dispatched(operation_id, task_id, pending):
+    """Record that the shards of ``pending`` ranges were queued by ``task_id`` (see ``_shards_queued``)."""
+    with transaction.atomic():
+        operation = _lock_operation(operation_id, task_id)
+        for start, _ in pending:
+            operation.checkpoints[str(start)]['dispatched'] = task_id
+        operation.save(update_fields=['checkpoints', 'updated_at'])
+
+def _start_shard(operation_id, task_id, start):
+    """Record that the shard of the range at ``start`` is running. Returns the operation."""
+    with transaction.atomic():
+        operation = _lock_operation(operation_id, task_id)
+        operation.checkpoints[str(start)]['started'] = task_id
+        operation.save(update_fields=['checkpoints', 'updated_at'])
+    return operation
+
+def _shards_queued(operation):
+    """Whether every unfinished range of ``operation`` is a shard still waiting in the queue.
+
+    Queued shards don't heartbeat, so while the ``bulk`` queue is busy a
+    sharded import can go quiet for longer than PRODUCT_IMPORT_STALE_SECONDS
+    without having lost anything. Resuming it would fence off the queued
+    shards and queue new ones behind them.
+    """
+    unfinished = [
+        cp for cp in operation.checkpoints.values()
+        if cp['end'] is None or cp['offset'] < cp['end']
+    ]
+    return bool(unfinished) and all(
+        cp.get('dispatched') and cp.get('started') != cp['dispatched'] for cp in unfinished
     )
 
-@shared_task(bind=True)
-def delete_all_products(self, operation_id):
-    task_id = self.request.id
-    cache_key = f'delete_progress_{task_id}'
+def _delete_sku_index(operation):
+    if operation.sku_index_file:
+        operation.sku_index_file.delete(save=False)
+        operation.save(update_fields=['sku_index_file', 'updated_at'])
+
+def _import_range(operation, task_id, fieldnames, start, end, progress_total):
+    """Upsert every record that starts inside ``[start, end)`` (see ``products.readers``).
+
+    Only the last row for each SKU is written ("last row wins"), no matter
+    how many chunks apart the duplicates are. A first pass over the range
+    indexes the SKUs, unless the import is sharded, in which case the index
+    of the whole file is loaded from ``operation.sku_index_file``. Reading resumes from the range's checkpoint,
+    and a new checkpoint is saved in the same transaction as every committed
+    chunk. Rows that fail validation are left out and reported (see
+    ``products.validation``). ``end`` is None for a compressed file, which is
+    read to its end. Returns the number of rows read by this call.
+    """
+    reader = get_format(operation.input_file.name)
+    checkpoint = operation.checkpoints[str(start)]
+    offset = checkpoint['offset']
+    first_line = checkpoint.get('lines', 0)
+
+    heartbeat = _heartbeat_every(operation.pk, task_id)
+    if operation.sku_index_file:
+        with operation.sku_index_file.open('rb') as f:
+            sku_index = SkuIndex.load(f)
+    else:
+        sku_index = _index_skus(reader, fieldnames, offset, end, heartbeat)
+
+    chunk = []
+    chunks_pending = 0
+    rows_read = 0
+    rows_checkpointed = 0
+    duplicates = 0
+    duplicates_checkpointed = 0
+    rejected = []
+    segment_start = offset
+    position = offset
+    line = first_line
+    reported_progress = reader.progress_at(offset)
+    reported_rows = 0
+
+    def commit(position, final=False):
+        nonlocal chunk, chunks_pending, rows_checkpointed, duplicates_checkpointed, rejected, segment_start
+        with transaction.atomic():
+            if chunk:
+                valid, chunk_rejected = validate_rows(chunk)
+                rejected.extend(chunk_rejected)
+                # Sorting keeps row locks in the same order across shards so
+                # parallel upserts can't deadlock.
+                importer.write(sorted(valid))
+                chunks_pending += 1
+            if final or chunks_pending >= importer.checkpoint_every:
+                importer.flush()
+                if rejected:
+                    save_part(operation.pk, start, segment_start, rejected)
+                _save_checkpoint(operation.pk, task_id, start, position, line, final, {
+                    # Collapsed duplicates and rejected rows were read but not written
+                    'rows_committed': (
+                        rows_read - rows_checkpointed - (duplicates - duplicates_checkpointed) - len(rejected)
+                    ),
+                    'rows_rejected': len(rejected),
+                    'duplicates_collapsed': duplicates - duplicates_checkpointed,
+                    'chunks_committed': chunks_pending,
+                    **importer.pop_stats(),
+                })
+                rows_checkpointed = rows_read
+                duplicates_checkpointed = duplicates
+                chunks_pending = 0
+                rejected = []
+                segment_start = position
+        chunk = []
+
+    with sku_index, get_importer(operation) as importer:
+        for progress, records in reader.batches(fieldnames, offset, end, first_line):
+            for record_start, position, line, sku, name, description in records:
+                rows_read += 1
+                if not sku or sku_index.is_last(sku, record_start):
+                    chunk.append((sku, name, description, line, record_start if reader.byte_positions else ''))
+                else:
+                    # A later row for the same SKU replaces this one
+                    duplicates += 1
+
+                # Flush if chunk is full
+                if len(chunk) >= IMPORT_CHUNK_SIZE:
+                    commit(position)
+
+            # Update progress in Cache only
+            _report_import_progress(operation.pk, progress_total, progress - reported_progress, rows_read - reported_rows)
+            reported_progress, reported_rows = progress, rows_read
+            heartbeat()
+
+        # Process remaining and mark the range done
+        commit(position if end is None else end, final=True)
+
+    if end is not None:
+        _report_import_progress(
+            operation.pk, progress_total, reader.progress_at(end) - reported_progress, rows_read - reported_rows
+        )
+    return rows_read
+
+def _heartbeat(operation_id, task_id):
+    """Bump ``updated_at`` so ``resume_stale_imports`` sees the import is alive, unless another task took it over."""
+    alive = BulkOperation.objects.filter(Q(task_id=task_id) | Q(task_id__isnull=True), pk=operation_id).update(
+        updated_at=timezone.now()
+    )
+    if not alive:
+        raise ImportSuperseded(f"Import {operation_id} was taken over by another task")
+
+def _lock_operation(operation_id, task_id):
+    """Lock and return the operation, unless another task took it over.
+
+    Locking keeps parallel shards from overwriting each other's
+    checkpoints. Must run inside a transaction.
+    """
+    operation = BulkOperation.objects.select_for_update().get(pk=operation_id)
+    if operation.task_id not in (None, task_id):
+        raise ImportSuperseded(f"Import {operation_id} was taken over by task {operation.task_id}")
+    return operation
+
+def _save_checkpoint(operation_id, task_id, start, offset, line, final, counts):
+    # Must run inside the chunk's transaction
+    operation = _lock_operation(operation_id, task_id)
+
+    operation.checkpoints[str(start)].update(offset=offset, lines=line)
+    if final:
+        # A compressed file's range only gets its end once it has been read
+        operation.checkpoints[str(start)]['end'] = offset
+    for field, value in counts.items():
+        setattr(operation, field, getattr(operation, field) + value)
+    if operation.rows_rejected > settings.PRODUCT_IMPORT_ERROR_BUDGET:
+        # Rolls back this chunk too; the import is failed by the caller
+        raise ImportErrorBudgetExceeded(
+            f"Import aborted: more than {settings.PRODUCT_IMPORT_ERROR_BUDGET} rows were rejected"
+        )
+    operation.save(update_fields=['checkpoints', *counts, 'updated_at'])
+
+def _report_import_progress(operation_id, progress_total, progress_delta, rows_delta):
+    totals = incr_counters(operation_id, progress=progress_delta, rows=rows_delta)
+    # Hold at 99% until the operation is marked complete
+    progress = min(99, int((totals['progress'] / progress_total) * 100)) if progress_total > 0 else 0
+    set_progress(operation_id, {'status': 'processing', 'progress': progress, 'message': f'Processed {totals["rows"]} records...'})
+
+def _complete_import(operation):
+    operation.refresh_from_db(fields=[*IMPORT_COUNT_FIELDS, 'checkpoints', 'sku_index_file'])
+    errors = _save_error_report(operation)
+    _delete_sku_index(operation)
+
+    message = (
+        f'Import complete! {operation.rows_inserted} inserted, {operation.rows_updated} updated, '
+        f'{operation.rows_unchanged} unchanged.'
+    )
+    if operation.duplicates_collapsed:
+        message += f' {operation.duplicates_collapsed} duplicate SKU rows were collapsed.'
+    if operation.rows_rejected:
+        message += f' {operation.rows_rejected} invalid rows were rejected.'
+    # Update DB Status -> Completed
+    finish_operation(operation, 'completed', message, operation.rows_committed, errors=errors)
     
+    # Trigger Webhook
+    enqueue_webhook_notification(operation.user_id, 'import.completed', {
+        'rows_processed': operation.rows_committed,
+        'inserted': operation.rows_inserted,
+        'updated': operation.rows_updated,
+        'unchanged': operation.rows_unchanged,
+        'duplicates_collapsed': operation.duplicates_collapsed,
+        'rejected': operation.rows_rejected,
+    })
+
+def _fail_import(operation_id, error):
+    operation = BulkOperation.objects.get(pk=operation_id)
+    try:
+        errors = _save_error_report(operation)
+    except Exception as e:
+        logger.error(f"Failed to save error report for import {operation_id}: {str(e)}")
+        errors = []
+    try:
+        _delete_sku_index(operation)
+    except Exception as e:
+        logger.error(f"Failed to delete SKU index of import {operation_id}: {str(e)}")
+    finish_operation(operation, 'failed', str(error), operation.rows_committed, errors=[error, *errors])
+
+def _save_error_report(operation):
+    """Merge the rejected-row parts into ``operation.error_file``. Returns a sample of the errors."""
+    first_line = get_format(operation.input_file.name).header_lines + 1
+    errors = merge_parts(operation, ERROR_SAMPLE_SIZE, first_line)
+    if operation.error_file:
+        operation.save(update_fields=['error_file', 'updated_at'])
+    return errors
+
+def filter_products(queryset, filters):
+    """Apply bulk delete ``filters`` (stored in ``BulkOperation.options``) to ``queryset``."""
+    if 'is_active' in filters:
+        queryset = queryset.filter(is_active=filters['is_active'])
+    if filters.get('sku_prefix'):
+        queryset = queryset.filter(sku__startswith=filters['sku_prefix'])
+    if filters.get('created_after'):
+        queryset = queryset.filter(created_at__gte=filters['created_after'])
+    if filters.get('created_before'):
+        queryset = queryset.filter(created_at__lt=filters['created_before'])
+    return queryset
+
+
+# Redelivery after a worker loss is safe: the rerun deletes whatever is left
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def delete_all_products(self, operation_id):
     try:
-        # Update DB Status -> Processing
         operation = BulkOperation.objects.get(pk=operation_id)
-        operation.status = 'processing'
-        operation.save()
+        start_operation(operation)
         
         user_id = operation.user_id
+        products = filter_products(Product.objects.filter(user_id=user_id), operation.options)
         
-        total_count = Product.objects.filter(user_id=user_id).count()
-        cache.set(cache_key, {'status': 'processing', 'progress': 0, 'message': f'Starting deletion of {total_count} products...'}, timeout=3600)
+        total_count = products.count()
+        set_progress(operation_id, {'status': 'processing', 'progress': 0, 'message': f'Starting deletion of {total_count} products...'}, force=True)
 
         deleted_count = 0
-        batch_size = 5000
+        window = settings.PRODUCT_DELETE_WINDOW_SIZE
+        last = 0
         
+        # Page through the user's own ids, in windows of up to `window`
+        # matching products. A window ends at the window-th matching id after
+        # the previous one, looked up on the (user, id) index, and is deleted
+        # with one DELETE ... WHERE user_id = X AND id > last AND id <= bound
+        # AND <filters>, committed on its own. Only that one id passes through
+        # Python and locks are held briefly. Product has no cascades or delete
+        # signals, so Django issues the DELETE directly.
         while True:
-            # Get IDs to delete (using iterator to avoid loading all objects)
-            ids = list(Product.objects.filter(user_id=user_id).values_list('pk', flat=True)[:batch_size])
-            if not ids:
-                break
-            
-            Product.objects.filter(pk__in=ids).delete()
-            deleted_count += len(ids)
-            
-            progress = int((deleted_count / total_count) * 100) if total_count > 0 else 100
+            remaining = products.filter(pk__gt=last)
+            bound = next(iter(remaining.order_by('pk').values_list('pk', flat=True)[window - 1:window]), None)
+            if bound is not None:
+                remaining = remaining.filter(pk__lte=bound)
+            deleted, _ = remaining.delete()
+            deleted_count += deleted
             
-            # Update Cache only
-            cache.set(cache_key, {'status': 'processing', 'progress': progress, 'message': f'Deleted {deleted_count} of {total_count} products...'}, timeout=3600)
+            progress = min(int((deleted_count / total_count) * 100), 99) if total_count > 0 else 99
             
-        # Update Cache -> Complete
-        cache.set(cache_key, {'status': 'complete', 'progress': 100, 'message': 'Deletion complete!'}, timeout=3600)
-        
+            # Update Redis only
+            set_progress(operation_id, {'status': 'processing', 'progress': progress, 'message': f'Deleted {deleted_count} of {total_count} products...'})
+            if bound is None:
+                break
+            last = bound
+
         # Update DB Status -> Completed
-        operation.status = 'completed'
-        operation.save()
+        operation.rows_committed = deleted_count
+        operation.save(update_fields=['rows_committed', 'updated_at'])
+        finish_operation(operation, 'completed', f'Deletion complete! {deleted_count} products deleted.', deleted_count)
         
         # Trigger Webhook
-        send_webhook_notification.delay(user_id, 'bulk_delete.completed', {'deleted_count': deleted_count})
+        enqueue_webhook_notification(user_id, 'bulk_delete.completed', {
+            'deleted_count': deleted_count,
+            'filters': operation.options
+        })
 
     except Exception as e:
         logger.error(f"Error deleting products: {str(e)}")
-        cache.set(cache_key, {'status': 'failed', 'progress': 0, 'message': str(e)}, timeout=3600)
-        
+
+        if 'operation' in locals():
+            finish_operation(operation, 'failed', str(e), operation.rows_committed, errors=[e])
+        raise e
+
+
+# Redelivery after a worker loss is safe: the rerun writes the file from scratch
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def export_products(self, operation_id):
+    try:
+        operation = BulkOperation.objects.get(pk=operation_id)
+        start_operation(operation)
+
+        user_id = operation.user_id
+        export_format = operation.options.get('format', 'csv')
+        compress = operation.options.get('gzip', False)
+
+        total_count = Product.objects.filter(user_id=user_id).count()
+        set_progress(operation_id, {'status': 'processing', 'progress': 0, 'message': f'Starting export of {total_count} products...'}, force=True)
+
+        # iterator() reads through a server-side cursor on PostgreSQL, so only
+        # one chunk of rows is in memory at a time. The file is spooled to the
+        # worker's disk, then handed to default_storage.
+        rows = Product.objects.filter(user_id=user_id).order_by('pk').values_list(*EXPORT_FIELDS).iterator(
+            chunk_size=EXPORT_CHUNK_SIZE
+        )
+        exported_count = 0
+        with tempfile.TemporaryFile() as tmp:
+            raw = gzip.GzipFile(fileobj=tmp, mode='wb') if compress else tmp
+            text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+            exporter = EXPORTERS[export_format](text)
+
+            while True:
+                chunk = list(itertools.islice(rows, EXPORT_CHUNK_SIZE))
+                if not chunk:
+                    break
+                exporter.write(chunk)
+                exported_count += len(chunk)
+
+                progress = min(int((exported_count / total_count) * 100), 99) if total_count > 0 else 99
+                set_progress(operation_id, {'status': 'processing', 'progress': progress, 'message': f'Exported {exported_count} of {total_count} products...'})
+
+            text.flush()
+            text.detach()
+            if compress:
+                raw.close()
+            tmp.seek(0)
+
+            filename = f'products-{operation.pk}.{exporter.extension}' + ('.gz' if compress else '')
+            # A redelivered task replaces the earlier run's file instead of
+            # saving a renamed copy next to it
+            name = operation.output_file.field.generate_filename(operation, filename)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            operation.output_file.save(filename, File(tmp), save=False)
+
+        # Update DB Status -> Completed
+        operation.rows_committed = exported_count
+        operation.save(update_fields=['output_file', 'rows_committed', 'updated_at'])
+        finish_operation(operation, 'completed', f'Export complete! {exported_count} products exported.', exported_count)
+
+        # Trigger Webhook
+        enqueue_webhook_notification(user_id, 'export.completed', {
+            'rows_exported': exported_count,
+            'format': export_format,
+            'gzip': compress
+        })
+
+    except Exception as e:
+        logger.error(f"Error exporting products: {str(e)}")
+
         if 'operation' in locals():
-            operation.status = 'failed'
-            operation.save()
+            finish_operation(operation, 'failed', str(e), operation.rows_committed, errors=[e])
         raise e
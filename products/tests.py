@@ -1,3 +1,1007 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import io
+import time
+import json
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.conf import settings
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from acme_project.testing import ServicesTestMixin
+
+from .exporters import EXPORT_FIELDS
+from .importers import CopyImporter, OrmImporter, get_importer
+from .models import ApiKey, BulkOperation, Product, UploadSession, import_upload_to
+from .readers import ArrowFormat, CsvFormat, NdjsonFormat, ParquetFormat, UnsupportedFormat, get_format
+from .progress import STREAM_LEASE_SECONDS, close_stream, open_stream, refresh_stream
+from .streaming import progress_stream_app
+from .tasks import ImportSuperseded, _save_plan, process_csv_import, resume_stale_imports
+
+NEWLINES = {'lf': '\n', 'crlf': '\r\n', 'cr': '\r'}
+ROWS = [
+    ('S1', 'One', 'plain'),
+    ('s2 ', ' Two ', 'two{newline}lines'),
+    ('S3', 'Three, quoted', ''),
+]
+
+
+class ReaderNewlineTests(SimpleTestCase):
+    """Text formats read the same records whether lines end in LF, CRLF or a bare CR."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def save(self, suffix, text):
+        data = text.encode('utf-8')
+        if suffix.endswith('.gz'):
+            data = gzip.compress(data)
+        return get_format(default_storage.save(import_upload_to(None, f'a{suffix}'), ContentFile(data)))
+
+    def csv_text(self, newline):
+        lines = ['sku,name,description']
+        for sku, name, description in ROWS:
+            description = description.format(newline=newline)
+            lines.append(f'{sku},"{name}","{description}"')
+        return newline.join(lines) + newline
+
+    def read(self, reader):
+        data_start, fieldnames = reader.read_header()
+        records = [
+            record for _, batch in reader.batches(fieldnames, data_start, reader.data_end()) for record in batch
+        ]
+        return data_start, records
+
+    def test_csv(self):
+        for name, newline in NEWLINES.items():
+            for suffix in ('.csv', '.csv.gz'):
+                with self.subTest(newline=name, suffix=suffix):
+                    text = self.csv_text(newline)
+                    reader = self.save(suffix, text)
+                    data_start, records = self.read(reader)
+
+                    self.assertEqual(data_start, len(f'sku,name,description{newline}'))
+                    self.assertEqual(
+                        [record[3:] for record in records],
+                        [('s1', 'One', 'plain'), ('s2', 'Two', f'two{newline}lines'), ('s3', 'Three, quoted', '')]
+                    )
+                    # Each record ends where the next starts, and the last at the end of the file
+                    self.assertEqual([record[0] for record in records[1:]], [record[1] for record in records[:-1]])
+                    self.assertEqual(records[-1][1], len(text))
+                    self.assertEqual([record[2] for record in records], [1, 3, 4])
+
+    def test_csv_skip_line(self):
+        for name, newline in NEWLINES.items():
+            with self.subTest(newline=name):
+                reader = self.save('.csv', self.csv_text(newline))
+                data_start, records = self.read(reader)
+                with default_storage.open(reader.name, 'rb') as f:
+                    f.seek(data_start + 1)
+                    reader.skip_line(f)
+                    self.assertEqual(f.tell(), records[1][0])
+
+    def test_ndjson(self):
+        for name, newline in NEWLINES.items():
+            for suffix in ('.ndjson', '.ndjson.gz'):
+                with self.subTest(newline=name, suffix=suffix):
+                    text = ''.join(
+                        json.dumps({'sku': sku, 'name': name_, 'description': description}) + newline
+                        for sku, name_, description in ROWS
+                    )
+                    reader = self.save(suffix, text)
+                    _, records = self.read(reader)
+                    self.assertEqual([record[3] for record in records], ['s1', 's2', 's3'])
+                    self.assertEqual(records[-1][1], len(text))
+
+
+class NdjsonFormatTests(SimpleTestCase):
+    LINES = [
+        '{"sku": " A1 ", "name": " Alpha ", "description": "first", "price": 3}',
+        '',
+        '{"sku": "B2", "name": "Bêta"}',
+        '   ',
+        '{"sku": null, "name": "no sku", "description": "x"}',
+        '{"description": "", "name": "", "sku": "D4"}',
+    ]
+    EXPECTED = [('a1', 'Alpha', 'first', 1), ('b2', 'Bêta', '', 3), ('', 'no sku', 'x', 5), ('d4', '', '', 6)]
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def read(self, lines, newline='\n', offset=0, end=None):
+        reader = get_format(default_storage.save('a.ndjson', ContentFile(newline.join(lines).encode('utf-8'))))
+        return [record for _, batch in reader.batches([], offset, end or reader.data_end()) for record in batch]
+
+    def check(self, lines, expected, **kwargs):
+        records = self.read(lines, **kwargs)
+        self.assertEqual([(*record[3:], record[2]) for record in records], expected)
+        return records
+
+    def test_decoders_agree(self):
+        without_pyarrow = mock.patch.object(NdjsonFormat, '_decode_block', staticmethod(NdjsonFormat._decode_lines))
+        for name, newline in NEWLINES.items():
+            with self.subTest(newline=name):
+                records = self.check(self.LINES, self.EXPECTED, newline=newline)
+                with without_pyarrow:
+                    self.assertEqual(self.read(self.LINES, newline=newline), records)
+
+    def test_fallback(self):
+        # read_json refuses a number where it expects a string; the block is decoded line by line
+        lines = ['{"sku": 12, "name": 3.5, "description": true}', *self.LINES]
+        expected = [('12', '3.5', 'True', 1)] + [(*record[:3], record[3] + 1) for record in self.EXPECTED]
+        with mock.patch.object(NdjsonFormat, '_decode_lines', wraps=NdjsonFormat._decode_lines) as decode_lines:
+            self.check(lines, expected)
+        decode_lines.assert_called_once()
+
+    def test_invalid(self):
+        for line, error in [('{"sku": "a"', 'Invalid JSON at byte 22'), ('["a"]', 'Expected a JSON object at byte 22')]:
+            with self.subTest(line=line):
+                with self.assertRaisesMessage(ValueError, error):
+                    self.read(['{"sku": "ok", "n": 1}', line])
+
+    def test_range(self):
+        records = self.read(self.LINES)
+        # Records that start inside [offset, end), with their line numbers within the range
+        self.check(
+            self.LINES, [('b2', 'Bêta', '', 1), ('', 'no sku', 'x', 3)], offset=records[1][0], end=records[2][0] + 1
+        )
+        self.check(self.LINES, [('', 'no sku', 'x', 1), ('d4', '', '', 2)], offset=records[2][0])
+
+class ReaderFormatTests(ServicesTestMixin, SimpleTestCase):
+    """Each format maps its columns to ``(sku, name, description)`` the same way."""
+    EXPECTED = [('a1', 'Alpha', 'first'), ('b2', 'Beta', ''), ('', 'No SKU', 'x')]
+
+    def save(self, name, data):
+        return get_format(default_storage.save(name, ContentFile(data)))
+
+    def read(self, reader, offset=None, end=None):
+        data_start, fieldnames = reader.read_header()
+        batches = reader.batches(fieldnames, data_start if offset is None else offset, end or reader.data_end())
+        return [record for _, batch in batches for record in batch]
+
+    def csv_data(self):
+        # Columns out of order, an unknown one, a short row and a blank line
+        return b'name,extra,sku,description\n Alpha ,1, A1 ,first\nBeta,2,B2\n\nNo SKU,3,,x\n'
+
+    def test_csv(self):
+        reader = self.save('a.csv', self.csv_data())
+        header = 'name,extra,sku,description\n'
+        self.assertEqual(reader.read_header(), (len(header), header.strip().split(',')))
+        records = self.read(reader)
+        self.assertEqual([record[3:] for record in records], self.EXPECTED)
+        self.assertEqual([record[2] for record in records], [1, 2, 4])
+
+    def test_csv_missing_column(self):
+        records = self.read(self.save('a.csv', b'sku,name\nA1,Alpha\n'))
+        self.assertEqual([record[3:] for record in records], [('a1', 'Alpha', '')])
+
+    def test_compressed(self):
+        import zstandard
+
+        data = self.csv_data()
+        for suffix, compressed in [('.csv.gz', gzip.compress(data)), ('.csv.zst', zstandard.compress(data))]:
+            with self.subTest(suffix=suffix):
+                reader = self.save(f'a{suffix}', compressed)
+                self.assertFalse(reader.seekable)
+                self.assertIsNone(reader.data_end())
+                records = self.read(reader)
+                self.assertEqual([record[3:] for record in records], self.EXPECTED)
+                # Positions are offsets into the decompressed text
+                self.assertEqual(records[-1][1], len(data))
+                # Resuming decompresses from the start and skips to the checkpoint
+                self.assertEqual([record[3:] for record in self.read(reader, records[1][0])], self.EXPECTED[1:])
+
+        text = '{"sku": "A1", "name": "Alpha"}\n{"sku": "B2"}\n'
+        reader = self.save('a.ndjson.zst', zstandard.compress(text.encode('utf-8')))
+        self.assertEqual([record[3:] for record in self.read(reader)], [('a1', 'Alpha', ''), ('b2', '', '')])
+
+    COLUMNAR_EXPECTED = [('a1', 'Alpha', ''), ('b2', 'Beta', ''), ('', 'No SKU', '')]
+
+    def columnar_table(self):
+        import pyarrow as pa
+
+        # Columns out of order, a non-string one, nulls and no description column
+        return pa.table({
+            'name': [' Alpha ', 'Beta', 'No SKU'],
+            'count': [1, 2, 3],
+            'sku': pa.array([' A1 ', 'B2', None]),
+        })
+
+    def test_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        f = io.BytesIO()
+        pq.write_table(self.columnar_table(), f, row_group_size=2)
+        reader = self.save('a.parquet', f.getvalue())
+        self.assertEqual(reader.read_header(), (0, []))
+        self.assertEqual(reader.data_end(), 3)
+        records = self.read(reader)
+        self.assertEqual([record[3:] for record in records], self.COLUMNAR_EXPECTED)
+        # Positions are row numbers; resuming skips whole row groups
+        self.assertEqual([record[:3] for record in records], [(0, 1, 1), (1, 2, 2), (2, 3, 3)])
+        self.assertEqual([record[3] for record in self.read(reader, 2)], [''])
+        self.assertEqual([record[3] for record in self.read(reader, 1, 2)], ['b2'])
+
+        f = io.BytesIO()
+        pq.write_table(pa.table({'sku': [12, 13], 'name': ['x', None], 'description': [1.5, None]}), f)
+        records = self.read(self.save('b.parquet', f.getvalue()))
+        self.assertEqual([record[3:] for record in records], [('12', 'x', '1.5'), ('13', '', '')])
+
+    def test_arrow(self):
+        import pyarrow as pa
+
+        table = self.columnar_table()
+        f = io.BytesIO()
+        with pa.ipc.new_file(f, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=2):
+                writer.write_batch(batch)
+        reader = self.save('a.arrow', f.getvalue())
+        self.assertEqual(reader.data_end(), 3)
+        records = self.read(reader)
+        self.assertEqual([record[3:] for record in records], self.COLUMNAR_EXPECTED)
+        self.assertEqual([record[3] for record in self.read(reader, 1)], ['b2', ''])
+
+    def test_get_format(self):
+        for name, reader_class in [
+            ('a.csv', CsvFormat), ('A.CSV.GZ', CsvFormat), ('a.csv.zst', CsvFormat), ('a.ndjson', NdjsonFormat),
+            ('a.ndjson.gz', NdjsonFormat), ('a.parquet', ParquetFormat), ('a.arrow', ArrowFormat),
+        ]:
+            with self.subTest(name=name):
+                self.assertIsInstance(get_format(name), reader_class)
+
+        for name in ('a.xlsx', 'a.json', 'a.gz', 'csv', ''):
+            with self.subTest(name=name):
+                with self.assertRaisesMessage(UnsupportedFormat, 'Invalid file format. Please upload one of: .csv,'):
+                    get_format(name)
+
+        with mock.patch('products.readers.importlib.util.find_spec', return_value=None):
+            with self.assertRaisesMessage(UnsupportedFormat, 'the pyarrow package is not installed'):
+                get_format('a.parquet')
+            with self.assertRaisesMessage(UnsupportedFormat, 'the zstandard package is not installed'):
+                get_format('a.csv.zst')
+            self.assertIsInstance(get_format('a.ndjson'), NdjsonFormat)
+
+class ImportTestMixin(ServicesTestMixin):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('importer', password='secret')
+
+    def run_import(self, text, engine='orm', filename='products.csv'):
+        name = default_storage.save(import_upload_to(None, filename), ContentFile(text.encode('utf-8')))
+        operation = BulkOperation.objects.create(
+            user=self.user, operation_type='import', engine=engine, input_file=name
+        )
+        process_csv_import.apply(args=[operation.pk])
+        operation.refresh_from_db()
+        return operation
+
+    def counts(self, operation):
+        return operation.rows_inserted, operation.rows_updated, operation.rows_unchanged
+
+
+class ImporterTests(ImportTestMixin, TestCase):
+    FIRST = 'sku,name,description\nA1,Alpha,first\nB2,Beta,second\nC3,Gamma,third\n'
+    # B2 changed, D4 is new
+    SECOND = 'sku,name,description\nA1,Alpha,first\nB2,Beta,changed\nC3,Gamma,third\nD4,Delta,fourth\n'
+
+    def reimport(self, engine):
+        operation = self.run_import(self.FIRST, engine)
+        self.assertEqual(operation.status, 'completed', operation.summary)
+        self.assertEqual(self.counts(operation), (3, 0, 0))
+
+        operation = self.run_import(self.SECOND, engine)
+        self.assertEqual(operation.status, 'completed', operation.summary)
+        self.assertEqual(self.counts(operation), (1, 1, 2))
+        self.assertEqual(operation.rows_committed, 4)
+        self.assertEqual(
+            dict(Product.objects.filter(user=self.user).values_list('sku', 'description')),
+            {'a1': 'first', 'b2': 'changed', 'c3': 'third', 'd4': 'fourth'}
+        )
+
+    def test_reimport_orm(self):
+        self.reimport('orm')
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY needs PostgreSQL')
+    def test_reimport_copy(self):
+        self.reimport('copy')
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY needs PostgreSQL')
+    def test_copy_skips_unchanged_rows(self):
+        self.run_import(self.FIRST, 'copy')
+        earlier = timezone.now() - timedelta(days=1)
+        Product.objects.filter(user=self.user).update(updated_at=earlier)
+
+        self.run_import(self.SECOND, 'copy')
+        # The ON CONFLICT ... WHERE content_hash IS DISTINCT FROM clause left A1 and C3 alone
+        self.assertEqual(
+            set(Product.objects.filter(user=self.user, updated_at=earlier).values_list('sku', flat=True)),
+            {'a1', 'c3'}
+        )
+
+    def test_get_importer(self):
+        operation = BulkOperation(user=self.user, operation_type='import', engine='orm')
+        self.assertIsInstance(get_importer(operation), OrmImporter)
+        operation.engine = 'copy'
+        with mock.patch('products.importers.connection') as conn:
+            conn.vendor = 'postgresql'
+            self.assertIsInstance(get_importer(operation), CopyImporter)
+            conn.vendor = 'sqlite'
+            self.assertIsInstance(get_importer(operation), OrmImporter)
+
+
+@override_settings(PRODUCT_IMPORT_SHARD_BYTES=100, PRODUCT_IMPORT_MAX_SHARDS=2)
+class ShardedImportTests(ImportTestMixin, TestCase):
+    def test_sharded(self):
+        rows = ''.join(f'S{i},Name {i},Description {i}\n' for i in range(20))
+        operation = self.run_import('sku,name,description\n' + rows)
+        self.assertEqual(operation.status, 'completed', operation.summary)
+        self.assertEqual(len(operation.checkpoints), 2)
+        self.assertEqual(operation.rows_inserted, 20)
+        self.assertEqual(Product.objects.filter(user=self.user).count(), 20)
+
+    def test_record_spanning_boundary(self):
+        # The quoted description covers the middle of the body, where the shard boundary falls
+        description = '\n'.join(f'line {i}' for i in range(30))
+        text = f'sku,name,description\nS1,One,plain\nS2,Two,"{description}"\nS3,Three,plain\n'
+        operation = self.run_import(text)
+        self.assertEqual(operation.status, 'completed', operation.summary)
+        self.assertEqual(len(operation.checkpoints), 1)
+        self.assertEqual(operation.rows_inserted, 3)
+        self.assertEqual(Product.objects.get(user=self.user, sku='s2').description, description)
+
+
+class ResumeImportTests(ImportTestMixin, TestCase):
+    TEXT = 'sku,name,description\nA1,One,x\nB2,Two,x\nC3,Three,x\nD4,Four,x\n'
+
+    def operation(self, checkpoints, **fields):
+        name = default_storage.save(import_upload_to(None, 'products.csv'), ContentFile(self.TEXT.encode('utf-8')))
+        operation = BulkOperation.objects.create(
+            user=self.user, operation_type='import', input_file=name, status='processing',
+            checkpoints=checkpoints, task_id='lost', **fields
+        )
+        BulkOperation.objects.filter(pk=operation.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        return operation
+
+    def test_resume_from_checkpoint(self):
+        data_start = len('sku,name,description\n')
+        third = self.TEXT.index('C3')
+        operation = self.operation(
+            {str(data_start): {'end': len(self.TEXT), 'offset': third, 'lines': 2}},
+            rows_committed=2, rows_inserted=2
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            resume_stale_imports()
+
+        operation.refresh_from_db()
+        self.assertNotEqual(operation.task_id, 'lost')
+        self.assertEqual(operation.status, 'completed', operation.summary)
+        self.assertEqual((operation.rows_committed, operation.rows_inserted), (4, 4))
+        # The rows before the checkpoint were not read again
+        self.assertEqual(set(Product.objects.filter(user=self.user).values_list('sku', flat=True)), {'c3', 'd4'})
+
+    def test_queued_shards_are_not_resumed(self):
+        middle = self.TEXT.index('C3')
+        checkpoints = {
+            '21': {'end': middle, 'offset': 21, 'lines': 0, 'dispatched': 'lost'},
+            str(middle): {'end': len(self.TEXT), 'offset': middle, 'lines': 0, 'dispatched': 'lost'},
+        }
+        operation = self.operation(checkpoints)
+        resume_stale_imports()
+        operation.refresh_from_db()
+        self.assertEqual(operation.task_id, 'lost')
+
+        # A shard that started and then went quiet has lost its task
+        checkpoints['21']['started'] = 'lost'
+        BulkOperation.objects.filter(pk=operation.pk).update(checkpoints=checkpoints)
+        with mock.patch.object(process_csv_import, 'apply_async'):
+            resume_stale_imports()
+        operation.refresh_from_db()
+        self.assertNotEqual(operation.task_id, 'lost')
+
+    def test_plan_is_fenced(self):
+        operation = self.operation({})
+        with self.assertRaises(ImportSuperseded):
+            _save_plan(operation, 'stale', [(21, len(self.TEXT))])
+        operation.refresh_from_db()
+        self.assertEqual(operation.checkpoints, {})
+
+
+class DuplicateSkuTests(ImportTestMixin, TestCase):
+    def run_import(self, text, **kwargs):
+        with mock.patch('products.tasks.enqueue_webhook_notification') as notify:
+            operation = super().run_import(text, **kwargs)
+        self.assertEqual(operation.status, 'completed', operation.summary)
+        notify.assert_called_once()
+        self.payload = notify.call_args.args[2]
+        return operation
+
+    def test_duplicate_in_one_range(self):
+        operation = self.run_import('sku,name,description\nA1,First,x\nB2,Other,x\na1 ,Last,x\n')
+        self.assertEqual(len(operation.checkpoints), 1)
+        self.assertEqual(Product.objects.get(user=self.user, sku='a1').name, 'Last')
+        self.assertEqual((operation.rows_committed, operation.duplicates_collapsed), (2, 1))
+        self.assertEqual(self.payload['duplicates_collapsed'], 1)
+        self.assertEqual(self.payload['rows_processed'], 2)
+
+    @override_settings(PRODUCT_IMPORT_SHARD_BYTES=100, PRODUCT_IMPORT_MAX_SHARDS=2)
+    def test_duplicate_across_shards(self):
+        rows = [f'S{i},Name {i},Description {i}' for i in range(20)]
+        rows[2] = 'DUP,First,x'
+        rows[18] = 'DUP,Last,x'
+        operation = self.run_import('sku,name,description\n' + '\n'.join(rows) + '\n')
+        self.assertEqual(len(operation.checkpoints), 2)
+        self.assertEqual(Product.objects.get(user=self.user, sku='dup').name, 'Last')
+        self.assertEqual(Product.objects.filter(user=self.user).count(), 19)
+        self.assertEqual((operation.rows_committed, operation.rows_inserted), (19, 19))
+        self.assertEqual(operation.duplicates_collapsed, 1)
+        self.assertEqual(self.payload['duplicates_collapsed'], 1)
+        self.assertIn('1 duplicate SKU rows were collapsed', operation.summary['message'])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'The backfill is PostgreSQL SQL')
+class ContentHashTests(TestCase):
+    def test_backfill_matches_compute_content_hash(self):
+        user = User.objects.create_user('hasher')
+        for sku, name, description, is_active in [
+            ('a', 'Plain', 'text', True),
+            ('b', 'Inactive', '', False),
+            ('c', 'Ünïcode ✓', 'multi\nline, "quoted"', True),
+        ]:
+            Product.objects.create(user=user, sku=sku, name=name, description=description, is_active=is_active)
+        expected = dict(Product.objects.filter(user=user).values_list('sku', 'content_hash'))
+
+        migration = importlib.import_module('products.migrations.0019_backfill_product_content_hash')
+        Product.objects.filter(user=user).update(content_hash=None)
+        with connection.cursor() as cursor:
+            cursor.execute(migration.BACKFILL_CONTENT_HASH_SQL)
+        self.assertEqual(dict(Product.objects.filter(user=user).values_list('sku', 'content_hash')), expected)
+
+
+class ProductApiTests(ServicesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('api', password='secret')
+        self.api_key, self.key = ApiKey.generate(self.user, 'test')
+        subscribed = mock.patch('products.api.is_subscribed', return_value=True)
+        subscribed.start()
+        self.addCleanup(subscribed.stop)
+        notify = mock.patch('products.api.enqueue_webhook_notification')
+        self.notify = notify.start()
+        self.addCleanup(notify.stop)
+
+    def post(self, name, data, **headers):
+        headers.setdefault('HTTP_AUTHORIZATION', f'Bearer {self.key}')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse(name), json.dumps(data), content_type='application/json', **headers)
+        return response
+
+    def statuses(self, response):
+        return [(result['sku'], result['status']) for result in response.json()['results']]
+
+    def events(self):
+        return {call.args[1]: call.args[2] for call in self.notify.call_args_list}
+
+    def test_api_key(self):
+        url = reverse('api_product_list')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f'Basic {self.key}').status_code, 401)
+
+        response = self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {self.key}')
+        self.assertEqual(response.status_code, 200)
+        self.api_key.refresh_from_db()
+        self.assertIsNotNone(self.api_key.last_used_at)
+
+        self.api_key.is_active = False
+        self.api_key.save()
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {self.key}').status_code, 401)
+
+    def test_session_needs_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        url = reverse('api_product_batch_delete')
+        body = json.dumps({'skus': ['a']})
+        self.assertEqual(client.get(reverse('api_product_list')).status_code, 200)
+        self.assertEqual(client.post(url, body, content_type='application/json').status_code, 403)
+
+        token = 'a' * 32
+        client.cookies[settings.CSRF_COOKIE_NAME] = token
+        response = client.post(url, body, content_type='application/json', HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 200)
+        # An API key needs no CSRF token
+        response = client.post(url, body, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {self.key}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_batch_upsert(self):
+        response = self.post('api_product_batch_upsert', {'items': [
+            {'sku': 'a', 'name': 'A'},
+            {'sku': 'b', 'name': 'B', 'description': 'bee', 'is_active': False},
+            {'sku': 'c'},
+            {'sku': 'd', 'name': 'D'},
+            {'sku': 'd', 'name': 'D again'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses(response), [
+            ('a', 'created'), ('b', 'created'), ('c', 'error'), ('d', 'error'), ('d', 'error')
+        ])
+        self.assertEqual(response.json()['summary'], {'created': 2, 'error': 3})
+        self.assertFalse(Product.objects.get(user=self.user, sku='b').is_active)
+        self.assertEqual(self.events(), {'product.batch_created': {
+            'count': 2, 'products': [{'sku': 'a', 'name': 'A'}, {'sku': 'b', 'name': 'B'}]
+        }})
+
+        self.notify.reset_mock()
+        response = self.post('api_product_batch_upsert', {'items': [
+            {'sku': 'a', 'name': 'A'},
+            {'sku': 'b', 'name': 'Bee', 'description': 'bee', 'is_active': False},
+            {'sku': 'e', 'name': 'E'},
+        ]})
+        self.assertEqual(self.statuses(response), [('a', 'unchanged'), ('b', 'updated'), ('e', 'created')])
+        self.assertEqual(self.events(), {
+            'product.batch_created': {'count': 1, 'products': [{'sku': 'e', 'name': 'E'}]},
+            'product.batch_updated': {'count': 1, 'products': [{'sku': 'b', 'name': 'Bee'}]},
+        })
+
+    def test_batch_patch(self):
+        Product.objects.create(user=self.user, sku='a', name='A')
+        Product.objects.create(user=self.user, sku='b', name='B')
+        response = self.post('api_product_batch_patch', {'items': [
+            {'sku': 'a', 'is_active': False},
+            {'sku': 'b', 'name': 'B'},
+            {'sku': 'z', 'name': 'Z'},
+            {'sku': 'a', 'is_active': 'no'},
+        ]})
+        self.assertEqual(self.statuses(response), [
+            ('a', 'updated'), ('b', 'unchanged'), ('z', 'not_found'), ('a', 'error')
+        ])
+        product = Product.objects.get(user=self.user, sku='a')
+        self.assertEqual((product.name, product.is_active), ('A', False))
+        self.assertEqual(product.content_hash, Product.compute_content_hash('A', '', False))
+        self.assertEqual(list(self.events()), ['product.batch_updated'])
+
+    def test_batch_delete(self):
+        Product.objects.create(user=self.user, sku='a', name='A')
+        other = User.objects.create_user('other')
+        Product.objects.create(user=other, sku='b', name='B')
+        response = self.post('api_product_batch_delete', {'skus': ['a', 'b']})
+        self.assertEqual(self.statuses(response), [('a', 'deleted'), ('b', 'not_found')])
+        self.assertTrue(Product.objects.filter(user=other, sku='b').exists())
+        self.assertEqual(self.events(), {
+            'product.batch_deleted': {'count': 1, 'products': [{'sku': 'a', 'name': 'A'}]}
+        })
+
+    @override_settings(PRODUCT_API_MAX_BATCH_SIZE=2)
+    def test_batch_limits(self):
+        response = self.post('api_product_batch_delete', {'skus': ['a', 'b', 'c']})
+        self.assertEqual(response.status_code, 400)
+        response = self.post('api_product_batch_upsert', {'items': 'a'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_listing(self):
+        for i in range(5):
+            Product.objects.create(user=self.user, sku=f's{i}', name=f'S{i}')
+        url = reverse('api_product_list')
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {self.key}'}
+
+        skus, cursor = [], None
+        while True:
+            params = {'limit': 2, **({'after': cursor} if cursor else {})}
+            page = self.client.get(url, params, **auth).json()
+            skus.extend(product['sku'] for product in page['results'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(skus, ['s4', 's3', 's2', 's1', 's0'])
+
+        page = self.client.get(url, {'sku': ['s1', 'nope']}, **auth).json()
+        self.assertEqual([product['sku'] for product in page['results']], ['s1'])
+        self.assertEqual(page['missing'], ['nope'])
+
+
+class BulkDeleteTests(ServicesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('deleter', password='secret')
+        self.client.force_login(self.user)
+        self.other = User.objects.create_user('other')
+        for user in (self.user, self.other):
+            for sku, is_active, created_at in [
+                ('keep-1', True, datetime(2026, 3, 1, 12, tzinfo=dt_timezone.utc)),
+                ('keep-2', False, datetime(2026, 3, 2, 23, 30, tzinfo=dt_timezone.utc)),
+                ('old-1', True, datetime(2026, 3, 3, 0, 0, tzinfo=dt_timezone.utc)),
+                ('old-2', False, datetime(2026, 3, 4, 8, tzinfo=dt_timezone.utc)),
+            ]:
+                product = Product.objects.create(user=user, sku=sku, name=sku, is_active=is_active)
+                Product.objects.filter(pk=product.pk).update(created_at=created_at)
+
+    def delete(self, **data):
+        response = self.client.post(reverse('product_delete_all'), data)
+        self.assertEqual(response.status_code, 200, response.content)
+        operation = BulkOperation.objects.get(pk=response.json()['operation_id'])
+        self.assertEqual(operation.status, 'completed', operation.summary)
+        # Other users' products are never touched
+        self.assertEqual(Product.objects.filter(user=self.other).count(), 4)
+        return set(Product.objects.filter(user=self.user).values_list('sku', flat=True))
+
+    def test_all(self):
+        self.assertEqual(self.delete(), set())
+
+    @override_settings(PRODUCT_DELETE_WINDOW_SIZE=1)
+    def test_small_windows(self):
+        self.assertEqual(self.delete(), set())
+
+    def test_status(self):
+        self.assertEqual(self.delete(status='inactive'), {'keep-1', 'old-1'})
+        self.assertEqual(self.delete(status='active'), set())
+
+    def test_sku_prefix(self):
+        self.assertEqual(self.delete(sku_prefix='old-'), {'keep-1', 'keep-2'})
+
+    def test_created_after(self):
+        self.assertEqual(self.delete(created_after='2026-03-03'), {'keep-1', 'keep-2'})
+
+    def test_created_before(self):
+        # The day given is included, up to its last moment
+        self.assertEqual(self.delete(created_before='2026-03-02'), {'old-1', 'old-2'})
+
+    def test_created_range(self):
+        self.assertEqual(self.delete(created_after='2026-03-02', created_before='2026-03-03'), {'keep-1', 'old-2'})
+
+    def test_invalid_date(self):
+        response = self.client.post(reverse('product_delete_all'), {'created_after': '2026-02-30'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(BulkOperation.objects.exists())
+
+
+class ProductListTests(ServicesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lister', password='secret')
+        self.client.force_login(self.user)
+
+    def create(self, count, first=0):
+        start = timezone.now() - timedelta(days=1)
+        for i in range(first, first + count):
+            product = Product.objects.create(user=self.user, sku=f's{i:02}', name=f'Product {i}')
+            Product.objects.filter(pk=product.pk).update(created_at=start + timedelta(minutes=i))
+
+    def page(self, **params):
+        response = self.client.get(reverse('product_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def skus(self, context):
+        return [product.sku for product in context['products']]
+
+    def test_keyset_pages(self):
+        self.create(25)
+        first = self.page()
+        self.assertTrue(first['keyset_pagination'])
+        self.assertEqual(self.skus(first), [f's{i:02}' for i in range(24, 14, -1)])
+        self.assertFalse(first['page_obj'].has_previous())
+        self.assertTrue(first['page_obj'].has_next())
+
+        second = self.page(after=first['page_obj'].next_cursor)
+        self.assertEqual(self.skus(second), [f's{i:02}' for i in range(14, 4, -1)])
+        self.assertTrue(second['page_obj'].has_previous())
+
+        last = self.page(after=second['page_obj'].next_cursor)
+        self.assertEqual(self.skus(last), [f's{i:02}' for i in range(4, -1, -1)])
+        self.assertFalse(last['page_obj'].has_next())
+
+        back = self.page(before=last['page_obj'].previous_cursor)
+        self.assertEqual(self.skus(back), self.skus(second))
+        back = self.page(before=back['page_obj'].previous_cursor)
+        self.assertEqual(self.skus(back), self.skus(first))
+        self.assertFalse(back['page_obj'].has_previous())
+
+    def test_bad_cursor_shows_first_page(self):
+        self.create(3)
+        self.assertEqual(self.skus(self.page(after='not-a-cursor')), ['s02', 's01', 's00'])
+
+    def test_total_count_is_cached(self):
+        self.create(3)
+        self.assertEqual(self.page()['total_count'], 3)
+        self.create(1, first=3)
+        self.assertEqual(self.page()['total_count'], 3)
+        cache.clear()
+        self.assertEqual(self.page()['total_count'], 4)
+
+
+class ProductSearchTests(ServicesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest('Search needs the pg_trgm extension')
+        self.user = User.objects.create_user('searcher', password='secret')
+        self.client.force_login(self.user)
+        Product.objects.create(user=self.user, sku='shade-1', name='Shade', description='Fits any lamp')
+        Product.objects.create(user=self.user, sku='lamp-1', name='Desk lamp')
+        Product.objects.create(user=self.user, sku='chair-1', name='Chair')
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('product_list'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_ranked(self):
+        context = self.search('lamp')
+        # A name match outranks a description match
+        self.assertEqual([product.sku for product in context['products']], ['lamp-1', 'shade-1'])
+
+    def test_substring(self):
+        context = self.search('amp-')
+        self.assertEqual([product.sku for product in context['products']], ['lamp-1'])
+
+    def test_page_numbers(self):
+        for i in range(12):
+            Product.objects.create(user=self.user, sku=f'extra-{i}', name=f'Floor lamp {i}')
+        context = self.search('lamp', page=2)
+        self.assertNotIn('keyset_pagination', context)
+        self.assertEqual(context['page_obj'].number, 2)
+        self.assertEqual(context['paginator'].count, 14)
+        self.assertEqual(len(context['products']), 4)
+
+
+@override_settings(BULK_PROGRESS_MAX_STREAMS=2)
+class ProgressStreamLeaseTests(ServicesTestMixin, SimpleTestCase):
+    def test_cap(self):
+        self.assertTrue(open_stream(1, 'a'))
+        self.assertTrue(open_stream(1, 'b'))
+        self.assertFalse(open_stream(1, 'c'))
+        # The refused stream was not registered, and other users have their own cap
+        self.assertEqual(self.redis.zcard('progress_streams_1'), 2)
+        self.assertTrue(open_stream(2, 'c'))
+
+        close_stream(1, 'a')
+        self.assertTrue(open_stream(1, 'c'))
+
+    def test_lease_expiry(self):
+        now = time.time()
+        with mock.patch('products.progress.time.time', return_value=now):
+            open_stream(1, 'a')
+            open_stream(1, 'b')
+        with mock.patch('products.progress.time.time', return_value=now + STREAM_LEASE_SECONDS - 10):
+            refresh_stream(1, 'b')
+        with mock.patch('products.progress.time.time', return_value=now + STREAM_LEASE_SECONDS + 1):
+            # 'a' was never refreshed, so its process is presumed dead
+            self.assertTrue(open_stream(1, 'c'))
+            self.assertFalse(open_stream(1, 'd'))
+        self.assertEqual(
+            sorted(self.redis.zrange('progress_streams_1', 0, -1)), [b'b', b'c']
+        )
+
+
+class FakeBroadcaster:
+    async def subscribe(self, channel):
+        return mock.Mock(queue=mock.Mock(), overflowed=False, channel=channel)
+
+    async def unsubscribe(self, subscription):
+        pass
+
+
+@override_settings(BULK_PROGRESS_MAX_STREAMS=1)
+class ProgressStreamAppTests(ServicesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('streamer', password='secret')
+        self.operation = BulkOperation.objects.create(
+            user=self.user, operation_type='import', status='completed', summary={'message': 'Done'}
+        )
+        broadcaster = mock.patch('acme_project.sse.get_broadcaster', return_value=FakeBroadcaster())
+        broadcaster.start()
+        self.addCleanup(broadcaster.stop)
+
+    async def request(self, pk, session_key=None):
+        headers = [(b'cookie', f'{settings.SESSION_COOKIE_NAME}={session_key}'.encode())] if session_key else []
+        app = ApplicationCommunicator(progress_stream_app, {
+            'type': 'http', 'method': 'GET', 'path': f'/products/operations/{pk}/progress/stream/', 'headers': headers,
+        })
+        await app.send_input({'type': 'http.request'})
+        start = await app.receive_output()
+        body = b''
+        while True:
+            message = await app.receive_output()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        await app.wait()
+        return start['status'], body
+
+    def session_key(self):
+        self.client.force_login(self.user)
+        return self.client.session.session_key
+
+    async def test_finished_operation(self):
+        session_key = await sync_to_async(self.session_key)()
+        status, body = await self.request(self.operation.pk, session_key)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode()[len('data: '):])['status'], 'complete')
+        # The stream's lease was released when it ended
+        self.assertEqual(self.redis.zcard(f'progress_streams_{self.user.pk}'), 0)
+
+    async def test_refused(self):
+        self.assertEqual((await self.request(self.operation.pk))[0], 403)
+        session_key = await sync_to_async(self.session_key)()
+        other = await sync_to_async(User.objects.create_user)('other')
+        theirs = await sync_to_async(BulkOperation.objects.create)(user=other, operation_type='import')
+        self.assertEqual((await self.request(theirs.pk, session_key))[0], 404)
+
+        await sync_to_async(open_stream)(self.user.pk, 'open')
+        self.assertEqual((await self.request(self.operation.pk, session_key))[0], 429)
+
+
+class ExportTests(ServicesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('exporter', password='secret')
+        self.client.force_login(self.user)
+        self.first = Product.objects.create(user=self.user, sku='a1', name='Alpha', description='plain')
+        self.second = Product.objects.create(
+            user=self.user, sku='b2', name='Bêta', description='comma, "quote"\nnewline', is_active=False
+        )
+
+    def export(self, export_format, compress=False):
+        data = {'format': export_format, **({'gzip': 'on'} if compress else {})}
+        with mock.patch('products.tasks.enqueue_webhook_notification'):
+            response = self.client.post(reverse('product_export'), data)
+        operation = BulkOperation.objects.get(pk=response.json()['operation_id'])
+        self.assertEqual(operation.status, 'completed', operation.summary)
+        self.assertEqual(operation.rows_committed, 2)
+
+        response = self.client.get(reverse('export_download', args=[operation.pk]))
+        self.assertEqual(response.status_code, 200)
+        filename = f'products-{operation.pk}.{export_format}' + ('.gz' if compress else '')
+        self.assertIn(filename, response['Content-Disposition'])
+        content = b''.join(response.streaming_content)
+        return (gzip.decompress(content) if compress else content).decode('utf-8')
+
+    def expected_rows(self):
+        return [
+            [product.sku, product.name, product.description, product.is_active,
+             product.created_at.isoformat(), product.updated_at.isoformat()]
+            for product in (self.first, self.second)
+        ]
+
+    def test_csv(self):
+        for compress in (False, True):
+            with self.subTest(gzip=compress):
+                rows = list(csv.reader(io.StringIO(self.export('csv', compress), newline='')))
+                self.assertEqual(rows[0], EXPORT_FIELDS)
+                expected = [[*row[:3], 'true' if row[3] else 'false', *row[4:]] for row in self.expected_rows()]
+                self.assertEqual(rows[1:], expected)
+
+    def test_ndjson(self):
+        for compress in (False, True):
+            with self.subTest(gzip=compress):
+                objects = [json.loads(line) for line in self.export('ndjson', compress).splitlines()]
+                self.assertEqual([list(obj) for obj in objects], [EXPORT_FIELDS, EXPORT_FIELDS])
+                self.assertEqual([list(obj.values()) for obj in objects], self.expected_rows())
+
+    def test_csv_reimports(self):
+        text = self.export('csv')
+        Product.objects.all().delete()
+        name = default_storage.save(import_upload_to(None, 'export.csv'), ContentFile(text.encode('utf-8')))
+        operation = BulkOperation.objects.create(user=self.user, operation_type='import', input_file=name)
+        process_csv_import.apply(args=[operation.pk])
+        self.assertEqual(
+            sorted(Product.objects.filter(user=self.user).values_list('sku', 'name', 'description')),
+            [('a1', 'Alpha', 'plain'), ('b2', 'Bêta', 'comma, "quote"\nnewline')]
+        )
+
+    def test_download_ownership(self):
+        self.export('csv')
+        operation = BulkOperation.objects.get(operation_type='export')
+        url = reverse('export_download', args=[operation.pk])
+
+        other = User.objects.create_user('other')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.user)
+        BulkOperation.objects.filter(pk=operation.pk).update(status='processing')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@mock.patch('products.uploads.S3_MIN_PART_SIZE', 1)
+@override_settings(PRODUCT_UPLOAD_PART_SIZE=16, PRODUCT_UPLOAD_MAX_SIZE=1024)
+class UploadSessionTests(ImportTestMixin, TestCase):
+    DATA = b'sku,name,description\nA1,Alpha,first\nB2,Beta,second\n'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def begin(self, size, filename='products.csv'):
+        return self.client.post(reverse('upload_session_create'), {'filename': filename, 'size': size})
+
+    def put(self, pk, number, data):
+        return self.client.put(
+            reverse('upload_part_data', args=[pk, number]), data, content_type='application/octet-stream'
+        )
+
+    def parts(self, pk):
+        response = self.client.get(reverse('upload_session_detail', args=[pk]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['uploaded_parts']
+
+    def test_size_limits(self):
+        for size, error in [
+            ('', 'The file is empty.'), (0, 'The file is empty.'), (1025, 'The file is larger than 1.0\xa0KB.')
+        ]:
+            with self.subTest(size=size):
+                response = self.begin(size)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': error})
+        self.assertEqual(self.begin(1024).status_code, 200)
+        self.assertEqual(self.begin(10, 'products.xlsx').status_code, 400)
+        self.assertEqual(UploadSession.objects.count(), 1)
+
+    def test_upload(self):
+        session = self.begin(len(self.DATA)).json()
+        self.assertEqual((session['part_size'], session['part_count'], session['uploaded_parts']), (16, 4, []))
+        pk = session['id']
+        chunks = [self.DATA[i:i + 16] for i in range(0, len(self.DATA), 16)]
+
+        # Parts arrive in any order; a part of the wrong size is rejected
+        for number in (3, 1):
+            self.assertEqual(self.put(pk, number, chunks[number - 1]).json(), {'part': number})
+        self.assertEqual(self.put(pk, 2, chunks[1][:-1]).status_code, 400)
+        self.assertEqual(self.put(pk, 5, b'x').status_code, 404)
+        self.assertEqual(self.parts(pk), [1, 3])
+
+        complete = reverse('upload_session_complete', args=[pk])
+        response = self.client.post(complete)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['uploaded_parts'], [1, 3])
+        self.assertIn('2 of 4 parts', response.json()['error'])
+
+        for number in (2, 4):
+            self.put(pk, number, chunks[number - 1])
+        self.assertEqual(self.parts(pk), [1, 2, 3, 4])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(complete)
+        self.assertEqual(response.status_code, 200)
+
+        upload = UploadSession.objects.get(pk=pk)
+        self.assertEqual(upload.status, 'completed')
+        with default_storage.open(upload.name, 'rb') as f:
+            self.assertEqual(f.read(), self.DATA)
+        operation = BulkOperation.objects.get(pk=response.json()['operation_id'])
+        self.assertEqual((operation.status, operation.rows_inserted), ('completed', 2))
+        # Finished sessions are no longer listed or completed again
+        self.assertEqual(self.client.get(reverse('upload_session_detail', args=[pk])).status_code, 404)
+        self.assertEqual(self.client.post(complete).status_code, 404)
+
+    def test_other_users_session(self):
+        pk = self.begin(len(self.DATA)).json()['id']
+        self.client.force_login(User.objects.create_user('other'))
+        self.assertEqual(self.client.get(reverse('upload_session_detail', args=[pk])).status_code, 404)
+        self.assertEqual(self.put(pk, 1, self.DATA[:16]).status_code, 404)
+        self.assertEqual(self.client.post(reverse('upload_session_complete', args=[pk])).status_code, 404)
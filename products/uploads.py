@@ -0,0 +1,148 @@
+"""Chunked, resumable uploads of import files straight to storage.
+
+The browser splits the file into parts of ``UploadSession.part_size`` bytes
+and PUTs each one to a URL it gets from ``part_url``. Any missing parts can
+be re-sent after an interruption: ``uploaded_parts`` tells the client which
+ones storage already holds. ``complete`` assembles the file under
+``UploadSession.name``, from which the import then reads.
+
+On S3 the parts go to presigned multipart-upload URLs and never pass through
+a web worker. Locally (dev), each part is PUT to ``UploadPartDataView``,
+which writes it in place at the part's offset, so nothing needs assembling.
+"""
+import mimetypes
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.text import get_valid_filename
+
+from .storage import s3_key
+
+# S3 rejects multipart uploads with more parts, or smaller non-final parts
+S3_MAX_PARTS = 10000
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class UploadIncomplete(Exception):
+    """``complete`` was called before every part was uploaded."""
+
+
+def uses_s3():
+    return getattr(default_storage, 'bucket', None) is not None
+
+
+def plan(filename, size):
+    """Return ``(name, part_size)`` for a new upload of ``size`` bytes."""
+    name = f'bulk_imports/uploads/{uuid.uuid4().hex}/{get_valid_filename(os.path.basename(filename))}'
+    part_size = max(settings.PRODUCT_UPLOAD_PART_SIZE, S3_MIN_PART_SIZE, -(-size // S3_MAX_PARTS))
+    return name, part_size
+
+
+def begin(session):
+    if uses_s3():
+        response = _client().create_multipart_upload(
+            Bucket=default_storage.bucket_name, Key=s3_key(session.name), ContentType=_content_type(session.filename)
+        )
+        session.upload_id = response['UploadId']
+    else:
+        # Reserve the whole file, so parts can be written in any order
+        session.name = default_storage.save(session.name, ContentFile(b''))
+        with open(default_storage.path(session.name), 'r+b') as f:
+            f.truncate(session.size)
+
+
+def part_url(request, session, number):
+    if uses_s3():
+        return _client().generate_presigned_url(
+            'upload_part',
+            Params={
+                'Bucket': default_storage.bucket_name,
+                'Key': s3_key(session.name),
+                'UploadId': session.upload_id,
+                'PartNumber': number,
+            },
+            ExpiresIn=settings.PRODUCT_UPLOAD_URL_EXPIRY
+        )
+    return request.build_absolute_uri(reverse('upload_part_data', args=[session.pk, number]))
+
+
+def write_part(session, number, stream):
+    """Local backend: copy part ``number`` from ``stream`` into the reserved file.
+
+    Returns False if the part's length does not match the plan.
+    """
+    start, end = session.part_range(number)
+    written = 0
+    with open(default_storage.path(session.name), 'r+b') as f:
+        f.seek(start)
+        for block in iter(lambda: stream.read(1024 * 1024), b''):
+            written += len(block)
+            if written > end - start:
+                return False
+            f.write(block)
+    return written == end - start
+
+
+def uploaded_parts(session):
+    if not uses_s3():
+        return sorted(session.parts)
+    return sorted(part['PartNumber'] for part in _list_parts(session))
+
+
+def complete(session):
+    """Assemble the uploaded parts into ``session.name``. Raises ``UploadIncomplete`` if any are missing."""
+    parts = _list_parts(session) if uses_s3() else [{'PartNumber': number} for number in session.parts]
+    missing = set(range(1, session.part_count + 1)) - {part['PartNumber'] for part in parts}
+    if missing:
+        raise UploadIncomplete(f'{len(missing)} of {session.part_count} parts have not been uploaded')
+    if not uses_s3():
+        return
+
+    _client().complete_multipart_upload(
+        Bucket=default_storage.bucket_name,
+        Key=s3_key(session.name),
+        UploadId=session.upload_id,
+        MultipartUpload={'Parts': [
+            {'PartNumber': part['PartNumber'], 'ETag': part['ETag']}
+            for part in sorted(parts, key=lambda part: part['PartNumber'])
+        ]}
+    )
+
+
+def abort(session):
+    if uses_s3():
+        _client().abort_multipart_upload(
+            Bucket=default_storage.bucket_name, Key=s3_key(session.name), UploadId=session.upload_id
+        )
+    elif default_storage.exists(session.name):
+        default_storage.delete(session.name)
+
+
+def _list_parts(session):
+    """The session's parts stored on S3 that have exactly their planned size."""
+    parts = []
+    for page in _client().get_paginator('list_parts').paginate(
+        Bucket=default_storage.bucket_name, Key=s3_key(session.name), UploadId=session.upload_id
+    ):
+        for part in page.get('Parts', []):
+            if part['PartNumber'] <= session.part_count:
+                start, end = session.part_range(part['PartNumber'])
+                if part['Size'] == end - start:
+                    parts.append(part)
+    return parts
+
+
+def _content_type(filename):
+    content_type, encoding = mimetypes.guess_type(filename)
+    # A compressed file is stored as is, not served with a Content-Encoding
+    if encoding or content_type is None:
+        return 'application/octet-stream'
+    return content_type
+
+
+def _client():
+    return default_storage.connection.meta.client
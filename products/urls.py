@@ -2,19 +2,37 @@ from django.urls import path
 from .views import (
     ProductListView, ProductUploadView, ProductCreateView, 
     ProductUpdateView, ProductDeleteView, BulkDeleteView,
-    UploadProgressView, DeleteProgressView, ActiveOperationView,
-    OperationListView
+    OperationProgressView, ActiveOperationView,
+    OperationListView, ExportView, ExportDownloadView, ImportErrorsDownloadView,
+    ProgressStreamView, UploadSessionCreateView, UploadSessionDetailView,
+    UploadPartView, UploadPartDataView, UploadSessionCompleteView
+)
+from .api import (
+    ProductCollectionApiView, ProductBatchUpsertApiView,
+    ProductBatchPatchApiView, ProductBatchDeleteApiView
 )
 
 urlpatterns = [
     path('', ProductListView.as_view(), name='product_list'),
     path('upload/', ProductUploadView.as_view(), name='product_upload'),
-    path('upload/progress/<str:task_id>/', UploadProgressView.as_view(), name='upload_progress'),
     path('active-operation/', ActiveOperationView.as_view(), name='active_operation'),
     path('create/', ProductCreateView.as_view(), name='product_create'),
     path('<int:pk>/update/', ProductUpdateView.as_view(), name='product_update'),
     path('<int:pk>/delete/', ProductDeleteView.as_view(), name='product_delete'),
     path('delete-all/', BulkDeleteView.as_view(), name='product_delete_all'),
-    path('delete/progress/<str:task_id>/', DeleteProgressView.as_view(), name='delete_progress'),
+    path('export/', ExportView.as_view(), name='product_export'),
+    path('export/<int:pk>/download/', ExportDownloadView.as_view(), name='export_download'),
+    path('upload/<int:pk>/errors/', ImportErrorsDownloadView.as_view(), name='import_errors_download'),
+    path('upload/sessions/', UploadSessionCreateView.as_view(), name='upload_session_create'),
+    path('upload/sessions/<int:pk>/', UploadSessionDetailView.as_view(), name='upload_session_detail'),
+    path('upload/sessions/<int:pk>/parts/<int:number>/', UploadPartView.as_view(), name='upload_part'),
+    path('upload/sessions/<int:pk>/parts/<int:number>/data/', UploadPartDataView.as_view(), name='upload_part_data'),
+    path('upload/sessions/<int:pk>/complete/', UploadSessionCompleteView.as_view(), name='upload_session_complete'),
     path('operations/', OperationListView.as_view(), name='operation_list'),
+    path('operations/<int:pk>/progress/', OperationProgressView.as_view(), name='operation_progress'),
+    path('operations/<int:pk>/progress/stream/', ProgressStreamView.as_view(), name='progress_stream'),
+    path('api/v1/products/', ProductCollectionApiView.as_view(), name='api_product_list'),
+    path('api/v1/products/batch/upsert/', ProductBatchUpsertApiView.as_view(), name='api_product_batch_upsert'),
+    path('api/v1/products/batch/patch/', ProductBatchPatchApiView.as_view(), name='api_product_batch_patch'),
+    path('api/v1/products/batch/delete/', ProductBatchDeleteApiView.as_view(), name='api_product_batch_delete'),
 ]
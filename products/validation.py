@@ -0,0 +1,116 @@
+"""Row validation for imports and the report of rejected rows.
+
+Rows are checked a chunk at a time against the ``Product`` column
+constraints. Valid rows go on to the importer. Rejected rows are written to
+``default_storage`` as a small CSV part at every checkpoint, so the report
+survives a resumed import and memory stays bounded. When the import ends,
+the parts are merged into the operation's ``error_file``.
+
+Parts identify each row by the line it ends on, counted from the start of its
+range (the row number, for Parquet and Arrow files). Absolute line numbers are only known once every earlier range has
+been read, so they are added when the parts are merged.
+"""
+import csv
+import io
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from .models import Product
+
+SKU_MAX_LENGTH = Product._meta.get_field('sku').max_length
+NAME_MAX_LENGTH = Product._meta.get_field('name').max_length
+ERROR_REPORT_FIELDS = ['line', 'byte_offset', 'sku', 'reason']
+
+
+def validate_rows(rows):
+    """Split ``(sku, name, description, line, byte_offset)`` rows into ``(valid, rejected)``.
+
+    ``valid`` holds ``(sku, name, description)`` tuples ready for the
+    importer; ``rejected`` holds ``(line, byte_offset, sku, reason)``.
+    """
+    valid = []
+    rejected = []
+    for sku, name, description, line, byte_offset in rows:
+        # Common case first: one short-circuiting test per row
+        if (
+            sku and len(sku) <= SKU_MAX_LENGTH and len(name) <= NAME_MAX_LENGTH
+            and '\x00' not in sku and '\x00' not in name and '\x00' not in description
+        ):
+            valid.append((sku, name, description))
+            continue
+
+        if not sku:
+            reason = 'missing sku'
+        elif len(sku) > SKU_MAX_LENGTH:
+            reason = f'sku is longer than {SKU_MAX_LENGTH} characters'
+        elif len(name) > NAME_MAX_LENGTH:
+            reason = f'name is longer than {NAME_MAX_LENGTH} characters'
+        else:
+            reason = 'contains a NUL character'
+        rejected.append((line, byte_offset, sku[:SKU_MAX_LENGTH], reason))
+    return valid, rejected
+
+
+def _parts_dir(operation_id):
+    return f'import_errors/{operation_id}'
+
+
+def save_part(operation_id, start, segment_start, rejected):
+    """Store the rows rejected in ``[segment_start, next checkpoint)`` of the range beginning at ``start``."""
+    # Deterministic name: a chunk redone after a crash replaces its part
+    name = f'{_parts_dir(operation_id)}/{start:015d}-{segment_start:015d}.csv'
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rejected)
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, io.BytesIO(buffer.getvalue().encode('utf-8')))
+
+
+def merge_parts(operation, sample_size, first_line=2):
+    """Merge the operation's parts into ``operation.error_file`` (not saved) and delete them.
+
+    ``first_line`` is the line number of the file's first record. Returns up
+    to ``sample_size`` rejected rows formatted for the summary. Line numbers
+    are left empty for ranges that follow one that was not read to the end.
+    """
+    try:
+        _, parts = default_storage.listdir(_parts_dir(operation.pk))
+    except FileNotFoundError:
+        return []
+    if not parts:
+        return []
+
+    # Absolute line number of the first line of each range
+    line_base = {}
+    next_base = first_line
+    for start in sorted(operation.checkpoints, key=int):
+        checkpoint = operation.checkpoints[start]
+        line_base[int(start)] = next_base
+        if next_base is not None and checkpoint['end'] is not None and checkpoint['offset'] >= checkpoint['end']:
+            next_base += checkpoint.get('lines', 0)
+        else:
+            next_base = None
+
+    sample = []
+    with tempfile.TemporaryFile() as tmp:
+        text = io.TextIOWrapper(tmp, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(ERROR_REPORT_FIELDS)
+        for part in sorted(parts):
+            name = f'{_parts_dir(operation.pk)}/{part}'
+            base = line_base.get(int(part.split('-')[0]))
+            with default_storage.open(name, 'rb') as f:
+                for line, byte_offset, sku, reason in csv.reader(io.TextIOWrapper(f, encoding='utf-8', newline='')):
+                    line = int(line) + base - 1 if base is not None else ''
+                    writer.writerow([line, byte_offset, sku, reason])
+                    if len(sample) < sample_size:
+                        where = f'line {line or "?"}' + (f' (byte {byte_offset})' if byte_offset else '')
+                        sample.append(f'{where}: {reason}')
+            default_storage.delete(name)
+        text.flush()
+        text.detach()
+        tmp.seek(0)
+        operation.error_file.save(f'{operation.pk}-errors.csv', File(tmp), save=False)
+    return sample
@@ -1,18 +1,33 @@
 import os
-from django.shortcuts import render
-from django.http import JsonResponse
+import uuid
+from datetime import datetime, time, timedelta
+from functools import partial
+from django.shortcuts import render, get_object_or_404, redirect
+from django.http import JsonResponse, FileResponse, Http404, StreamingHttpResponse
 from django.views.generic import ListView, TemplateView, View
 from django.core.files.storage import default_storage, FileSystemStorage
-from django.core.cache import cache
 from django.conf import settings
-from .models import Product, BulkOperation
-from .tasks import process_csv_import, delete_all_products
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.db import transaction
+from .models import Product, BulkOperation, UploadSession
+from .pagination import KeysetPaginationMixin
+from .tasks import process_csv_import, delete_all_products, export_products
+from .exporters import EXPORTERS
+from . import uploads
+from .readers import FORMATS, UnsupportedFormat, get_format
+from .progress import close_stream, get_progress, open_stream, progress_key, refresh_stream
+from acme_project.redis_pool import get_redis
 
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.forms import UserCreationForm
 from django.urls import reverse_lazy
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.views.generic import CreateView
-from webhooks.tasks import send_webhook_notification
+from webhooks.subscriptions import enqueue_webhook_notification
 import json
 
 class SignUpView(CreateView):
@@ -20,22 +35,37 @@ class SignUpView(CreateView):
     success_url = reverse_lazy('login')
     template_name = 'registration/signup.html'
 
-class ProductListView(LoginRequiredMixin, ListView):
+class ProductListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Product
     template_name = 'products/list.html'
     context_object_name = 'products'
     paginate_by = 10
 
+    def use_keyset_pagination(self):
+        # Search results are ordered by rank, so they keep page numbers
+        return not self.request.GET.get('q')
+
     def get_queryset(self):
-        queryset = Product.objects.filter(user=self.request.user).order_by('-created_at')
+        queryset = Product.objects.filter(user=self.request.user).defer('search_vector')
         query = self.request.GET.get('q')
         if query:
-            queryset = queryset.filter(sku__icontains=query) | queryset.filter(name__icontains=query)
+            # Full-text matches on the trigger-maintained search_vector, plus
+            # substring matches on sku/name served by the trigram indexes
+            search = SearchQuery(query, search_type='websearch', config='english')
+            queryset = queryset.filter(
+                Q(search_vector=search) | Q(sku__icontains=query) | Q(name__icontains=query)
+            ).annotate(
+                rank=SearchRank(F('search_vector'), search) + Greatest(
+                    TrigramSimilarity('sku', query), TrigramSimilarity('name', query)
+                )
+            ).order_by('-rank', '-created_at')
+        else:
+            queryset = queryset.order_by('-created_at')
         return queryset
 
 class ProductUploadView(LoginRequiredMixin, View):
     def get(self, request):
-        return render(request, 'products/upload.html')
+        return render(request, 'products/upload.html', {'accept': ','.join(FORMATS)})
 
     def post(self, request):
         # Check for active operations
@@ -49,34 +79,177 @@ class ProductUploadView(LoginRequiredMixin, View):
         if not file:
             return JsonResponse({'error': 'No file uploaded'}, status=400)
         
-        if not file.name.endswith('.csv'):
-            return JsonResponse({'error': 'Invalid file format. Please upload a CSV file.'}, status=400)
+        try:
+            get_format(file.name)
+        except UnsupportedFormat as e:
+            return JsonResponse({'error': str(e)}, status=400)
 
-        # Create BulkOperation
-        operation = BulkOperation.objects.create(
+        engine = request.POST.get('engine', 'orm')
+        if engine not in dict(BulkOperation.ENGINE_CHOICES):
+            return JsonResponse({'error': 'Invalid import engine.'}, status=400)
+
+        operation = _start_import(request.user, file, engine)
+        return JsonResponse({'task_id': operation.task_id, 'operation_id': operation.id})
+
+def _start_import(user, input_file, engine):
+    # Create BulkOperation
+    operation = BulkOperation.objects.create(
+        user=user,
+        operation_type='import',
+        input_file=input_file,
+        engine=engine,
+        status='pending',
+        # Known before the task is queued, so no second save is needed
+        task_id=str(uuid.uuid4())
+    )
+
+    # Trigger Celery task with operation_id
+    transaction.on_commit(partial(process_csv_import.apply_async, args=[operation.id], task_id=operation.task_id))
+    return operation
+
+def _upload_session_data(session, uploaded_parts):
+    return {
+        'id': session.id,
+        'part_size': session.part_size,
+        'part_count': session.part_count,
+        'uploaded_parts': uploaded_parts,
+        'status': session.status,
+    }
+
+class UploadSessionCreateView(LoginRequiredMixin, View):
+    """Start a chunked upload (see products.uploads); the file itself never passes through here."""
+    def post(self, request):
+        filename = request.POST.get('filename', '')
+        try:
+            get_format(filename)
+        except UnsupportedFormat as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        try:
+            size = int(request.POST.get('size', ''))
+        except ValueError:
+            size = 0
+        if size <= 0:
+            return JsonResponse({'error': 'The file is empty.'}, status=400)
+        if size > settings.PRODUCT_UPLOAD_MAX_SIZE:
+            return JsonResponse(
+                {'error': f'The file is larger than {filesizeformat(settings.PRODUCT_UPLOAD_MAX_SIZE)}.'}, status=400
+            )
+
+        name, part_size = uploads.plan(filename, size)
+        session = UploadSession(user=request.user, filename=filename, name=name, size=size, part_size=part_size)
+        uploads.begin(session)
+        session.save()
+        return JsonResponse(_upload_session_data(session, []))
+
+class UploadSessionDetailView(LoginRequiredMixin, View):
+    """Which parts storage already has, so an interrupted upload can resume."""
+    def get(self, request, pk):
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user, status='uploading')
+        return JsonResponse(_upload_session_data(session, uploads.uploaded_parts(session)))
+
+class UploadPartView(LoginRequiredMixin, View):
+    def post(self, request, pk, number):
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user, status='uploading')
+        if not 1 <= number <= session.part_count:
+            raise Http404('No such part')
+        # S3 parts bypass this app, so record the activity here for expire_upload_sessions
+        UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+        return JsonResponse({'url': uploads.part_url(request, session, number)})
+
+class UploadPartDataView(LoginRequiredMixin, View):
+    """Receives parts when default_storage is local; on S3 they go to presigned URLs instead."""
+    def put(self, request, pk, number):
+        if uploads.uses_s3():
+            raise Http404('Parts are uploaded to S3')
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user, status='uploading')
+        if not 1 <= number <= session.part_count:
+            raise Http404('No such part')
+
+        # Streamed to disk, not read into request.body
+        if not uploads.write_part(session, number, request):
+            return JsonResponse({'error': 'Part size does not match.'}, status=400)
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=session.pk)
+            if number not in session.parts:
+                session.parts.append(number)
+                session.save(update_fields=['parts', 'updated_at'])
+        return JsonResponse({'part': number})
+
+class UploadSessionCompleteView(LoginRequiredMixin, View):
+    """Assemble the uploaded parts and start importing the file."""
+    def post(self, request, pk):
+        if BulkOperation.objects.filter(
             user=request.user,
-            operation_type='import',
-            input_file=file,
-            status='pending'
-        )
-        
-        # Trigger Celery task with operation_id
-        task = process_csv_import.delay(operation.id)
-        
-        operation.task_id = task.id
-        operation.save()
-        
-        return JsonResponse({'task_id': task.id, 'operation_id': operation.id})
+            status__in=['pending', 'processing']
+        ).exists():
+            return JsonResponse({'error': 'An operation is already in progress.'}, status=400)
 
-class UploadProgressView(LoginRequiredMixin, View):
-    def get(self, request, task_id):
-        cache_key = f'import_progress_{task_id}'
-        progress_data = cache.get(cache_key)
-        
-        if not progress_data:
-            return JsonResponse({'status': 'pending', 'progress': 0, 'message': 'Initializing...'})
-        
-        return JsonResponse(progress_data)
+        engine = request.POST.get('engine', 'orm')
+        if engine not in dict(BulkOperation.ENGINE_CHOICES):
+            return JsonResponse({'error': 'Invalid import engine.'}, status=400)
+
+        with transaction.atomic():
+            session = get_object_or_404(
+                UploadSession.objects.select_for_update(), pk=pk, user=request.user, status='uploading'
+            )
+            try:
+                uploads.complete(session)
+            except uploads.UploadIncomplete as e:
+                return JsonResponse({'error': str(e), 'uploaded_parts': uploads.uploaded_parts(session)}, status=400)
+
+            operation = _start_import(request.user, session.name, engine)
+            session.status = 'completed'
+            session.operation = operation
+            session.save(update_fields=['status', 'operation', 'updated_at'])
+
+        return JsonResponse({'task_id': operation.task_id, 'operation_id': operation.id})
+
+class OperationProgressView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        operation = get_object_or_404(BulkOperation, pk=pk, user=request.user)
+        return JsonResponse(get_progress(operation))
+
+class ProgressStreamView(LoginRequiredMixin, View):
+    """Server-Sent Events stream of an operation's progress, published by ``products.progress.set_progress``.
+
+    Only used when STREAM_ORIGIN is empty (e.g. runserver); in production the
+    stream process serves this URL from ``products.streaming``.
+    """
+
+    def get(self, request, pk):
+        operation = get_object_or_404(BulkOperation, pk=pk, user=request.user)
+        channel = progress_key(operation.pk)
+        # Each stream holds a Redis connection, so a user gets only a few
+        stream_id = uuid.uuid4().hex
+        if not open_stream(request.user.pk, stream_id):
+            return JsonResponse({'error': 'Too many progress streams are open.'}, status=429)
+
+        def event_stream():
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(channel)
+                # Subscribed first, so nothing is lost between reading the
+                # current state and the next published update
+                data = get_progress(operation)
+                yield f"data: {json.dumps(data)}\n\n"
+
+                while data['status'] not in ('complete', 'failed'):
+                    message = pubsub.get_message(timeout=15)
+                    if message is None:
+                        refresh_stream(request.user.pk, stream_id)
+                        # SSE comment, keeps proxies from closing an idle stream
+                        yield ": keepalive\n\n"
+                        continue
+                    data = json.loads(message['data'])
+                    yield f"data: {message['data'].decode('utf-8')}\n\n"
+            finally:
+                pubsub.close()
+                close_stream(request.user.pk, stream_id)
+
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Disable buffering in Nginx/Fly
+        return response
 
 class ActiveOperationView(LoginRequiredMixin, View):
     def get(self, request):
@@ -88,13 +261,14 @@ class ActiveOperationView(LoginRequiredMixin, View):
         if operation:
             return JsonResponse({
                 'active': True,
+                'operation_id': operation.id,
                 'task_id': operation.task_id,
                 'operation_type': operation.operation_type,
                 'status': operation.status
             })
         return JsonResponse({'active': False})
 
-class OperationListView(LoginRequiredMixin, ListView):
+class OperationListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = BulkOperation
     template_name = 'products/operation_list.html'
     context_object_name = 'operations'
@@ -111,28 +285,90 @@ class BulkDeleteView(LoginRequiredMixin, View):
         ).exists():
             return JsonResponse({'error': 'An operation is already in progress.'}, status=400)
 
+        filters = {}
+        status = request.POST.get('status')
+        if status in ('active', 'inactive'):
+            filters['is_active'] = status == 'active'
+        sku_prefix = request.POST.get('sku_prefix', '').strip()
+        if sku_prefix:
+            filters['sku_prefix'] = sku_prefix
+        for field in ('created_after', 'created_before'):
+            value = request.POST.get(field)
+            if value:
+                try:
+                    day = parse_date(value)
+                except ValueError:
+                    day = None
+                if day is None:
+                    return JsonResponse({'error': 'Invalid date.'}, status=400)
+                if field == 'created_before':
+                    # The form's dates are inclusive
+                    day += timedelta(days=1)
+                # Stored as the datetime the day starts, so created_at is
+                # compared directly and stays served by its indexes
+                filters[field] = timezone.make_aware(datetime.combine(day, time.min)).isoformat()
+
         operation = BulkOperation.objects.create(
             user=request.user,
             operation_type='delete',
-            status='pending'
+            options=filters,
+            status='pending',
+            task_id=str(uuid.uuid4())
         )
 
-        task = delete_all_products.delay(operation.id)
-        
-        operation.task_id = task.id
-        operation.save()
+        delete_all_products.apply_async(args=[operation.id], task_id=operation.task_id)
 
-        return JsonResponse({'task_id': task.id, 'operation_id': operation.id})
+        return JsonResponse({'task_id': operation.task_id, 'operation_id': operation.id})
 
-class DeleteProgressView(LoginRequiredMixin, View):
-    def get(self, request, task_id):
-        cache_key = f'delete_progress_{task_id}'
-        progress_data = cache.get(cache_key)
-        
-        if not progress_data:
-            return JsonResponse({'status': 'pending', 'progress': 0, 'message': 'Initializing...'})
-        
-        return JsonResponse(progress_data)
+class ExportView(LoginRequiredMixin, View):
+    def post(self, request):
+        if BulkOperation.objects.filter(
+            user=request.user,
+            status__in=['pending', 'processing']
+        ).exists():
+            return JsonResponse({'error': 'An operation is already in progress.'}, status=400)
+
+        export_format = request.POST.get('format', 'csv')
+        if export_format not in EXPORTERS:
+            return JsonResponse({'error': 'Invalid export format.'}, status=400)
+
+        operation = BulkOperation.objects.create(
+            user=request.user,
+            operation_type='export',
+            options={'format': export_format, 'gzip': request.POST.get('gzip') == 'on'},
+            status='pending',
+            task_id=str(uuid.uuid4())
+        )
+
+        export_products.apply_async(args=[operation.id], task_id=operation.task_id)
+
+        return JsonResponse({'task_id': operation.task_id, 'operation_id': operation.id})
+
+def _download(field_file):
+    # On S3 the browser downloads straight from the bucket via a signed URL
+    if getattr(default_storage, 'bucket', None) is not None:
+        return redirect(field_file.url)
+    return FileResponse(
+        field_file.open('rb'),
+        as_attachment=True,
+        filename=os.path.basename(field_file.name)
+    )
+
+class ExportDownloadView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        operation = get_object_or_404(
+            BulkOperation, pk=pk, user=request.user, operation_type='export', status='completed'
+        )
+        if not operation.output_file:
+            raise Http404('Export file not found')
+        return _download(operation.output_file)
+
+class ImportErrorsDownloadView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        operation = get_object_or_404(BulkOperation, pk=pk, user=request.user, operation_type='import')
+        if not operation.error_file:
+            raise Http404('Error report not found')
+        return _download(operation.error_file)
 
 class ProductCreateView(LoginRequiredMixin, View):
     def post(self, request):
@@ -150,7 +386,7 @@ class ProductCreateView(LoginRequiredMixin, View):
             description=description,
             is_active=is_active
         )
-        send_webhook_notification.delay(request.user.id, 'product.created', {'sku': sku, 'name': name})
+        enqueue_webhook_notification(request.user.id, 'product.created', {'sku': sku, 'name': name})
         return JsonResponse({'message': 'Product created successfully', 'id': product.id})
 
 class ProductUpdateView(LoginRequiredMixin, View):
@@ -173,7 +409,7 @@ class ProductUpdateView(LoginRequiredMixin, View):
         product.is_active = data.get('is_active', product.is_active)
         product.save()
         
-        send_webhook_notification.delay(request.user.id, 'product.updated', {'sku': product.sku, 'name': product.name})
+        enqueue_webhook_notification(request.user.id, 'product.updated', {'sku': product.sku, 'name': product.name})
         return JsonResponse({'message': 'Product updated successfully'})
 
 class ProductDeleteView(LoginRequiredMixin, View):
@@ -182,7 +418,7 @@ class ProductDeleteView(LoginRequiredMixin, View):
             product = Product.objects.get(pk=pk, user=request.user)
             sku = product.sku
             product.delete()
-            send_webhook_notification.delay(request.user.id, 'product.deleted', {'sku': sku})
+            enqueue_webhook_notification(request.user.id, 'product.deleted', {'sku': sku})
             return JsonResponse({'message': 'Product deleted successfully'})
         except Product.DoesNotExist:
             return JsonResponse({'error': 'Product not found'}, status=404)
@@ -0,0 +1,80 @@
+"""Redis buffers for batched webhooks.
+
+Each batched webhook has a Redis list of JSON-encoded events in arrival order,
+plus two marker keys: one saying a timed flush is already scheduled, and a
+lock held by the single flush that may send for the webhook at any one time.
+"""
+import json
+import uuid
+
+from acme_project.redis_pool import get_redis
+
+# Compare-and-delete, so a flush never releases a lock that expired and was
+# taken over by another flush
+_RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+LOCK_TIMEOUT = 120
+
+
+def _buffer_key(webhook_id):
+    return f'webhook_batch_{webhook_id}'
+
+
+def _scheduled_key(webhook_id):
+    return f'webhook_batch_scheduled_{webhook_id}'
+
+
+def _lock_key(webhook_id):
+    return f'webhook_batch_lock_{webhook_id}'
+
+
+def push(webhook_id, data, window):
+    """Append an event. Returns ``(buffered, schedule)``.
+
+    ``schedule`` is true when no timed flush was pending yet, in which case
+    the caller must schedule one ``window`` seconds out.
+    """
+    pipe = get_redis().pipeline()
+    pipe.rpush(_buffer_key(webhook_id), json.dumps(data))
+    pipe.set(_scheduled_key(webhook_id), 1, nx=True, ex=window + LOCK_TIMEOUT)
+    buffered, schedule = pipe.execute()
+    return buffered, bool(schedule)
+
+
+def pop(webhook_id, size):
+    """Remove and return up to ``size`` of the oldest buffered events."""
+    pipe = get_redis().pipeline()
+    pipe.lrange(_buffer_key(webhook_id), 0, size - 1)
+    pipe.ltrim(_buffer_key(webhook_id), size, -1)
+    items, _ = pipe.execute()
+    return [json.loads(item) for item in items]
+
+
+def buffered(webhook_id):
+    return get_redis().llen(_buffer_key(webhook_id))
+
+
+def clear_scheduled(webhook_id):
+    get_redis().delete(_scheduled_key(webhook_id))
+
+
+def discard(webhook_id):
+    """Drop the buffered events and the timed flush marker of a webhook that no longer sends."""
+    get_redis().delete(_buffer_key(webhook_id), _scheduled_key(webhook_id))
+
+
+def acquire_lock(webhook_id):
+    """Return a lock token, or ``None`` if another flush holds the lock."""
+    token = uuid.uuid4().hex
+    if get_redis().set(_lock_key(webhook_id), token, nx=True, ex=LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def release_lock(webhook_id, token):
+    get_redis().eval(_RELEASE_LOCK, 1, _lock_key(webhook_id), token)
@@ -0,0 +1,64 @@
+"""Per-host circuit breaker for outbound webhooks, shared by all workers through Redis.
+
+closed: deliveries go out normally. Failures are counted over a sliding
+    WEBHOOK_CIRCUIT_FAILURE_WINDOW, and WEBHOOK_CIRCUIT_FAILURE_THRESHOLD of
+    them open the circuit.
+open: nothing is sent to the host for WEBHOOK_CIRCUIT_COOLDOWN_SECONDS;
+    deliveries are deferred instead of waiting on timeouts.
+half-open: once the cooldown ends, a single probe delivery is let through. Its
+    success closes the circuit, its failure opens it again.
+"""
+from django.conf import settings
+
+from acme_project.redis_pool import get_redis
+
+
+def _keys(host):
+    return (
+        f'webhook_circuit_open_{host}',
+        f'webhook_circuit_tripped_{host}',
+        f'webhook_circuit_probe_{host}',
+        f'webhook_circuit_failures_{host}',
+    )
+
+
+def allow(host):
+    """Return whether a delivery to ``host`` may be sent now."""
+    open_key, tripped_key, probe_key, _ = _keys(host)
+    redis = get_redis()
+    is_open, tripped = redis.exists(open_key), redis.exists(tripped_key)
+    if is_open:
+        return False
+    if tripped:
+        # Half-open: only the delivery that wins the probe slot goes out
+        return bool(redis.set(probe_key, 1, nx=True, ex=int(settings.WEBHOOK_TIMEOUT * 2) + 60))
+    return True
+
+
+def retry_after(host):
+    """Seconds until an open circuit for ``host`` half-opens."""
+    ttl = get_redis().ttl(_keys(host)[0])
+    return ttl if ttl and ttl > 0 else settings.WEBHOOK_CIRCUIT_COOLDOWN_SECONDS
+
+
+def record_success(host):
+    get_redis().delete(*_keys(host))
+
+
+def record_failure(host):
+    open_key, tripped_key, probe_key, failures_key = _keys(host)
+    redis = get_redis()
+    pipe = redis.pipeline()
+    pipe.incr(failures_key)
+    pipe.expire(failures_key, settings.WEBHOOK_CIRCUIT_FAILURE_WINDOW)
+    pipe.exists(tripped_key)
+    failures, _, tripped = pipe.execute()
+
+    if tripped or failures >= settings.WEBHOOK_CIRCUIT_FAILURE_THRESHOLD:
+        cooldown = settings.WEBHOOK_CIRCUIT_COOLDOWN_SECONDS
+        pipe = redis.pipeline()
+        pipe.set(open_key, 1, ex=cooldown)
+        # Remembers that the circuit is not closed once the open key expires
+        pipe.set(tripped_key, 1, ex=cooldown * 20)
+        pipe.delete(probe_key, failures_key)
+        pipe.execute()
@@ -0,0 +1,96 @@
+"""Concurrent webhook delivery over pooled keep-alive connections.
+
+All requests from a worker process share one ``requests.Session``, so
+connections to a receiver are reused across deliveries and tasks. A
+process-wide thread pool sends to several endpoints at once. A semaphore per
+host caps how many of those requests can hit the same receiver concurrently.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DeliveryResult = namedtuple('DeliveryResult', ['url', 'ok', 'status_code', 'error', 'response_text'])
+
+_lock = threading.Lock()
+_session = None
+_executor = None
+_host_slots = {}
+
+
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            # One pool per host, sized to the per-host concurrency limit, so
+            # every in-flight request to a host can hold a kept-alive connection
+            adapter = HTTPAdapter(
+                pool_connections=settings.WEBHOOK_DELIVERY_THREADS,
+                pool_maxsize=settings.WEBHOOK_MAX_CONNECTIONS_PER_HOST
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def _get_executor():
+    # Created lazily so each forked Celery worker process gets its own threads
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.WEBHOOK_DELIVERY_THREADS,
+                thread_name_prefix='webhook-delivery'
+            )
+        return _executor
+
+
+def _host_slot(url):
+    host = host_of(url)
+    with _lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(settings.WEBHOOK_MAX_CONNECTIONS_PER_HOST)
+        return _host_slots[host]
+
+
+def host_of(url):
+    return urlsplit(url).netloc.lower()
+
+
+def post(url, data, delay=0):
+    """POST ``data`` as JSON to ``url`` after ``delay`` seconds. Never raises; returns a ``DeliveryResult``."""
+    if delay:
+        time.sleep(delay)
+    with _host_slot(url):
+        try:
+            response = get_session().post(url, json=data, timeout=settings.WEBHOOK_TIMEOUT)
+            response.raise_for_status()
+            return DeliveryResult(url, True, response.status_code, None, None)
+        except requests.RequestException as e:
+            response = getattr(e, 'response', None)
+            return DeliveryResult(
+                url,
+                False,
+                response.status_code if response is not None else None,
+                str(e),
+                response.text if response is not None else None
+            )
+
+
+def post_many(deliveries):
+    """POST each ``(url, data)`` or ``(url, data, delay)`` concurrently; results are in the same order."""
+    if len(deliveries) <= 1:
+        return [post(*delivery) for delivery in deliveries]
+    executor = _get_executor()
+    futures = [executor.submit(post, *delivery) for delivery in deliveries]
+    return [future.result() for future in futures]
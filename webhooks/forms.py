@@ -1,5 +1,5 @@
 from django import forms
-from .models import Webhook
+from .models import Webhook, WebhookEndpoint
 
 class WebhookForm(forms.ModelForm):
     events = forms.MultipleChoiceField(
@@ -10,8 +10,54 @@ class WebhookForm(forms.ModelForm):
 
     class Meta:
         model = Webhook
-        fields = ['url', 'events', 'is_active']
+        fields = ['url', 'events', 'is_active', 'batch_enabled', 'batch_max_size', 'batch_window_seconds', 'max_rps']
         widgets = {
             'url': forms.URLInput(attrs={'class': 'form-control'}),
             'is_active': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+            'batch_enabled': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+            'batch_max_size': forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'max': 1000}),
+            'batch_window_seconds': forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'max': 300}),
+            'max_rps': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
         }
+
+    def clean_batch_max_size(self):
+        value = self.cleaned_data['batch_max_size']
+        if not 1 <= value <= 1000:
+            raise forms.ValidationError('Must be between 1 and 1000.')
+        return value
+
+    def clean_batch_window_seconds(self):
+        value = self.cleaned_data['batch_window_seconds']
+        if not 1 <= value <= 300:
+            raise forms.ValidationError('Must be between 1 and 300 seconds.')
+        return value
+
+    def clean_max_rps(self):
+        value = self.cleaned_data['max_rps']
+        # Empty means no limit; 0 would stop deliveries altogether
+        if value is not None and value < 1:
+            raise forms.ValidationError('Must be at least 1, or empty for no limit.')
+        return value
+
+
+class WebhookEndpointForm(forms.ModelForm):
+    class Meta:
+        model = WebhookEndpoint
+        fields = ['max_requests', 'max_age_days']
+        widgets = {
+            'max_requests': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
+            'max_age_days': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
+        }
+
+    def clean_max_requests(self):
+        value = self.cleaned_data['max_requests']
+        # Empty falls back to WEBHOOK_REQUEST_MAX_ROWS in prune_webhook_requests
+        if value is not None and value < 1:
+            raise forms.ValidationError('Must be at least 1, or empty for the default.')
+        return value
+
+    def clean_max_age_days(self):
+        value = self.cleaned_data['max_age_days']
+        if value is not None and value < 1:
+            raise forms.ValidationError('Must be at least 1, or empty for the default.')
+        return value
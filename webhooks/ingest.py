@@ -0,0 +1,63 @@
+"""Write-behind buffer for requests received by the webhook tester.
+
+The receiver looks its endpoint up in the cache, then appends the request as
+JSON to a single Redis list and publishes the same JSON to the endpoint's
+stream in one pipeline. ``flush_webhook_requests`` drains the list into
+``WebhookRequest`` rows with ``bulk_create``. As with webhook batching, a
+marker key ensures only one timed flush is scheduled at a time.
+"""
+import json
+
+from django.core.cache import cache
+
+from acme_project.redis_pool import get_redis
+from .models import WebhookEndpoint
+
+BUFFER_KEY = 'webhook_requests_buffer'
+SCHEDULED_KEY = 'webhook_requests_flush_scheduled'
+ENDPOINT_CACHE_TIMEOUT = 3600
+# Unknown tokens are cached briefly too, so a flood of bad requests does not
+# reach the database
+MISSING_ENDPOINT_CACHE_TIMEOUT = 60
+
+
+def get_endpoint_id(token):
+    """Return the id of the endpoint for ``token``, or ``None`` if there is none."""
+    key = f'webhook_endpoint_{token}'
+    endpoint_id = cache.get(key)
+    if endpoint_id is None:
+        endpoint_id = WebhookEndpoint.objects.filter(token=token).values_list('id', flat=True).first() or 0
+        cache.set(key, endpoint_id, timeout=ENDPOINT_CACHE_TIMEOUT if endpoint_id else MISSING_ENDPOINT_CACHE_TIMEOUT)
+    return endpoint_id or None
+
+
+def push(token, record, window):
+    """Buffer ``record`` and publish it to the endpoint's stream. Returns ``(buffered, schedule)``.
+
+    ``schedule`` is true when no timed flush was pending yet, in which case
+    the caller must schedule one ``window`` seconds out.
+    """
+    data = json.dumps(record)
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.rpush(BUFFER_KEY, data)
+    pipe.set(SCHEDULED_KEY, 1, nx=True, ex=window * 10)
+    pipe.publish(f'webhook_stream_{token}', data)
+    buffered, schedule, _ = pipe.execute()
+    return buffered, bool(schedule)
+
+
+def publish(token, record):
+    get_redis().publish(f'webhook_stream_{token}', json.dumps(record))
+
+
+def pop(size):
+    """Remove and return up to ``size`` of the oldest buffered records."""
+    pipe = get_redis().pipeline()
+    pipe.lrange(BUFFER_KEY, 0, size - 1)
+    pipe.ltrim(BUFFER_KEY, size, -1)
+    items, _ = pipe.execute()
+    return [json.loads(item) for item in items]
+
+
+def clear_scheduled():
+    get_redis().delete(SCHEDULED_KEY)
@@ -0,0 +1,81 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand
+
+from webhooks.delivery import post_many
+
+
+class _ReceiverHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive between requests
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Compare sequential and pooled concurrent webhook delivery against local stand-in receivers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', type=int, default=20, help='Webhooks subscribed to the event')
+        parser.add_argument('--hosts', type=int, default=4, help='Receiver hosts the endpoints are spread over')
+        parser.add_argument('--latency', type=float, default=0.2, help='Seconds each receiver takes to respond')
+        parser.add_argument('--events', type=int, default=5, help='Events delivered per run')
+
+    def handle(self, *args, **options):
+        servers = []
+        for _ in range(options['hosts']):
+            server = ThreadingHTTPServer(('127.0.0.1', 0), _ReceiverHandler)
+            server.daemon_threads = True
+            server.latency = options['latency']
+            server.lock = threading.Lock()
+            server.connections = 0
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+
+        urls = [
+            f'http://127.0.0.1:{servers[i % len(servers)].server_port}/hook/{i}'
+            for i in range(options['endpoints'])
+        ]
+        data = {'event': 'product.updated', 'payload': {'sku': 'bench', 'name': 'Benchmark'}}
+
+        try:
+            self._run('sequential requests.post', servers, options['events'], lambda: [
+                requests.post(url, json=data, timeout=5).raise_for_status() for url in urls
+            ])
+            self._run('pooled concurrent (webhooks.delivery)', servers, options['events'], lambda: [
+                result.ok or self.stderr.write(result.error) for result in post_many([(url, data) for url in urls])
+            ])
+        finally:
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+
+    def _run(self, label, servers, events, deliver):
+        for server in servers:
+            server.connections = 0
+        started = time.perf_counter()
+        for _ in range(events):
+            deliver()
+        elapsed = time.perf_counter() - started
+        connections = sum(server.connections for server in servers)
+        self.stdout.write(
+            f'{label}: {elapsed:.2f}s for {events} events '
+            f'({elapsed / events * 1000:.0f} ms/event, {connections} TCP connections opened)'
+        )
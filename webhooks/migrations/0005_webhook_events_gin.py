@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:06
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0004_webhookdelivery'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='webhook',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['events'], name='webhook_events_gin'),
+        ),
+    ]
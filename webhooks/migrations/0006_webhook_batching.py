@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0005_webhook_events_gin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhook',
+            name='batch_enabled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='webhook',
+            name='batch_max_size',
+            field=models.PositiveIntegerField(default=100),
+        ),
+        migrations.AddField(
+            model_name='webhook',
+            name='batch_window_seconds',
+            field=models.PositiveIntegerField(default=5),
+        ),
+    ]
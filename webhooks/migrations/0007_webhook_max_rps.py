@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0006_webhook_batching'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhook',
+            name='max_rps',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
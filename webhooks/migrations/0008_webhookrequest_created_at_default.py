@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:15
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0007_webhook_max_rps'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='webhookrequest',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0008_webhookrequest_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookendpoint',
+            name='max_age_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='webhookendpoint',
+            name='max_requests',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='webhookrequest',
+            name='body_compressed',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='webhookrequest',
+            name='body',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddIndex(
+            model_name='webhookrequest',
+            index=models.Index(fields=['endpoint', '-created_at'], name='webhookrequest_endpoint_recent'),
+        ),
+        migrations.AlterField(
+            model_name='webhookrequest',
+            name='endpoint',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='requests', to='webhooks.webhookendpoint'),
+        ),
+    ]
@@ -1,44 +1,116 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
 from django.contrib.auth.models import User
+from django.utils import timezone
 import uuid
+import zlib
 
 class Webhook(models.Model):
     EVENT_CHOICES = [
         ('product.created', 'Product Created'),
         ('product.updated', 'Product Updated'),
         ('product.deleted', 'Product Deleted'),
+        # Sent by the products API, once per batch (see products.api)
+        ('product.batch_created', 'Products Created (API batch)'),
+        ('product.batch_updated', 'Products Updated (API batch)'),
+        ('product.batch_deleted', 'Products Deleted (API batch)'),
         ('import.completed', 'Import Completed'),
         ('bulk_delete.completed', 'Bulk Delete Completed'),
+        ('export.completed', 'Export Completed'),
     ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='webhooks')
     url = models.URLField()
     events = models.JSONField(default=list)
     is_active = models.BooleanField(default=True)
+    # Opt-in batching: events are buffered and sent as one array payload once
+    # batch_max_size events are waiting or batch_window_seconds have passed.
+    batch_enabled = models.BooleanField(default=False)
+    batch_max_size = models.PositiveIntegerField(default=100)
+    batch_window_seconds = models.PositiveIntegerField(default=5)
+    # Requests per second the receiver accepts; empty means no limit
+    max_rps = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Subscription lookups: events @> '["product.created"]'
+            GinIndex(fields=['events'], name='webhook_events_gin'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.url}"
 
+class WebhookDelivery(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('succeeded', 'Succeeded'),
+        ('retrying', 'Retrying'),
+        ('dead', 'Dead'),
+    ]
+
+    webhook = models.ForeignKey(Webhook, on_delete=models.CASCADE, related_name='deliveries')
+    event_type = models.CharField(max_length=50)
+    # The full request body, e.g. {'event': ..., 'payload': ...}
+    data = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    last_status_code = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Due retries are picked with status IN ('pending', 'retrying') AND next_attempt_at <= now
+            models.Index(fields=['status', 'next_attempt_at'], name='delivery_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} -> {self.webhook.url} ({self.status})"
+
 class WebhookEndpoint(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='webhook_endpoints')
     token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Retention, enforced by prune_webhook_requests; empty means the
+    # WEBHOOK_REQUEST_MAX_ROWS / WEBHOOK_REQUEST_MAX_AGE_DAYS defaults
+    max_requests = models.PositiveIntegerField(null=True, blank=True)
+    max_age_days = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return str(self.token)
 
 class WebhookRequest(models.Model):
-    endpoint = models.ForeignKey(WebhookEndpoint, on_delete=models.CASCADE, related_name='requests')
+    # Indexed by the (endpoint, -created_at) index below
+    endpoint = models.ForeignKey(WebhookEndpoint, on_delete=models.CASCADE, related_name='requests', db_index=False)
     headers = models.JSONField()
-    body = models.TextField()
+    # Only set on rows saved before bodies were compressed; use get_body()
+    body = models.TextField(blank=True, default='')
+    body_compressed = models.BinaryField(null=True, editable=False)
     method = models.CharField(max_length=10)
     query_params = models.JSONField(default=dict)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: buffered requests keep the time they were received
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Serves "latest N requests for an endpoint" and the retention cutoffs
+            models.Index(fields=['endpoint', '-created_at'], name='webhookrequest_endpoint_recent'),
+        ]
 
     def __str__(self):
         return f"{self.method} - {self.created_at}"
+
+    @staticmethod
+    def compress_body(text):
+        return zlib.compress(text.encode('utf-8'))
+
+    def get_body(self):
+        if self.body_compressed is None:
+            return self.body
+        return zlib.decompress(self.body_compressed).decode('utf-8')
@@ -0,0 +1,46 @@
+"""Per-webhook rate limiting for outbound deliveries, shared by all workers through Redis.
+
+Uses GCRA, the "virtual scheduling" form of a token bucket: the bucket refills
+at ``max_rps`` tokens per second and holds up to ``max_rps`` tokens. Only one
+timestamp per webhook is stored.
+"""
+import time
+
+from acme_project.redis_pool import get_redis
+
+# KEYS[1]: bucket key. ARGV: now, emission interval, burst tolerance (all in
+# seconds) and the longest wait the caller accepts. Reserves a slot and
+# returns the wait before it as a string, or returns the wait without
+# reserving when it exceeds the limit (prefixed with '-').
+_RESERVE = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local tolerance = tonumber(ARGV[3])
+local max_wait = tonumber(ARGV[4])
+local tat = tonumber(redis.call('get', KEYS[1]) or now)
+tat = math.max(tat, now)
+local wait = math.max(tat - tolerance - now, 0)
+if wait > max_wait then
+    return '-' .. tostring(wait)
+end
+local new_tat = tat + interval
+redis.call('set', KEYS[1], tostring(new_tat), 'EX', math.ceil(new_tat - now) + 1)
+return tostring(wait)
+"""
+
+
+def reserve(webhook_id, max_rps, max_wait):
+    """Reserve a send slot for ``webhook_id``. Returns ``(reserved, wait_seconds)``.
+
+    When the next free slot is more than ``max_wait`` seconds away nothing is
+    reserved, and ``wait_seconds`` says when to try again.
+    """
+    interval = 1.0 / max_rps
+    tolerance = interval * (max_rps - 1)
+    result = get_redis().eval(
+        _RESERVE, 1, f'webhook_rate_{webhook_id}', repr(time.time()), repr(interval), repr(tolerance), repr(max_wait)
+    )
+    result = result.decode() if isinstance(result, bytes) else result
+    if result.startswith('-'):
+        return False, float(result[1:])
+    return True, float(result)
@@ -0,0 +1,34 @@
+"""Async Server-Sent Events endpoint for the webhook tester.
+
+Served for the ``webhook_stream`` URL by ``stream_application`` in
+``acme_project/asgi.py``, a process of its own (see STREAM_ORIGIN and
+``acme_project.sse``). Without a stream origin (e.g. runserver) the
+synchronous ``WebhookStreamView`` serves the same URL.
+"""
+import re
+
+from asgiref.sync import sync_to_async
+
+from acme_project.sse import send_status, session_user, stream
+from .models import WebhookEndpoint
+
+STREAM_PATH = re.compile(r'^/webhooks/tester/(?P<token>[0-9a-f-]{36})/stream/$')
+
+
+@sync_to_async
+def _authorize(scope, token):
+    """Mirror WebhookStreamView: a logged-in user and an existing endpoint."""
+    if not session_user(scope).is_authenticated:
+        return 403
+    if not WebhookEndpoint.objects.filter(token=token).exists():
+        return 404
+    return 200
+
+
+async def webhook_stream_app(scope, receive, send):
+    token = STREAM_PATH.match(scope['path'])['token']
+    status = await _authorize(scope, token)
+    if status != 200:
+        await send_status(send, status)
+        return
+    await stream(scope, receive, send, f'webhook_stream_{token}')
@@ -0,0 +1,68 @@
+"""Per-user cache of how each event type a user subscribes to is delivered.
+
+Lets callers skip enqueueing ``send_webhook_notification`` (and the task its
+database query) when nobody is listening, and buffer events for batched
+webhooks without queueing a task per event. The cache is invalidated whenever
+a user's webhooks are created, updated or deleted.
+"""
+from django.core.cache import cache
+
+from .models import Webhook
+from .tasks import buffer_event, send_webhook_notification
+
+SUBSCRIPTION_CACHE_TIMEOUT = 3600
+
+
+def _cache_key(user_id):
+    return f'webhook_routes_{user_id}'
+
+
+def get_routes(user_id):
+    """Return ``{'immediate': [event, ...], 'batched': [{'id', 'events', 'max_size', 'window'}, ...]}``."""
+    routes = cache.get(_cache_key(user_id))
+    if routes is None:
+        immediate = set()
+        batched = []
+        for webhook in Webhook.objects.filter(user_id=user_id, is_active=True).only(
+            'events', 'batch_enabled', 'batch_max_size', 'batch_window_seconds'
+        ):
+            if webhook.batch_enabled:
+                batched.append({
+                    'id': webhook.id,
+                    'events': webhook.events,
+                    'max_size': webhook.batch_max_size,
+                    'window': webhook.batch_window_seconds,
+                })
+            else:
+                immediate.update(webhook.events)
+        routes = {'immediate': sorted(immediate), 'batched': batched}
+        cache.set(_cache_key(user_id), routes, timeout=SUBSCRIPTION_CACHE_TIMEOUT)
+    return routes
+
+
+def is_subscribed(user_id, event_type):
+    routes = get_routes(user_id)
+    return event_type in routes['immediate'] or any(event_type in route['events'] for route in routes['batched'])
+
+
+def invalidate_subscriptions(user_id):
+    cache.delete(_cache_key(user_id))
+
+
+def enqueue_webhook_notification(user_id, event_type, payload):
+    """Dispatch ``event_type`` to the user's subscribed webhooks.
+
+    Unbatched webhooks get a ``send_webhook_notification`` task, queued only if
+    one of them wants the event. Batched webhooks get the event appended to
+    their buffer (see ``webhooks.batching``).
+    """
+    routes = get_routes(user_id)
+    data = {
+        'event': event_type,
+        'payload': payload
+    }
+    for route in routes['batched']:
+        if event_type in route['events']:
+            buffer_event(route, data)
+    if event_type in routes['immediate']:
+        send_webhook_notification.delay(user_id, event_type, payload)
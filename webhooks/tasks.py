@@ -1,30 +1,272 @@
-import requests
 import logging
+import random
+from datetime import timedelta
 from celery import shared_task
-from .models import Webhook
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Webhook, WebhookDelivery, WebhookEndpoint, WebhookRequest
+from .delivery import host_of, post_many
+from . import batching, circuit, ingest, ratelimit
 
 logger = logging.getLogger(__name__)
 
 @shared_task
 def send_webhook_notification(user_id, event_type, payload):
-    # Filter webhooks that are active AND have the event_type in their events list
-    webhooks = Webhook.objects.filter(user_id=user_id, is_active=True)
-    
+    # Active webhooks subscribed to event_type (jsonb @>, served by the GIN index).
+    # Batched webhooks receive events through their buffer instead.
+    webhooks = list(Webhook.objects.filter(
+        user_id=user_id, is_active=True, batch_enabled=False, events__contains=[event_type]
+    ))
+    if not webhooks:
+        return
+
     data = {
         'event': event_type,
         'payload': payload
     }
-    
-    for webhook in webhooks:
-        # Check if event is subscribed
-        if event_type not in webhook.events:
+
+    # Record every delivery before sending, so nothing is lost if this worker
+    # dies: the lease expires and retry_webhook_deliveries picks them up.
+    lease = _lease_until(timezone.now())
+    deliveries = WebhookDelivery.objects.bulk_create([
+        WebhookDelivery(webhook=webhook, event_type=event_type, data=data, next_attempt_at=lease)
+        for webhook in webhooks
+    ])
+    _attempt_deliveries(deliveries)
+
+def buffer_event(route, data):
+    """Buffer ``data`` for a batched webhook (a route from ``webhooks.subscriptions``)."""
+    buffered, schedule = batching.push(route['id'], data, route['window'])
+    if buffered == route['max_size']:
+        flush_webhook_batch.delay(route['id'])
+    elif schedule:
+        flush_webhook_batch.apply_async((route['id'],), countdown=route['window'])
+
+@shared_task
+def flush_webhook_batch(webhook_id):
+    """Send a batched webhook's buffered events as array payloads, oldest first."""
+    try:
+        webhook = Webhook.objects.get(pk=webhook_id)
+    except Webhook.DoesNotExist:
+        batching.discard(webhook_id)
+        return
+    if not webhook.is_active:
+        # Deactivated after these events were buffered
+        batching.discard(webhook_id)
+        return
+
+    token = batching.acquire_lock(webhook_id)
+    if token is None:
+        # Another flush is sending for this webhook; try again shortly
+        flush_webhook_batch.apply_async((webhook_id,), countdown=1)
+        return
+
+    try:
+        batching.clear_scheduled(webhook_id)
+        while True:
+            # Preserve order: hold new batches back while an earlier one is
+            # still waiting to be retried
+            waiting = WebhookDelivery.objects.filter(
+                webhook=webhook, event_type='batch', status__in=['pending', 'retrying']
+            ).order_by('next_attempt_at').only('next_attempt_at').first()
+            if waiting is not None:
+                delay = max((waiting.next_attempt_at - timezone.now()).total_seconds(), 0)
+                flush_webhook_batch.apply_async((webhook_id,), countdown=delay + webhook.batch_window_seconds)
+                return
+
+            events = batching.pop(webhook_id, webhook.batch_max_size)
+            if not events:
+                return
+            delivery = WebhookDelivery.objects.create(
+                webhook=webhook,
+                event_type='batch',
+                data={'event': 'batch', 'events': events},
+                next_attempt_at=_lease_until(timezone.now())
+            )
+            _attempt_deliveries([delivery])
+
+            # Keep going only while full batches are waiting; a partial batch
+            # waits for its window like any other
+            remaining = batching.buffered(webhook_id)
+            if remaining < webhook.batch_max_size:
+                if remaining:
+                    flush_webhook_batch.apply_async((webhook_id,), countdown=webhook.batch_window_seconds)
+                return
+    finally:
+        batching.release_lock(webhook_id, token)
+
+@shared_task
+def flush_webhook_requests():
+    """Insert requests buffered by the webhook tester receiver (see ``webhooks.ingest``).
+
+    Records are popped before they are inserted, so a worker dying in between
+    loses that batch. That is acceptable for tester traffic.
+    """
+    # Cleared first, so requests arriving during the flush schedule the next one
+    ingest.clear_scheduled()
+    size = settings.WEBHOOK_REQUEST_FLUSH_SIZE
+    while True:
+        records = ingest.pop(size)
+        if not records:
+            return
+        # Skip endpoints deleted since their requests were buffered
+        endpoint_ids = set(
+            WebhookEndpoint.objects.filter(id__in={r['endpoint_id'] for r in records}).values_list('id', flat=True)
+        )
+        WebhookRequest.objects.bulk_create([
+            WebhookRequest(
+                endpoint_id=record['endpoint_id'],
+                headers=record['headers'],
+                body_compressed=WebhookRequest.compress_body(record['body']),
+                method=record['method'],
+                query_params=record['query_params'],
+                created_at=parse_datetime(record['created_at'])
+            )
+            for record in records if record['endpoint_id'] in endpoint_ids
+        ])
+        logger.info(f"Flushed {len(records)} webhook tester requests")
+        if len(records) < size:
+            return
+
+@shared_task
+def prune_webhook_requests():
+    """Delete tester requests beyond each endpoint's retention. Runs periodically from beat."""
+    now = timezone.now()
+    batch_size = settings.WEBHOOK_REQUEST_PRUNE_BATCH_SIZE
+    for endpoint in WebhookEndpoint.objects.only('id', 'max_requests', 'max_age_days').iterator():
+        max_rows = endpoint.max_requests or settings.WEBHOOK_REQUEST_MAX_ROWS
+        max_age = endpoint.max_age_days or settings.WEBHOOK_REQUEST_MAX_AGE_DAYS
+        requests = WebhookRequest.objects.filter(endpoint_id=endpoint.id)
+
+        # Everything at or before the cutoff goes: the max-age boundary, or the
+        # newest row past max_rows if that is later. Both are index lookups.
+        cutoff = now - timedelta(days=max_age)
+        oldest_kept = requests.order_by('-created_at').values_list('created_at', flat=True)[max_rows:max_rows + 1]
+        if oldest_kept and oldest_kept[0] > cutoff:
+            cutoff = oldest_kept[0]
+
+        # DELETE ... WHERE id IN (SELECT id ... LIMIT batch_size): each batch is
+        # one statement, and no ids pass through Python
+        deleted = 0
+        while True:
+            batch = requests.filter(created_at__lte=cutoff).order_by('created_at').values('id')[:batch_size]
+            count = WebhookRequest.objects.filter(id__in=batch).delete()[0]
+            deleted += count
+            if count < batch_size:
+                break
+        if deleted:
+            logger.info(f"Pruned {deleted} requests for webhook endpoint {endpoint.id}")
+
+@shared_task
+def retry_webhook_deliveries():
+    """Retry deliveries whose backoff (or lease, for interrupted sends) has elapsed. Runs periodically from beat."""
+    now = timezone.now()
+    with transaction.atomic():
+        deliveries = list(
+            WebhookDelivery.objects.select_for_update(skip_locked=True)
+            .select_related('webhook')
+            .filter(status__in=['pending', 'retrying'], next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:settings.WEBHOOK_RETRY_BATCH_SIZE]
+        )
+        # Lease the claimed rows so an overlapping run skips them. If this
+        # worker dies mid-send, they become due again once the lease expires.
+        WebhookDelivery.objects.filter(pk__in=[d.pk for d in deliveries]).update(next_attempt_at=_lease_until(now))
+
+    inactive = [d for d in deliveries if not d.webhook.is_active]
+    for delivery in inactive:
+        delivery.updated_at = now
+        delivery.status = 'dead'
+        delivery.next_attempt_at = None
+        delivery.last_error = 'Webhook is inactive'
+    WebhookDelivery.objects.bulk_update(inactive, ['status', 'next_attempt_at', 'last_error', 'updated_at'])
+
+    _attempt_deliveries([d for d in deliveries if d.webhook.is_active])
+
+def _lease_until(now):
+    # Long enough for one delivery attempt, including waiting for a host slot
+    return now + timedelta(seconds=settings.WEBHOOK_TIMEOUT * 2 + 60)
+
+def retry_delay(attempts):
+    """Seconds to wait after ``attempts`` failed attempts.
+
+    Exponential backoff with full jitter: a random delay between zero and the
+    exponential cap. Deliveries that failed together (e.g. during a receiver
+    outage) are spread out instead of retrying in lockstep.
+    """
+    cap = min(settings.WEBHOOK_RETRY_MAX_SECONDS, settings.WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return random.uniform(0, cap)
+
+def _counts_against_circuit(result):
+    # Timeouts, connection errors and server errors mean the receiver is
+    # struggling; other 4xx responses mean it is up but rejected the request.
+    return result.status_code is None or result.status_code >= 500 or result.status_code in (408, 429)
+
+def _defer(delivery, now, seconds, reason):
+    # Not an attempt: the delivery never left, so it doesn't use up retries
+    delivery.status = 'retrying'
+    delivery.next_attempt_at = now + timedelta(seconds=seconds + random.uniform(0, seconds / 4 + 1))
+    delivery.last_error = reason
+    delivery.updated_at = now
+
+def _attempt_deliveries(deliveries):
+    if not deliveries:
+        return
+
+    now = timezone.now()
+    sending = []
+    outgoing = []
+    for delivery in deliveries:
+        host = host_of(delivery.webhook.url)
+        if not circuit.allow(host):
+            _defer(delivery, now, circuit.retry_after(host), f"Circuit open for {host}")
             continue
-            
-        try:
-            response = requests.post(webhook.url, json=data, timeout=5)
-            response.raise_for_status()
-            logger.info(f"Webhook sent to {webhook.url} for event {event_type}. Status: {response.status_code}")
-        except requests.RequestException as e:
-            logger.error(f"Failed to send webhook to {webhook.url}: {str(e)}")
-            if hasattr(e, 'response') and e.response is not None:
-                 logger.error(f"Response content: {e.response.text}")
+
+        delay = 0
+        if delivery.webhook.max_rps:
+            reserved, delay = ratelimit.reserve(
+                delivery.webhook_id, delivery.webhook.max_rps, settings.WEBHOOK_RATE_LIMIT_MAX_WAIT
+            )
+            if not reserved:
+                _defer(delivery, now, delay, f"Rate limited to {delivery.webhook.max_rps} requests/s")
+                continue
+
+        sending.append(delivery)
+        outgoing.append((delivery.webhook.url, delivery.data, delay))
+
+    results = post_many(outgoing)
+    now = timezone.now()
+
+    for delivery, result in zip(sending, results):
+        host = host_of(result.url)
+        if _counts_against_circuit(result):
+            circuit.record_failure(host)
+        else:
+            circuit.record_success(host)
+
+        delivery.attempts += 1
+        delivery.updated_at = now
+        delivery.last_status_code = result.status_code
+        if result.ok:
+            logger.info(f"Webhook sent to {result.url} for event {delivery.event_type}. Status: {result.status_code}")
+            delivery.status = 'succeeded'
+            delivery.next_attempt_at = None
+            delivery.last_error = ''
+            continue
+
+        logger.error(f"Failed to send webhook to {result.url} (attempt {delivery.attempts}): {result.error}")
+        if result.response_text is not None:
+            logger.error(f"Response content: {result.response_text}")
+        delivery.last_error = result.error
+        if delivery.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+            delivery.status = 'dead'
+            delivery.next_attempt_at = None
+        else:
+            delivery.status = 'retrying'
+            delivery.next_attempt_at = now + timedelta(seconds=retry_delay(delivery.attempts))
+
+    WebhookDelivery.objects.bulk_update(
+        deliveries,
+        ['status', 'attempts', 'next_attempt_at', 'last_error', 'last_status_code', 'updated_at']
+    )
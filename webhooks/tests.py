@@ -1,3 +1,467 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from acme_project.testing import ServicesTestMixin
+
+from . import batching, circuit, delivery, ingest, ratelimit
+from .delivery import DeliveryResult
+from .forms import WebhookEndpointForm, WebhookForm
+from .models import Webhook, WebhookDelivery, WebhookEndpoint, WebhookRequest
+from .subscriptions import enqueue_webhook_notification
+from .tasks import (
+    flush_webhook_batch, flush_webhook_requests, prune_webhook_requests, retry_delay, retry_webhook_deliveries
+)
+
+
+class WebhookFormTests(SimpleTestCase):
+    def form(self, **overrides):
+        data = {
+            'url': 'https://example.com/hook',
+            'events': ['product.created'],
+            'is_active': True,
+            'batch_max_size': 100,
+            'batch_window_seconds': 5,
+            'max_rps': '',
+            **overrides,
+        }
+        return WebhookForm(data=data)
+
+    def test_valid(self):
+        form = self.form()
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIsNone(form.cleaned_data['max_rps'])
+        self.assertEqual(form.cleaned_data['batch_window_seconds'], 5)
+
+    def test_batch_window_out_of_range(self):
+        form = self.form(batch_window_seconds=301)
+        self.assertFalse(form.is_valid())
+        self.assertIn('batch_window_seconds', form.errors)
+
+    def test_max_rps(self):
+        self.assertTrue(self.form(max_rps=10).is_valid())
+        form = self.form(max_rps=0)
+        self.assertFalse(form.is_valid())
+        self.assertIn('max_rps', form.errors)
+
+
+class WebhookEndpointFormTests(SimpleTestCase):
+    def test_empty_uses_defaults(self):
+        form = WebhookEndpointForm(data={'max_requests': '', 'max_age_days': ''})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIsNone(form.cleaned_data['max_requests'])
+        self.assertIsNone(form.cleaned_data['max_age_days'])
+
+    def test_limits(self):
+        form = WebhookEndpointForm(data={'max_requests': 50, 'max_age_days': 2})
+        self.assertTrue(form.is_valid(), form.errors)
+        form = WebhookEndpointForm(data={'max_requests': 0, 'max_age_days': 0})
+        self.assertFalse(form.is_valid())
+        self.assertIn('max_requests', form.errors)
+        self.assertIn('max_age_days', form.errors)
+
+
+class WebhookBatchTests(ServicesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('batcher')
+        self.webhook = Webhook.objects.create(
+            user=self.user, url='https://example.com/hook', events=['product.created'],
+            batch_enabled=True, batch_max_size=2, batch_window_seconds=5
+        )
+        self.responses = []
+        post_many = mock.patch('webhooks.tasks.post_many', side_effect=self.post_many)
+        self.post = post_many.start()
+        self.addCleanup(post_many.stop)
+        # Flushes are queued, not run eagerly, so each test drives them by hand
+        for method in ('delay', 'apply_async'):
+            patcher = mock.patch.object(flush_webhook_batch, method)
+            setattr(self, method, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def post_many(self, outgoing):
+        status = self.responses.pop(0) if self.responses else 200
+        return [
+            DeliveryResult(url, status < 300, status, None if status < 300 else f'HTTP {status}', None)
+            for url, _, _ in outgoing
+        ]
+
+    def send(self, count):
+        for i in range(count):
+            enqueue_webhook_notification(self.user.id, 'product.created', {'sku': f's{i}'})
+
+    def sent(self):
+        return [
+            [event['payload']['sku'] for event in data['events']]
+            for (outgoing,), _ in self.post.call_args_list for _, data, _ in outgoing
+        ]
+
+    def test_full_batches(self):
+        self.send(5)
+        # Queued as soon as a full batch is buffered, and once a window out for the first event
+        self.delay.assert_called_once_with(self.webhook.id)
+        self.apply_async.assert_called_once_with((self.webhook.id,), countdown=5)
+
+        self.apply_async.reset_mock()
+        flush_webhook_batch(self.webhook.id)
+        self.assertEqual(self.sent(), [['s0', 's1'], ['s2', 's3']])
+        self.assertEqual(batching.buffered(self.webhook.id), 1)
+        # The partial batch waits for its window
+        self.apply_async.assert_called_once_with((self.webhook.id,), countdown=5)
+        self.assertEqual(
+            list(WebhookDelivery.objects.filter(webhook=self.webhook).values_list('status', flat=True)),
+            ['succeeded', 'succeeded']
+        )
+
+    def test_held_back_while_earlier_batch_retries(self):
+        self.responses = [503]
+        self.send(4)
+        flush_webhook_batch(self.webhook.id)
+        # The second batch is not sent ahead of the first one's retry
+        self.assertEqual(self.sent(), [['s0', 's1']])
+        self.assertEqual(batching.buffered(self.webhook.id), 2)
+        delivery = WebhookDelivery.objects.get(webhook=self.webhook)
+        self.assertEqual(delivery.status, 'retrying')
+        (args,), kwargs = self.apply_async.call_args
+        self.assertEqual(args, (self.webhook.id,))
+        expected = (delivery.next_attempt_at - timezone.now()).total_seconds() + 5
+        self.assertAlmostEqual(kwargs['countdown'], expected, delta=1)
+
+        # Still held back on the next flush, until the retry has succeeded
+        flush_webhook_batch(self.webhook.id)
+        self.assertEqual(len(self.sent()), 1)
+        delivery.status = 'succeeded'
+        delivery.save()
+        flush_webhook_batch(self.webhook.id)
+        self.assertEqual(self.sent(), [['s0', 's1'], ['s2', 's3']])
+
+    def test_waiting_delivery_of_other_webhook(self):
+        other = Webhook.objects.create(user=self.user, url='https://example.com/other', events=['export.completed'])
+        WebhookDelivery.objects.create(
+            webhook=other, event_type='batch', data={}, status='retrying',
+            next_attempt_at=timezone.now() + timedelta(minutes=1)
+        )
+        self.send(2)
+        flush_webhook_batch(self.webhook.id)
+        self.assertEqual(self.sent(), [['s0', 's1']])
+
+    def test_inactive_webhook(self):
+        self.send(3)
+        Webhook.objects.filter(pk=self.webhook.pk).update(is_active=False)
+        flush_webhook_batch(self.webhook.id)
+        self.post.assert_not_called()
+        self.assertEqual(batching.buffered(self.webhook.id), 0)
+        self.assertFalse(self.redis.exists(batching._scheduled_key(self.webhook.id)))
+        self.assertFalse(WebhookDelivery.objects.exists())
+
+
+@override_settings(WEBHOOK_RECEIVER_WRITE_BEHIND=True, WEBHOOK_REQUEST_FLUSH_SIZE=2)
+class WebhookRequestIngestTests(ServicesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('tester')
+        self.kept = WebhookEndpoint.objects.create(user=user)
+        self.deleted = WebhookEndpoint.objects.create(user=user)
+        for method in ('delay', 'apply_async'):
+            patcher = mock.patch.object(flush_webhook_requests, method)
+            setattr(self, method, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def receive(self, endpoint, body):
+        response = self.client.post(
+            reverse('webhook_receiver', args=[endpoint.token]) + '?x=1', body, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_flush(self):
+        self.receive(self.kept, '{"n": 1}')
+        self.receive(self.deleted, '{"n": 2}')
+        self.receive(self.kept, '{"n": 3}')
+        # Buffered, not saved; one timed flush was scheduled, and one more for a full batch
+        self.assertFalse(WebhookRequest.objects.exists())
+        self.apply_async.assert_called_once()
+        self.delay.assert_called_once()
+        self.assertEqual(self.redis.llen(ingest.BUFFER_KEY), 3)
+
+        self.deleted.delete()
+        flush_webhook_requests()
+
+        requests = list(WebhookRequest.objects.order_by('created_at'))
+        self.assertEqual([request.endpoint_id for request in requests], [self.kept.id, self.kept.id])
+        self.assertEqual([request.get_body() for request in requests], ['{"n": 1}', '{"n": 3}'])
+        self.assertEqual(requests[0].query_params, {'x': '1'})
+        self.assertEqual(requests[0].method, 'POST')
+        self.assertEqual(self.redis.llen(ingest.BUFFER_KEY), 0)
+        self.assertFalse(self.redis.exists(ingest.SCHEDULED_KEY))
+
+    def test_unknown_token(self):
+        url = reverse('webhook_receiver', args=['00000000-0000-0000-0000-000000000000'])
+        response = self.client.post(url, '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.redis.llen(ingest.BUFFER_KEY), 0)
+
+
+@override_settings(WEBHOOK_REQUEST_MAX_ROWS=4, WEBHOOK_REQUEST_MAX_AGE_DAYS=7, WEBHOOK_REQUEST_PRUNE_BATCH_SIZE=2)
+class WebhookRequestPruneTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('pruner')
+
+    def endpoint(self, ages_in_days, **retention):
+        endpoint = WebhookEndpoint.objects.create(user=self.user, **retention)
+        now = timezone.now()
+        WebhookRequest.objects.bulk_create([
+            WebhookRequest(endpoint=endpoint, headers={}, method='POST', created_at=now - timedelta(days=age))
+            for age in ages_in_days
+        ])
+        return endpoint
+
+    def ages(self, endpoint):
+        now = timezone.now()
+        return sorted(
+            round((now - created_at) / timedelta(days=1))
+            for created_at in endpoint.requests.values_list('created_at', flat=True)
+        )
+
+    def test_prune(self):
+        defaults = self.endpoint([0, 1, 2, 3, 4, 5, 8])
+        max_requests = self.endpoint([0, 1, 2, 3, 4], max_requests=3)
+        max_age = self.endpoint([1, 3, 5], max_age_days=2)
+        untouched = self.endpoint([0, 1], max_requests=3, max_age_days=2)
+
+        prune_webhook_requests()
+
+        self.assertEqual(self.ages(defaults), [0, 1, 2, 3])
+        self.assertEqual(self.ages(max_requests), [0, 1, 2])
+        self.assertEqual(self.ages(max_age), [1])
+        self.assertEqual(self.ages(untouched), [0, 1])
+
+
+@override_settings(WEBHOOK_CIRCUIT_FAILURE_THRESHOLD=3, WEBHOOK_CIRCUIT_COOLDOWN_SECONDS=30)
+class CircuitTests(ServicesTestMixin, SimpleTestCase):
+    host = 'example.com'
+
+    def cool_down(self):
+        # As if WEBHOOK_CIRCUIT_COOLDOWN_SECONDS had passed
+        self.redis.delete(circuit._keys(self.host)[0])
+
+    def test_opens_at_threshold(self):
+        for _ in range(2):
+            circuit.record_failure(self.host)
+        self.assertTrue(circuit.allow(self.host))
+        circuit.record_failure(self.host)
+        self.assertFalse(circuit.allow(self.host))
+        self.assertTrue(circuit.allow('other.example.com'))
+        self.assertTrue(0 < circuit.retry_after(self.host) <= 30)
+
+    def test_success_resets_failures(self):
+        for _ in range(2):
+            circuit.record_failure(self.host)
+        circuit.record_success(self.host)
+        for _ in range(2):
+            circuit.record_failure(self.host)
+        self.assertTrue(circuit.allow(self.host))
+
+    def test_half_open_probe(self):
+        for _ in range(3):
+            circuit.record_failure(self.host)
+        self.cool_down()
+        # Only one delivery gets the probe slot
+        self.assertTrue(circuit.allow(self.host))
+        self.assertFalse(circuit.allow(self.host))
+
+        # A failed probe opens the circuit again straight away
+        circuit.record_failure(self.host)
+        self.assertFalse(circuit.allow(self.host))
+        self.cool_down()
+        self.assertTrue(circuit.allow(self.host))
+
+        circuit.record_success(self.host)
+        self.assertTrue(circuit.allow(self.host))
+        self.assertTrue(circuit.allow(self.host))
+        self.assertEqual(circuit.retry_after(self.host), 30)
+
+
+class RateLimitTests(ServicesTestMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        patcher = mock.patch('webhooks.ratelimit.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_spacing(self):
+        # A full bucket lets max_rps requests through at once
+        for _ in range(4):
+            self.assertEqual(ratelimit.reserve(1, 4, 1), (True, 0))
+        # Then one every 1/max_rps seconds
+        self.assertEqual(ratelimit.reserve(1, 4, 1), (True, 0.25))
+        self.assertEqual(ratelimit.reserve(1, 4, 1), (True, 0.5))
+        # Other webhooks have their own bucket
+        self.assertEqual(ratelimit.reserve(2, 4, 1), (True, 0))
+
+    def test_refused_beyond_max_wait(self):
+        for _ in range(3):
+            ratelimit.reserve(1, 2, 0.5)
+        self.assertEqual(ratelimit.reserve(1, 2, 0.5), (False, 1.0))
+        # Nothing was reserved by the refusal
+        self.now += 0.5
+        self.assertEqual(ratelimit.reserve(1, 2, 0.5), (True, 0.5))
+
+    def test_refills(self):
+        for _ in range(5):
+            ratelimit.reserve(1, 2, 10)
+        self.now += 10
+        self.assertEqual(ratelimit.reserve(1, 2, 10), (True, 0))
+        self.assertEqual(ratelimit.reserve(1, 2, 10), (True, 0))
+        self.assertEqual(ratelimit.reserve(1, 2, 10), (True, 0.5))
+
+
+class PostTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('webhooks.delivery.get_session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def response(self, status_code, text=''):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = text.encode()
+        return response
+
+    def test_success(self):
+        self.session.post.return_value = self.response(204)
+        result = delivery.post('https://example.com/hook', {'event': 'x'})
+        self.assertEqual(result, DeliveryResult('https://example.com/hook', True, 204, None, None))
+        self.session.post.assert_called_once_with(
+            'https://example.com/hook', json={'event': 'x'}, timeout=settings.WEBHOOK_TIMEOUT
+        )
+
+    def test_http_error(self):
+        self.session.post.return_value = self.response(503, 'busy')
+        result = delivery.post('https://example.com/hook', {})
+        self.assertFalse(result.ok)
+        self.assertEqual((result.status_code, result.response_text), (503, 'busy'))
+        self.assertIn('503', result.error)
+
+    def test_connection_error(self):
+        self.session.post.side_effect = requests.ConnectionError('refused')
+        result = delivery.post('https://example.com/hook', {})
+        self.assertEqual(result, DeliveryResult('https://example.com/hook', False, None, 'refused', None))
+
+    def test_post_many_keeps_order(self):
+        self.session.post.side_effect = lambda url, **kwargs: self.response(200 if url.endswith('ok') else 500)
+        results = delivery.post_many([('https://a.example.com/ok', {}), ('https://b.example.com/fail', {}, 0)])
+        self.assertEqual([(result.url, result.ok) for result in results], [
+            ('https://a.example.com/ok', True), ('https://b.example.com/fail', False)
+        ])
+
+
+@override_settings(WEBHOOK_RETRY_BASE_SECONDS=30, WEBHOOK_RETRY_MAX_SECONDS=3600)
+class RetryDelayTests(SimpleTestCase):
+    def test_full_jitter(self):
+        for attempts, cap in [(1, 30), (2, 60), (5, 480), (8, 3600), (20, 3600)]:
+            with mock.patch('webhooks.tasks.random.uniform', side_effect=lambda low, high: high):
+                self.assertEqual(retry_delay(attempts), cap)
+            for _ in range(20):
+                self.assertTrue(0 <= retry_delay(attempts) <= cap)
+
+
+@override_settings(WEBHOOK_MAX_ATTEMPTS=3, WEBHOOK_CIRCUIT_FAILURE_THRESHOLD=100)
+class WebhookRetryTests(ServicesTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('retrier')
+        self.webhook = Webhook.objects.create(user=self.user, url='https://example.com/hook', events=['product.created'])
+        self.statuses = []
+        patcher = mock.patch('webhooks.tasks.post_many', side_effect=self.post_many)
+        self.post = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_many(self, outgoing):
+        return [
+            DeliveryResult(url, status < 300, status, None if status < 300 else f'HTTP {status}', None)
+            for (url, _, _), status in zip(outgoing, self.statuses)
+        ]
+
+    def delivery(self, **fields):
+        return WebhookDelivery.objects.create(
+            webhook=self.webhook, event_type='product.created', data={}, next_attempt_at=timezone.now(), **fields
+        )
+
+    def retry(self, *statuses):
+        self.statuses = list(statuses)
+        WebhookDelivery.objects.filter(status__in=['pending', 'retrying']).update(
+            next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+        retry_webhook_deliveries()
+
+    def test_backoff_until_dead(self):
+        delivery = self.delivery()
+        for attempt in (1, 2):
+            before = timezone.now()
+            self.retry(500)
+            delivery.refresh_from_db()
+            self.assertEqual((delivery.status, delivery.attempts), ('retrying', attempt))
+            self.assertEqual((delivery.last_status_code, delivery.last_error), (500, 'HTTP 500'))
+            cap = timedelta(seconds=settings.WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+            self.assertTrue(before <= delivery.next_attempt_at <= timezone.now() + cap)
+
+        self.retry(500)
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts, delivery.next_attempt_at), ('dead', 3, None))
+        # Dead-lettered deliveries are not retried
+        self.retry(200)
+        self.assertEqual(self.post.call_count, 3)
+
+    def test_success_after_failure(self):
+        delivery = self.delivery()
+        self.retry(503)
+        self.retry(200)
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.attempts, delivery.last_error), ('succeeded', 2, ''))
+        self.assertIsNone(delivery.next_attempt_at)
+
+    def test_open_circuit_defers(self):
+        delivery = self.delivery(attempts=2)
+        with mock.patch('webhooks.tasks.circuit.allow', return_value=False), \
+                mock.patch('webhooks.tasks.circuit.retry_after', return_value=30):
+            self.retry()
+        self.post.assert_called_once_with([])
+        delivery.refresh_from_db()
+        # Not counted as an attempt, so it isn't dead-lettered
+        self.assertEqual((delivery.status, delivery.attempts), ('retrying', 2))
+        self.assertEqual(delivery.last_error, 'Circuit open for example.com')
+        wait = (delivery.next_attempt_at - timezone.now()).total_seconds()
+        self.assertTrue(28 <= wait <= 30 + 30 / 4 + 1)
+
+    def test_server_errors_open_circuit(self):
+        with self.settings(WEBHOOK_CIRCUIT_FAILURE_THRESHOLD=2):
+            self.delivery(), self.delivery()
+            self.retry(500, 404)
+            self.assertTrue(circuit.allow('example.com'))
+            self.retry(500, 500)
+            self.assertFalse(circuit.allow('example.com'))
+
+    def test_rate_limit_defers(self):
+        self.webhook.max_rps = 2
+        self.webhook.save()
+        deliveries = [self.delivery() for _ in range(5)]
+        with self.settings(WEBHOOK_RATE_LIMIT_MAX_WAIT=0.5):
+            self.retry(200, 200, 200, 200)
+        ((outgoing,), _) = self.post.call_args
+        # Two at once, one half a second later, the rest deferred
+        self.assertEqual([delay for _, _, delay in outgoing][:2], [0, 0])
+        self.assertEqual(len(outgoing), 3)
+        self.assertAlmostEqual(outgoing[2][2], 0.5, delta=0.1)
+        statuses = sorted(WebhookDelivery.objects.filter(pk__in=[d.pk for d in deliveries]).values_list('status', flat=True))
+        self.assertEqual(statuses, ['retrying', 'retrying', 'succeeded', 'succeeded', 'succeeded'])
+        self.assertEqual(
+            set(WebhookDelivery.objects.filter(status='retrying').values_list('last_error', flat=True)),
+            {'Rate limited to 2 requests/s'}
+        )
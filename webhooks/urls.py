@@ -1,8 +1,8 @@
 from django.urls import path
 from .views import (
     WebhookListView, WebhookCreateView, WebhookUpdateView, WebhookDeleteView,
-    WebhookEndpointCreateView, WebhookEndpointDetailView, WebhookReceiverView,
-    WebhookStreamView
+    WebhookEndpointCreateView, WebhookEndpointDetailView, WebhookEndpointUpdateView, WebhookReceiverView,
+    WebhookStreamView, WebhookDeliveryListView, WebhookDeliveryReplayView
 )
 
 urlpatterns = [
@@ -10,8 +10,11 @@ urlpatterns = [
     path('create/', WebhookCreateView.as_view(), name='webhook_create'),
     path('update/<int:pk>/', WebhookUpdateView.as_view(), name='webhook_update'),
     path('delete/<int:pk>/', WebhookDeleteView.as_view(), name='webhook_delete'),
+    path('deliveries/', WebhookDeliveryListView.as_view(), name='webhook_delivery_list'),
+    path('deliveries/replay/', WebhookDeliveryReplayView.as_view(), name='webhook_delivery_replay'),
     path('tester/create/', WebhookEndpointCreateView.as_view(), name='webhook_endpoint_create'),
     path('tester/<uuid:token>/', WebhookEndpointDetailView.as_view(), name='webhook_endpoint_detail'),
+    path('tester/<uuid:token>/retention/', WebhookEndpointUpdateView.as_view(), name='webhook_endpoint_update'),
     path('tester/<uuid:token>/stream/', WebhookStreamView.as_view(), name='webhook_stream'),
     path('inbound/<uuid:token>/', WebhookReceiverView.as_view(), name='webhook_receiver'),
 ]
@@ -1,18 +1,24 @@
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse_lazy, reverse
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView, View
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from .models import Webhook, WebhookEndpoint, WebhookRequest
-from .forms import WebhookForm
-import json
+from .models import Webhook, WebhookDelivery, WebhookEndpoint, WebhookRequest
+from .tasks import flush_webhook_requests, retry_webhook_deliveries
+from .subscriptions import invalidate_subscriptions
+from . import ingest
+from django.utils import timezone
+from .forms import WebhookForm, WebhookEndpointForm
 from django.http import StreamingHttpResponse
-import redis
+from redis.exceptions import RedisError
+from acme_project.redis_pool import get_redis
 from django.conf import settings
 import logging
 
+logger = logging.getLogger(__name__)
+
 class WebhookListView(LoginRequiredMixin, ListView):
     model = Webhook
     template_name = 'webhooks/list.html'
@@ -29,7 +35,9 @@ class WebhookCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.user = self.request.user
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        invalidate_subscriptions(self.request.user.id)
+        return response
 
 class WebhookUpdateView(LoginRequiredMixin, UpdateView):
     model = Webhook
@@ -40,6 +48,11 @@ class WebhookUpdateView(LoginRequiredMixin, UpdateView):
     def get_queryset(self):
         return Webhook.objects.filter(user=self.request.user)
 
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        invalidate_subscriptions(self.request.user.id)
+        return response
+
 class WebhookDeleteView(LoginRequiredMixin, DeleteView):
     model = Webhook
     success_url = reverse_lazy('webhook_list')
@@ -47,6 +60,46 @@ class WebhookDeleteView(LoginRequiredMixin, DeleteView):
     def get_queryset(self):
         return Webhook.objects.filter(user=self.request.user)
 
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        invalidate_subscriptions(self.request.user.id)
+        return response
+
+class WebhookDeliveryListView(LoginRequiredMixin, ListView):
+    model = WebhookDelivery
+    template_name = 'webhooks/delivery_list.html'
+    context_object_name = 'deliveries'
+    paginate_by = 25
+
+    def get_status(self):
+        status = self.request.GET.get('status', 'dead')
+        return status if status in dict(WebhookDelivery.STATUS_CHOICES) else 'dead'
+
+    def get_queryset(self):
+        return WebhookDelivery.objects.filter(
+            webhook__user=self.request.user, status=self.get_status()
+        ).select_related('webhook')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['status'] = self.get_status()
+        context['status_choices'] = WebhookDelivery.STATUS_CHOICES
+        return context
+
+class WebhookDeliveryReplayView(LoginRequiredMixin, View):
+    def post(self, request):
+        deliveries = WebhookDelivery.objects.filter(webhook__user=request.user, status='dead')
+        if not request.POST.get('all'):
+            deliveries = deliveries.filter(pk__in=request.POST.getlist('delivery_ids'))
+
+        # Requeue as a fresh series of attempts; the retry task picks them up
+        replayed = deliveries.update(
+            status='retrying', attempts=0, next_attempt_at=timezone.now(), updated_at=timezone.now()
+        )
+        if replayed:
+            retry_webhook_deliveries.delay()
+        return redirect(f"{reverse('webhook_delivery_list')}?status=dead")
+
 from products.models import Product
 
 class WebhookEndpointCreateView(LoginRequiredMixin, View):
@@ -67,80 +120,83 @@ class WebhookEndpointDetailView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        context.setdefault('retention_form', WebhookEndpointForm(instance=self.object))
+        context['default_max_requests'] = settings.WEBHOOK_REQUEST_MAX_ROWS
+        context['default_max_age_days'] = settings.WEBHOOK_REQUEST_MAX_AGE_DAYS
         context['test_url'] = self.request.build_absolute_uri(reverse('webhook_receiver', args=[self.object.token]))
+        context['stream_url'] = settings.STREAM_ORIGIN + reverse('webhook_stream', args=[self.object.token])
         # Add latest 3 products for testing
         context['products'] = Product.objects.filter(user=self.request.user).order_by('-updated_at')[:3]
+        context['requests'] = self.object.requests.order_by('-created_at')[:settings.WEBHOOK_REQUEST_DISPLAY_LIMIT]
         return context
 
+class WebhookEndpointUpdateView(WebhookEndpointDetailView):
+    # Saves the retention limits; invalid input re-renders the tester page with errors
+    def get_queryset(self):
+        return WebhookEndpoint.objects.filter(user=self.request.user)
+
+    def post(self, request, token):
+        self.object = self.get_object()
+        form = WebhookEndpointForm(request.POST, instance=self.object)
+        if form.is_valid():
+            form.save()
+            return redirect('webhook_endpoint_detail', token=self.object.token)
+        return self.render_to_response(self.get_context_data(retention_form=form))
+
 @method_decorator(csrf_exempt, name='dispatch')
 class WebhookReceiverView(View):
     def post(self, request, token):
-        logger = logging.getLogger(__name__)
-        logger.info(f"Received webhook request for token: {token}")
-        
-        endpoint = get_object_or_404(WebhookEndpoint, token=token)
-        
-        headers = dict(request.headers)
+        endpoint_id = ingest.get_endpoint_id(token)
+        if endpoint_id is None:
+            raise Http404
+
         try:
             body = request.body.decode('utf-8')
-        except:
+        except UnicodeDecodeError:
             body = '[Binary Data]'
-            
-        webhook_request = WebhookRequest.objects.create(
-            endpoint=endpoint,
-            headers=headers,
-            body=body,
+
+        # Published as-is; the tester page renders it (see endpoint_detail.html)
+        record = {
+            'endpoint_id': endpoint_id,
+            'headers': dict(request.headers),
+            'body': body,
+            'method': request.method,
+            'query_params': request.GET.dict(),
+            'created_at': timezone.now().isoformat()
+        }
+
+        if settings.WEBHOOK_RECEIVER_WRITE_BEHIND:
+            try:
+                buffered, schedule = ingest.push(token, record, settings.WEBHOOK_REQUEST_FLUSH_SECONDS)
+            except RedisError as e:
+                logger.error(f"Failed to buffer webhook request, saving directly: {e}")
+            else:
+                if buffered % settings.WEBHOOK_REQUEST_FLUSH_SIZE == 0:
+                    flush_webhook_requests.delay()
+                elif schedule:
+                    flush_webhook_requests.apply_async(countdown=settings.WEBHOOK_REQUEST_FLUSH_SECONDS)
+                return HttpResponse('OK')
+
+        WebhookRequest.objects.create(
+            endpoint_id=endpoint_id,
+            headers=record['headers'],
+            body_compressed=WebhookRequest.compress_body(body),
             method=request.method,
-            query_params=request.GET.dict()
+            query_params=record['query_params']
         )
-        logger.info("Webhook request saved successfully.")
-
-        # Publish to Redis
         try:
-            r = redis.from_url(settings.REDIS_URL)
-            # Create HTML fragment matching the Accordion structure
-            headers_pretty = json.dumps(webhook_request.headers, indent=2)
-            query_pretty = json.dumps(webhook_request.query_params, indent=2)
-            
-            html = f"""
-            <div class="accordion-item">
-                <h2 class="accordion-header" id="heading{webhook_request.id}">
-                    <button class="accordion-button collapsed" type="button" data-bs-toggle="collapse"
-                        data-bs-target="#collapse{webhook_request.id}">
-                        <span class="badge bg-primary me-2">{webhook_request.method}</span>
-                        {webhook_request.created_at.strftime('%Y-%m-%d %H:%M:%S')}
-                    </button>
-                </h2>
-                <div id="collapse{webhook_request.id}" class="accordion-collapse collapse" data-bs-parent="#requestsAccordion">
-                    <div class="accordion-body">
-                        <h5>Headers</h5>
-                        <pre class="bg-light p-2 rounded"><code>{headers_pretty}</code></pre>
-
-                        <h5>Query Params</h5>
-                        <pre class="bg-light p-2 rounded"><code>{query_pretty}</code></pre>
-
-                        <h5>Body</h5>
-                        <pre class="bg-light p-2 rounded"><code>{webhook_request.body}</code></pre>
-                    </div>
-                </div>
-            </div>
-            """
-            
-            # SSE requires data to be single line or each line prefixed with data:
-            # We'll just remove newlines for simplicity
-            html = html.replace('\n', '').strip()
-            
-            r.publish(f'webhook_stream_{token}', html)
-        except Exception as e:
+            ingest.publish(token, record)
+        except RedisError as e:
             logger.error(f"Failed to publish to Redis: {e}")
 
         return HttpResponse('OK')
 
 class WebhookStreamView(LoginRequiredMixin, View):
+    # Only used when STREAM_ORIGIN is empty (e.g. runserver); in
+    # production the stream process serves this URL from webhooks.streaming.
     def get(self, request, token):
         def event_stream():
-            r = redis.from_url(settings.REDIS_URL)
-            pubsub = r.pubsub()
+            pubsub = get_redis().pubsub()
             pubsub.subscribe(f'webhook_stream_{token}')
             
             for message in pubsub.listen():